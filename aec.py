@@ -0,0 +1,288 @@
+from collections import deque
+from devices.audio_format import ResampleStream
+import numpy as np
+import time
+
+class EchoReference(object):
+    """
+    The audio the player sent to the speaker, resampled to the mic rate and laid out on the time.monotonic()
+    clock, so the echo canceller can look up what was playing while a mic frame was captured.
+
+    on_output() is an AsyncPlayer listener: it runs on the audio callback and only queues the period.
+    The queued periods are resampled on the reader's thread, in read().
+
+    The timeline follows the sample count from the first period on, so the timestamps' jitter never
+    stutters the reference. A period that starts more than max_jitter seconds off the timeline moves it:
+    a gap is filled with silence, and a period early by that much shifts the timeline back.
+
+    Args:
+        source_rate (int): The player's sample rate in Hz.
+        rate (int): The mic's sample rate in Hz (default: 16000).
+        seconds (float): How much reference is kept (default: 2).
+        max_jitter (float): The deviation from the timeline, in seconds, that moves it (default: 0.05).
+    """
+
+    def __init__(self, source_rate, rate=16000, seconds=2.0, max_jitter=0.05):
+        self.source_rate = source_rate
+        self.rate = rate
+        self.max_jitter = max_jitter
+        self._capacity = int(rate * seconds)
+        # Bounded, as nothing drains it while the mic is not being read.
+        self._pending = deque(maxlen=1024)
+        self._stream = ResampleStream(source_rate, rate)
+        self._samples = np.zeros(0, dtype=np.float32)
+        # The times of _samples[0] and of the next queued period.
+        self._start = None
+        self._expected = None
+        self.jumps = 0
+
+    def on_output(self, data, play_time):
+        self._pending.append((data, play_time))
+
+    def _drain(self):
+        chunks = [self._samples]
+        while self._pending:
+            data, play_time = self._pending.popleft()
+            samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
+            if self._start is None:
+                self._start = self._expected = play_time
+            offset = play_time - self._expected
+            if offset > self.max_jitter:
+                gap = min(int(offset * self.rate), self._capacity)
+                chunks.append(np.zeros(gap, dtype=np.float32))
+                self._expected += gap / self.rate
+                self.jumps += 1
+            elif offset < -self.max_jitter:
+                self._start += offset
+                self._expected += offset
+                self.jumps += 1
+            chunks.append(self._stream.process(samples))
+            self._expected += len(samples) / self.source_rate
+
+        if len(chunks) > 1:
+            self._samples = np.concatenate(chunks)
+        excess = len(self._samples) - self._capacity
+        if excess > 0:
+            self._samples = self._samples[excess:]
+            self._start += excess / self.rate
+
+    def read(self, start_time, n) -> np.ndarray:
+        """
+        Returns the n reference samples from start_time on, as float32 in [-1, 1]. Silence where
+        nothing was played, or the reference has not arrived yet.
+        """
+        self._drain()
+        out = np.zeros(n, dtype=np.float32)
+        if self._start is None:
+            return out
+        i = int(round((start_time - self._start) * self.rate))
+        lo, hi = max(i, 0), min(i + n, len(self._samples))
+        if hi > lo:
+            out[lo - i:hi - i] = self._samples[lo:hi]
+        return out
+
+class EchoCanceller(object):
+    """
+    Removes the speaker's echo from the mic with a partitioned-block frequency-domain NLMS filter.
+
+    The echo path is modeled as tail_ms of impulse response, cut into partitions of one block. Each
+    block, the reference spectrum (an overlap-save FFT of two blocks) is pushed onto a history of one
+    spectrum per partition, the echo estimate is the sum of their products with the partitions' filters,
+    and every partition is adapted on the error with a step normalized per frequency bin by the
+    reference power over the tail. So the filter converges as fast in quiet bands as in loud ones, and
+    costs a few FFTs of 2 * block samples per block, whatever the tail length.
+
+    The mic is matched with the reference of lookahead_ms later, so the echo stays causal for the filter
+    even if PortAudio reports its latencies a little late. The filter then covers echoes of up to
+    tail_ms - lookahead_ms.
+
+    Adaptation pauses for hangover_ms whenever, once the filter has converged, the residual is far above
+    the estimated echo: that is the user talking over the reply, which the filter must not learn to cancel.
+    If that lasts longer than max_double_talk_ms, the echo path has more likely changed, e.g. the speaker was
+    moved, and the filter reconverges.
+    Without reference for a whole tail (nothing playing), blocks pass through unchanged at almost no cost.
+
+    Args:
+        reference (EchoReference): The played audio, for process(). None if only process_block() is used.
+        rate (int): The sample rate in Hz (default: 16000).
+        block (int): The block length in samples (default: 128).
+        tail_ms (int): The length of the modeled echo path (default: 160).
+        lookahead_ms (int): How far ahead of the mic the reference is read (default: 16).
+        step (float): The NLMS step size, 0 to 1 (default: 0.5).
+        double_talk_ratio (float): The residual to echo energy ratio above which adaptation pauses (default: 4).
+        hangover_ms (int): How long adaptation stays paused after double talk (default: 100).
+        max_double_talk_ms (int): The longest double talk before the filter reconverges (default: 3000).
+        max_jitter (float): The deviation of a capture timestamp from the mic timeline that resets it, in seconds (default: 0.05).
+    """
+
+    def __init__(self, reference: EchoReference = None, rate=16000, block=128, tail_ms=160, lookahead_ms=16, step=0.5,
+                 double_talk_ratio=4.0, hangover_ms=100, max_double_talk_ms=3000, max_jitter=0.05):
+        self.reference = reference
+        self.rate = rate
+        self.block = block
+        self.partitions = max(1, -(-rate * tail_ms // 1000 // block))
+        self.lookahead = lookahead_ms / 1000
+        self.step = step
+        self.double_talk_ratio = double_talk_ratio
+        self.max_jitter = max_jitter
+        self._hangover_blocks = max(1, rate * hangover_ms // 1000 // block)
+        self._max_double_talk_blocks = rate * max_double_talk_ms // 1000 // block
+        # The tail power of a reference at -60 dBFS, so near-silent bins between words are not amplified.
+        self._power_floor = self.partitions * 2 * block * 1e-6
+        # The energy of a block at -60 dBFS, below which the mic never counts as talking.
+        self._silence = block * 1e-6
+        bins = block + 1
+        self._x = np.zeros(2 * block, dtype=np.float32)
+        self._e = np.zeros(2 * block, dtype=np.float32)
+        self._X = np.zeros((self.partitions, bins), dtype=np.complex64)
+        self._X_power = np.zeros((self.partitions, bins), dtype=np.float32)
+        self._W = np.zeros((self.partitions, bins), dtype=np.complex64)
+        self._power = np.zeros(bins, dtype=np.float32)
+        # Blocks since the reference was last non-silent, and left of the double talk hangover.
+        self._quiet = self.partitions + 1
+        self._hold = 0
+        self._double_talk_run = 0
+        self._talk_error = self._talk_echo = 0.0
+        self._mic_time = None
+        self._mic_power = 0.0
+        self._error_power = 0.0
+        self.blocks = 0
+        self.active_blocks = 0
+        self.double_talk_blocks = 0
+        self.diverged_blocks = 0
+
+    @property
+    def erle_db(self):
+        """
+        The echo return loss enhancement: how much quieter the output is than the mic while only the
+        reference plays, in dB, smoothed over the last second or so.
+        """
+        if self._error_power <= 0:
+            return 0.0
+        return 10 * np.log10(self._mic_power / self._error_power)
+
+    def reset(self):
+        self._X[:] = 0
+        self._X_power[:] = 0
+        self._power[:] = 0
+        self._W[:] = 0
+        self._x[:] = 0
+        self._quiet = self.partitions + 1
+        self._hold = 0
+        self._double_talk_run = 0
+        self._talk_error = self._talk_echo = 0.0
+        self._mic_power = self._error_power = 0.0
+
+    def process_block(self, mic: np.ndarray, ref: np.ndarray) -> np.ndarray:
+        """
+        Cancels the echo of one block.
+
+        Args:
+            mic (np.ndarray): block float32 mic samples in [-1, 1].
+            ref (np.ndarray): The block float32 reference samples of the same time (plus the lookahead).
+
+        Returns:
+            np.ndarray: The mic samples without the echo.
+        """
+        b = self.block
+        self.blocks += 1
+        if np.any(ref):
+            self._quiet = 0
+        else:
+            self._quiet += 1
+            if self._quiet > self.partitions:
+                # The whole tail of reference is silence, so is the echo estimate.
+                if self._quiet == self.partitions + 1:
+                    self._x[:] = 0
+                    self._X[:] = 0
+                    self._X_power[:] = 0
+                return mic
+
+        self.active_blocks += 1
+        self._x[:b] = self._x[b:]
+        self._x[b:] = ref
+        self._X[1:] = self._X[:-1]
+        self._X_power[1:] = self._X_power[:-1]
+        self._X[0] = np.fft.rfft(self._x)
+        self._X_power[0] = self._X[0].real ** 2 + self._X[0].imag ** 2
+
+        echo = np.fft.irfft(np.einsum("pk,pk->k", self._W, self._X))[b:]
+        error = (mic - echo).astype(np.float32)
+
+        mic_energy = float(np.dot(mic, mic))
+        error_energy = float(np.dot(error, error))
+        echo_energy = float(np.dot(echo, echo))
+        out = error
+        if error_energy > mic_energy:
+            # The estimate adds echo instead of removing it, e.g. while converging or right after the echo
+            # path changed, so the mic is passed through.
+            out = mic
+            self.diverged_blocks += 1
+        # Energies over the last few blocks, as single blocks are too noisy at onsets and in reverb tails.
+        self._talk_error += 0.3 * (error_energy - self._talk_error)
+        self._talk_echo += 0.3 * (echo_energy - self._talk_echo)
+        if self.erle_db > 6 and mic_energy > self._silence and self._talk_error > self.double_talk_ratio * self._talk_echo:
+            self._hold = self._hangover_blocks
+        if self._hold > 0:
+            self._hold -= 1
+            self.double_talk_blocks += 1
+            self._double_talk_run += 1
+            if self._double_talk_run > self._max_double_talk_blocks:
+                self._mic_power = self._error_power = 0.0
+                self._hold = self._double_talk_run = 0
+            return out
+        self._double_talk_run = 0
+
+        self._mic_power += 0.02 * (mic_energy - self._mic_power)
+        self._error_power += 0.02 * (error_energy - self._error_power)
+
+        self._e[b:] = error
+        E = np.fft.rfft(self._e)
+        # The power per bin is smoothed over time, but never below its mean over the tail, so it neither
+        # lags behind onsets nor collapses in spectral dips. Bins far below the average power, e.g. between
+        # the harmonics of a voice, are regularized, or leakage alone would make them drift.
+        self._power += 0.1 * (self._X_power[0] - self._power)
+        power = self.partitions * np.maximum(self._power, self._X_power.mean(axis=0))
+        gain = self.step * E / (power + 0.1 * power.mean() + self._power_floor)
+        W = self._W + np.conj(self._X) * gain
+        # Overlap-save constraint: each partition's impulse response is one block long.
+        w = np.fft.irfft(W, axis=1)
+        w[:, b:] = 0
+        self._W = np.fft.rfft(w, axis=1).astype(np.complex64)
+        return out
+
+    def process(self, frame, capture_time=None) -> bytes:
+        """
+        Cancels the echo of a frame of 16 bit mono PCM, a whole number of blocks long.
+
+        Args:
+            frame (bytes-like): The mic frame.
+            capture_time (float): The time.monotonic() at which its first sample was captured, e.g. from
+                                  FrameRing.time_at(). None for the time of the previous frame's end.
+        """
+        mic = np.frombuffer(frame, dtype=np.int16).astype(np.float32) / 32768
+        n = len(mic)
+        if capture_time is None:
+            capture_time = self._mic_time if self._mic_time is not None else time.monotonic() - n / self.rate
+        # Like the reference, the mic timeline follows the sample count, apart from real jumps.
+        if self._mic_time is None or abs(capture_time - self._mic_time) > self.max_jitter:
+            self._mic_time = capture_time
+        ref = self.reference.read(self._mic_time + self.lookahead, n)
+        self._mic_time += n / self.rate
+
+        out = np.empty(n, dtype=np.float32)
+        for i in range(0, n, self.block):
+            out[i:i + self.block] = self.process_block(mic[i:i + self.block], ref[i:i + self.block])
+        return np.clip(out * 32768, -32768, 32767).astype(np.int16).tobytes()
+
+    def stats(self):
+        """
+        Returns:
+            dict: The blocks processed, those with reference and those in double talk, and the ERLE in dB.
+        """
+        return {
+            "blocks": self.blocks,
+            "active_blocks": self.active_blocks,
+            "double_talk_blocks": self.double_talk_blocks,
+            "erle_db": self.erle_db,
+        }
@@ -1,56 +1,387 @@
-from typing import Optional
 from devices.async_player import AsyncPlayer
+from devices.audio_format import convert
 from devices.mic_wrapper import Microphone
-from devices.speaker import Speaker
-from stt import STTAction
+from devices.speaker import Speaker, read_wave
+from stt import STT, STTAction
 from wake_word import WakeWordDetector
-from chat import Chat
+from chat import Chat, ChatStream, split_phrases
 from riva_wrap import RivaTTS
+from vad import VoiceActivityDetector, VADEndpointer
+from frame_ring import FrameRing, FrameReader
+from tracing import Tracer, TurnTrace
+from intents import IntentMatcher
+from speculation import Speculator
+from commands import COMMANDS, Command, CommandExecutor, parse_command, strip_commands
+from aec import EchoCanceller, EchoReference
+from functools import partial
+import queue
+import threading
+
+class Turn(object):
+    """
+    A single user request, from its transcript to the end of the spoken reply.
+    cancel() may be called from any thread, and aborts the chat stream once it is attached.
+    play() and cancel() exclude each other, so no audio of the turn is queued once cancel() returns.
+    """
+
+    def __init__(self, text: str, trace: TurnTrace, generation=0):
+        self.text = text
+        self.trace = trace
+        # The count of wake words before the transcript, see Assistant._cancel_turns().
+        self.generation = generation
+        self.reply: ChatStream = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def attach_reply(self, reply: ChatStream):
+        with self._lock:
+            self.reply = reply
+            if self.cancelled:
+                reply.cancel()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            if self.reply is not None and not self.reply.cancelled:
+                self.reply.cancel()
+        self.trace.finish("cancelled")
+
+    def play(self, player: AsyncPlayer, samples, **kwargs):
+        """
+        Queues audio of the turn on the player, unless the turn was cancelled.
+
+        Returns:
+            bool: Whether the audio was queued.
+        """
+        with self._lock:
+            if self.cancelled:
+                return False
+            player.play(samples, **kwargs)
+            return True
 
 class Assistant(object):
-    def __init__(self, chat: Chat, tts: RivaTTS, wake_word_detector: WakeWordDetector, mic_name: str = None, speaker_name: str = None):
-        self.mic = Microphone(mic_name)
-        self.speaker = Speaker(speaker_name)
+    """
+    A voice assistant for one mic and speaker: listens for the wake word, transcribes the request,
+    and speaks the reply, answering common commands locally when it can.
+
+    Capture, wake word, VAD, STT, the turn (chat and TTS) and playback each run on their own thread or
+    audio callback, so no audio thread waits on the network, and a wake word cancels everything downstream.
+    The details are on the collaborators: VADEndpointer, Speculator, IntentMatcher, CommandExecutor and EchoCanceller.
+
+    Args:
+        chat (Chat): The chat model.
+        tts (RivaTTS): The speech synthesizer.
+        wake_word_detector (WakeWordDetector): The wake word detector.
+        mic_name (str): The mic device, if mic is None (default: None).
+        speaker_name (str): The speaker device, if speaker is None (default: None).
+        mic (Microphone): The mic, e.g. an AudioFrontend or a fake (default: None).
+        speaker (Speaker): The speaker (default: None).
+        stt (STT): The STT client shared by all sessions (default: None).
+        chime_path (str): The WAV file played on the wake word (default: "ping.wav").
+        endpointing (bool): Whether a local VAD ends the STT stream (default: True).
+        trailing_silence_ms (int): The silence that ends a request, with endpointing (default: 700).
+        echo_cancellation (bool): Whether the assistant's voice is removed from the mic (default: True).
+        max_pending_turns (int): The transcripts queued for the turn thread (default: 2).
+        intents (IntentMatcher): Answers common commands without a chat request (default: None).
+        speculation_ms (int): How long an interim transcript must be stable to start a chat request, None to not speculate (default: 300).
+        commands (CommandExecutor): Runs the command tags of replies. Its metrics are exported with the room label,
+                                    so every room needs its own (default: None).
+        tracer (Tracer): Times each turn (default: a new one).
+        room (str): Labels the turns and metrics, for several rooms sharing a tracer (default: None).
+    """
+
+    MIC_RATE = 16000
+    VAD_FRAME_MS = 20
+    STT_REQUEST_MS = 100
+    AEC_FRAME_MS = 16
+
+    def __init__(self, chat: Chat, tts: RivaTTS, wake_word_detector: WakeWordDetector, mic_name: str = None, speaker_name: str = None, *,
+                 mic: Microphone = None, speaker: Speaker = None, stt: STT = None, chime_path="ping.wav",
+                 endpointing=True, trailing_silence_ms=700, echo_cancellation=True, max_pending_turns=2,
+                 intents: IntentMatcher = None, speculation_ms=300, commands: CommandExecutor = None,
+                 tracer: Tracer = None, room: str = None):
+        self.mic = mic if mic is not None else Microphone(mic_name)
+        self.speaker = speaker if speaker is not None else Speaker(speaker_name)
+        self.stt = stt if stt is not None else STT()
         self.wake = wake_word_detector
+        self.room = room
         self.current_stt: STTAction = None
+        self.current_turn: Turn = None
+        self.tracer = tracer if tracer is not None else Tracer()
+        self._trace: TurnTrace = None
+        self.intents = intents
+        self.commands = commands
+        # A moving average of the time from transcript to first audio of chat turns.
+        self._chat_response_time = None
+        self.speculator = None
+        if speculation_ms is not None:
+            accept = (lambda text: intents.peek(text) is None) if intents is not None else None
+            self.speculator = Speculator(chat, stable_ms=speculation_ms, accept=accept)
         self.chat = chat
         self.tts = tts
-        self.player = AsyncPlayer(self.speaker, sample_rate=self.tts.rate)
-        self.player.start()
+        # This detector sees every frame and tracks the noise floor. Each STT session gets a clone of it.
+        self.vad = VoiceActivityDetector(sample_rate=self.MIC_RATE, frame_ms=self.VAD_FRAME_MS) if endpointing else None
+        self._trailing_silence_ms = trailing_silence_ms
+        self._turns = queue.Queue(maxsize=max_pending_turns)
+        self._stopped = threading.Event()
+        self._turn_lock = threading.Lock()
+        self._generation = 0
+        self.player: AsyncPlayer = self.speaker.player()
+        self._chime = read_wave(chime_path, rate=self.player.sample_rate)
+        self.echo: EchoCanceller = None
+        if echo_cancellation:
+            reference = EchoReference(self.player.sample_rate, rate=self.MIC_RATE)
+            self.player.add_listener(reference.on_output)
+            self.echo = EchoCanceller(reference, rate=self.MIC_RATE)
+        labels = {"room": room} if room is not None else None
+        self.tracer.add_metric("glados_player_underruns_total", lambda: self.player.underruns, "counter", "Output underflows reported by PortAudio.", labels=labels)
+        self.tracer.add_metric("glados_player_starved_periods_total", lambda: self.player.starved_periods, "counter", "Periods a playing source ran dry.", labels=labels)
+        self.tracer.add_metric("glados_player_queue_seconds", lambda: sum(self.player.queue_depth().values()), "gauge", "Audio queued on the player.", labels=labels)
+        if intents is not None:
+            self.tracer.add_metric("glados_intent_lookups_total", lambda: intents.lookups, "counter", "Transcripts checked for a local intent.", labels=labels)
+            self.tracer.add_metric("glados_intent_hits_total", lambda: intents.hits, "counter", "Transcripts answered locally.", labels=labels)
+            self.tracer.add_metric("glados_intent_saved_seconds_total", lambda: intents.saved_seconds, "counter",
+                                   "Response latency saved by local answers, against the average chat turn.", labels=labels)
+        if self.speculator is not None:
+            speculator = self.speculator
+            self.tracer.add_metric("glados_speculation_launched_total", lambda: speculator.launched, "counter", "Chat requests started from interim transcripts.", labels=labels)
+            self.tracer.add_metric("glados_speculation_hits_total", lambda: speculator.hits, "counter", "Speculative requests whose reply was used.", labels=labels)
+            self.tracer.add_metric("glados_speculation_misses_total", lambda: speculator.misses, "counter", "Speculative requests that were cancelled.", labels=labels)
+            self.tracer.add_metric("glados_speculation_wasted_tokens_total", lambda: speculator.wasted_tokens, "counter",
+                                   "Estimated prompt and completion tokens of cancelled speculative requests.", labels=labels)
+        if self.echo is not None:
+            echo = self.echo
+            self.tracer.add_metric("glados_aec_erle_db", lambda: echo.erle_db, "gauge", "Echo removed from the mic while a reply plays.", labels=labels)
+            self.tracer.add_metric("glados_aec_active_seconds_total", lambda: echo.active_blocks * echo.block / echo.rate, "counter",
+                                   "Mic audio processed against a playing reply.", labels=labels)
+            self.tracer.add_metric("glados_aec_double_talk_seconds_total", lambda: echo.double_talk_blocks * echo.block / echo.rate, "counter",
+                                   "Mic audio in which the user talked over a reply.", labels=labels)
+        if commands is not None:
+            for name, _ in COMMANDS:
+                command_labels = {"command": name, **(labels or {})}
+                self.tracer.add_metric("glados_commands_total", partial(lambda name: commands.latency[name].count, name), "counter",
+                                       "Commands run.", labels=command_labels)
+                self.tracer.add_metric("glados_command_failures_total", partial(lambda name: commands.failures[name], name), "counter",
+                                       "Commands that failed.", labels=command_labels)
+                self.tracer.add_metric("glados_command_seconds_total", partial(lambda name: commands.latency[name].sum, name), "counter",
+                                       "Time from parsing commands to their completion.", labels=command_labels)
+        self._turn_thread = threading.Thread(target=self._turn_worker, daemon=True)
+        self._turn_thread.start()
 
     def __del__(self):
-        self.player.stop()
-    
-    def _update_stt(self, chunk) -> Optional[str]:
-        if self.current_stt is not None:
-            if self.current_stt.is_done():
-                result = self.current_stt.result
-                print(f"[STT] Result: {result}")
-                self.current_stt = None
-                return result
-            
-            self.current_stt.handle_chunk(chunk)
-        return None
-
-    def handle_stt(self, text: str):
-        resp = self.chat.chat(text)
-        print(f"[Chat] Response: {resp}")
-        sound = self.tts.synthesize_raw(resp)
-        self.player.play(sound)
-
-    def run(self):
-        with self.mic.record(chunk_size=512) as mic_stream:
-            for chunk in mic_stream:
-                stt_text = self._update_stt(chunk)
-                if stt_text is not None:
-                    self.handle_stt(stt_text)
-
-                if self.wake.detect(chunk):
-                    print("[Wake Word] Detected")
-                    if self.player.is_playing():
-                        print("[Chat] Ditching current TTS")
-                        self.player.clear()
-                    self.speaker.play_wave("ping.wav")
-                    if self.current_stt is not None:
-                        print("[Wake Word] Ditching current STT")
-                    self.current_stt = STTAction()
+        # A full queue means the turn thread is busy, and it sees _stopped before its next turn.
+        self._stopped.set()
+        try:
+            self._turns.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _on_stt_result(self, trace: TurnTrace, text):
+        print(f"[STT] Result: {text}")
+        speculation = self.speculator.take(text, trace) if self.speculator is not None else None
+        if text:
+            self.handle_stt(text, trace, reply=speculation)
+        else:
+            trace.finish("no_speech")
+
+    def handle_stt(self, text: str, trace: TurnTrace = None, reply: ChatStream = None):
+        """
+        Queues a transcript for the turn thread. If the queue is full, the oldest pending turn is dropped.
+        A reply that is already underway, e.g. a speculative one, is used instead of a new chat request.
+        """
+        turn = Turn(text, trace if trace is not None else self.tracer.start_turn(self.room), self._generation)
+        if reply is not None:
+            turn.trace.mark("speculation_hit")
+            turn.attach_reply(reply)
+        while True:
+            try:
+                self._turns.put_nowait(turn)
+                return
+            except queue.Full:
+                try:
+                    dropped = self._turns.get_nowait()
+                    print(f"[Chat] Dropping pending request: {dropped.text}")
+                    dropped.cancel()
+                except queue.Empty:
+                    pass
+
+    def _new_endpointer(self):
+        if self.vad is None:
+            return None
+        return VADEndpointer(self.vad.clone(), trailing_silence_ms=self._trailing_silence_ms)
+
+    def _cancel_turns(self):
+        while True:
+            try:
+                turn = self._turns.get_nowait()
+            except queue.Empty:
+                break
+            if turn is not None:
+                turn.cancel()
+
+        with self._turn_lock:
+            # A turn the worker took from the queue, but has not made current yet, is cancelled by this.
+            self._generation += 1
+            if self.current_turn is not None:
+                self.current_turn.cancel()
+
+    def _turn_worker(self):
+        while True:
+            turn = self._turns.get()
+            if turn is None or self._stopped.is_set():
+                break
+
+            with self._turn_lock:
+                if turn.generation != self._generation:
+                    turn.cancel()
+                if turn.cancelled:
+                    continue
+                self.current_turn = turn
+            try:
+                self._run_turn(turn)
+            except Exception as e:
+                print(f"[Chat] Request failed: {e}")
+                turn.trace.finish("failed")
+            finally:
+                with self._turn_lock:
+                    self.current_turn = None
+
+    def _on_turn_played(self, trace: TurnTrace, local: bool):
+        # Runs on the audio callback once the whole reply was played.
+        trace.finish("intent" if local else "done")
+        if "first_audio" not in trace.events or "stt_final" not in trace.events:
+            return
+
+        response_time = trace.events["first_audio"] - trace.events["stt_final"]
+        if local:
+            if self._chat_response_time is not None:
+                self.intents.add_saved(self._chat_response_time - response_time)
+        elif self._chat_response_time is None:
+            self._chat_response_time = response_time
+        else:
+            self._chat_response_time += 0.2 * (response_time - self._chat_response_time)
+
+    def _on_command(self, trace: TurnTrace, command: Command):
+        if self.commands is None:
+            print(f"[Command] No executor, ignoring {command.tag}")
+            return
+        self.commands.submit(command, trace)
+
+    def _run_turn(self, turn: Turn):
+        trace = turn.trace
+        intent = None
+        if turn.reply is None and self.intents is not None:
+            intent = self.intents.match(turn.text)
+        if intent is not None:
+            print(f"[Intent] {intent.name} {intent.command or ''}".rstrip())
+            trace.mark("intent")
+            if intent.command is not None:
+                self._on_command(trace, parse_command(intent.command))
+            self.chat.add_exchange(turn.text, intent.reply)
+            phrases = [intent.reply]
+        else:
+            if turn.reply is None:
+                turn.attach_reply(self.chat.chat_stream(turn.text, trace=trace))
+            phrases = split_phrases(strip_commands(turn.reply, partial(self._on_command, trace)))
+
+        sounds = self.tts.synthesize_iter(phrases, trace=trace)
+        try:
+            for sound in sounds:
+                # Resampled before the turn's lock is taken, so a wake word never waits for it.
+                sound = convert(sound, self.tts.rate, self.player.sample_rate)
+                if not turn.play(self.player, sound, on_start=partial(trace.mark, "first_audio"), on_end=partial(trace.mark, "last_audio", once=False)):
+                    break
+        finally:
+            sounds.close()
+        # Runs once everything queued so far has been played.
+        if turn.play(self.player, b"", on_end=partial(self._on_turn_played, trace, intent is not None)) and intent is None:
+            print(f"[Chat] Response: {turn.reply.text}")
+
+    def _cancel_echo(self, raw: FrameRing, clean: FrameRing):
+        # Positions in both rings stay equal, so a wake word event on the raw mic locates the same audio
+        # in the clean one: the reader starts at the oldest data, and dropped audio is written as silence.
+        reader = raw.reader(self.MIC_RATE * 2 * self.AEC_FRAME_MS // 1000, start=0)
+        try:
+            for frame in reader:
+                start = reader.position - len(frame)
+                if start > clean.written:
+                    clean.write(bytes(start - clean.written))
+                captured = raw.time_at(start, self.MIC_RATE * 2)
+                clean.write(self.echo.process(frame, captured), timestamp=captured)
+                if reader.dropped > 0:
+                    print(f"[AEC] Fell behind capture, dropped {reader.dropped} bytes")
+                    reader.dropped = 0
+        finally:
+            clean.close()
+
+    def _track_noise(self, reader: FrameReader):
+        for frame in reader:
+            self.vad.process(frame)
+
+    def _feed_stt(self, stt: STTAction, reader: FrameReader):
+        while not stt.closed:
+            frame = reader.read(timeout=0.1)
+            if frame is not None:
+                stt.handle_chunk(frame)
+            elif reader.closed:
+                break
+        if reader.dropped > 0:
+            print(f"[STT] Fell behind capture, dropped {reader.dropped} bytes")
+
+    def _on_wake(self, ring: FrameRing, position):
+        print("[Wake Word] Detected")
+        trace = self.tracer.start_turn(self.room)
+        # After _cancel_turns() no turn queues audio anymore, so stop_now() drops everything of theirs.
+        self._cancel_turns()
+        if self.player.is_playing():
+            print("[Chat] Ditching current TTS")
+        self.player.stop_now()
+        self.player.play(self._chime, source="chime")
+        if self.current_stt is not None and not self.current_stt.is_done():
+            print("[Wake Word] Ditching current STT")
+            self.current_stt.cancel()
+        if self.speculator is not None:
+            self.speculator.cancel()
+        if self._trace is not None:
+            self._trace.finish("interrupted")
+
+        self._trace = trace
+        self.current_stt = STTAction(chunk_size=self.MIC_RATE * 2 * self.STT_REQUEST_MS // 1000, max_latency=self.STT_REQUEST_MS / 1000,
+                                     on_result=partial(self._on_stt_result, trace), endpointer=self._new_endpointer(), stt=self.stt,
+                                     trace=trace, on_interim=self.speculator.on_interim if self.speculator is not None else None)
+        # From where the wake word ended, so speech right after it is kept, and the keyword is neither
+        # transcribed nor taken for the start of the request.
+        reader = ring.reader(self.MIC_RATE * 2 * self.VAD_FRAME_MS // 1000, start=position)
+        threading.Thread(target=self._feed_stt, args=(self.current_stt, reader), daemon=True).start()
+
+    def run(self, on_listening=None):
+        """
+        Listens for the wake word until the mic stream ends.
+
+        Args:
+            on_listening (callable): Called once the mic is capturing (default: None).
+        """
+        with self.mic.capture(rate=self.MIC_RATE) as ring:
+            if self.echo is not None:
+                # Every other consumer reads the mic without the echo.
+                raw, ring = ring, FrameRing(ring.capacity)
+                threading.Thread(target=self._cancel_echo, args=(raw, ring), name="aec", daemon=True).start()
+            if on_listening is not None:
+                on_listening()
+            if self.vad is not None:
+                reader = ring.reader(self.vad.frame_length * 2)
+                threading.Thread(target=self._track_noise, args=(reader,), daemon=True).start()
+
+            wake_reader = ring.reader(self.wake.frame_length * 2)
+            for frame in wake_reader:
+                if self.wake.detect(frame):
+                    # A detector in the front-end process reports where it fired, the frame is only its clock.
+                    event = getattr(self.wake, "last_event", None)
+                    self._on_wake(ring, event[0] if event is not None else wake_reader.position)
+                if wake_reader.dropped > 0:
+                    print(f"[Wake Word] Fell behind capture, dropped {wake_reader.dropped} bytes")
+                    wake_reader.dropped = 0
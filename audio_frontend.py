@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+from typing import Generator
+from frame_ring import SharedFrameRing
+import multiprocessing
+import threading
+import time
+
+def _run_frontend(mic_factory, wake_factory, name, rate, period, seconds, ready, stop):
+    """
+    The front-end process: captures into the shared ring and publishes a wake event at the end of each
+    frame the wake word was detected in, until stopped or the mic stream ends.
+    """
+    ring = SharedFrameRing.attach(name)
+    try:
+        mic = mic_factory()
+        wake = wake_factory()
+        with mic.capture(rate=rate, period=period, seconds=seconds, ring=ring):
+            reader = ring.reader(wake.frame_length * 2)
+            ready.set()
+            while not stop.is_set():
+                frame = reader.read(timeout=0.1)
+                if frame is None:
+                    if reader.closed:
+                        break
+                    continue
+                if wake.detect(frame):
+                    ring.publish(reader.position, time.monotonic())
+                if reader.dropped > 0:
+                    print(f"[Frontend] Wake word fell behind capture, dropped {reader.dropped} bytes")
+                    reader.dropped = 0
+    finally:
+        ring.close()
+
+class RemoteWakeWord(object):
+    """
+    Stands in for the WakeWordDetector of an AudioFrontend in the main process: detect() returns True
+    once per wake event the front-end process published since the last call, whatever the frame.
+    As the frames are only a clock, they are short by default, so an event waits little for the next one.
+
+    Attributes:
+        last_event (tuple): The (ring position, time.monotonic()) of the last wake event detect() returned.
+    """
+
+    def __init__(self, frontend, frame_length=128):
+        self._frontend = frontend
+        self.frame_length = frame_length
+        self._ring = None
+        self._seen = 0
+        self.last_event = None
+
+    def detect(self, pcm):
+        ring = self._frontend.ring
+        if ring is not self._ring:
+            # A new capture, e.g. after a restart, counts its events from 0.
+            self._ring, self._seen = ring, 0
+        if ring is None or ring.event_count <= self._seen:
+            return False
+        events = ring.events(self._seen)
+        self._seen += len(events)
+        self.last_event = events[-1]
+        return True
+
+class AudioFrontend(object):
+    """
+    Runs mic capture and the wake word detector in a process of their own, so the main process' GIL,
+    e.g. TTS decoding, JSON parsing or garbage collection, never delays a capture period or a detection.
+
+    The mic writes into a SharedFrameRing, which the main process reads without pickling or locks.
+    Use it in place of the Microphone, and its wake_detector() in place of the WakeWordDetector:
+
+        frontend = AudioFrontend(partial(Microphone, "Anker Mic"), partial(WakeWordDetector, access_key, sample_rate=16000))
+        assistant = Assistant(chat, tts, frontend.wake_detector(), mic=frontend, ...)
+
+    The wake word then listens to the mic before echo cancellation, as that runs in the main process, so
+    barge-in is not echo robust: over a reply it hears the user worse, and the reply itself can trigger it.
+    STT and the VAD still get the echo cancelled audio.
+
+    Args:
+        mic_factory (callable): Creates the Microphone in the front-end process. Must be picklable, e.g.
+                                a functools.partial of the class.
+        wake_factory (callable): Creates the WakeWordDetector in the front-end process, likewise.
+        start_timeout (float): How long to wait for the mic to start capturing, in seconds (default: 30).
+    """
+
+    def __init__(self, mic_factory, wake_factory, start_timeout=30.0):
+        self.mic_factory = mic_factory
+        self.wake_factory = wake_factory
+        self.start_timeout = start_timeout
+        self.ring: SharedFrameRing = None
+        self._context = multiprocessing.get_context("spawn")
+
+    def wake_detector(self, frame_length=128) -> RemoteWakeWord:
+        return RemoteWakeWord(self, frame_length)
+
+    def _watch(self, process, ring: SharedFrameRing):
+        process.join()
+        if process.exitcode != 0:
+            print(f"[Frontend] Process exited with code {process.exitcode}")
+        # Readers must not wait forever on a ring nobody writes to anymore.
+        ring.close()
+
+    @contextmanager
+    def capture(self, rate=16000, period=256, seconds=2.0, format=None) -> Generator[SharedFrameRing, None, None]:
+        """
+        Starts the front-end process, and yields the SharedFrameRing it captures into once the mic is
+        capturing. See Microphone.capture().
+        """
+        ring = SharedFrameRing(int(rate * 2 * seconds))
+        ready = self._context.Event()
+        stop = self._context.Event()
+        process = self._context.Process(target=_run_frontend, args=(self.mic_factory, self.wake_factory, ring.name, rate, period, seconds, ready, stop),
+                                        name="audio-frontend", daemon=True)
+        process.start()
+        threading.Thread(target=self._watch, args=(process, ring), name="frontend-watch", daemon=True).start()
+        try:
+            deadline = time.monotonic() + self.start_timeout
+            while not ready.wait(0.1):
+                if ring.closed or time.monotonic() > deadline:
+                    raise RuntimeError("[Frontend] The front-end process did not start capturing.")
+            self.ring = ring
+            yield ring
+        finally:
+            stop.set()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            ring.close()
+            ring.release()
@@ -0,0 +1,177 @@
+"""
+Measures the echo canceller's cost and how much echo it removes.
+
+Each scenario is a pair of 16 kHz recordings: what the speaker played (the far end) and what the mic
+heard. Without --pairs, a scenario is generated: a speech-like far end through a synthetic room
+(a few ms of delay, then an exponentially decaying reverb tail), plus mic noise and, from --double_talk
+on, a near-end talker over the reply. The mic is processed against the far end like Assistant does,
+with the reference read lookahead_ms ahead.
+
+For each scenario it reports:
+    - the real-time factor (CPU seconds per second of audio) and the CPU time per block,
+    - the ERLE (echo return loss enhancement, mic energy over output energy) while only the far end plays,
+      after the first --settle seconds, and the time until the ERLE of a second first reaches 20 dB,
+    - with a generated near end, its signal to echo ratio in the mic and in the output during double talk.
+
+The canceller must stay well below a real-time factor of 1 on one core, since it runs on every mic frame.
+
+Run from the repository root:
+    python -m benchmarks.aec_bench
+    python -m benchmarks.aec_bench --pairs far.wav mic.wav [far2.wav mic2.wav ...]
+"""
+import argparse
+import time
+import wave
+import numpy as np
+from aec import EchoCanceller
+from devices.audio_format import convert
+
+RATE = 16000
+
+def read_wav(path):
+    with wave.open(path, "rb") as wf:
+        pcm = convert(wf.readframes(wf.getnframes()), wf.getframerate(), RATE, channels=wf.getnchannels(), width=wf.getsampwidth())
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768
+
+def talker(rng, seconds, f0, level):
+    """
+    Returns a speech-like signal: syllables of a harmonic voice with a wandering pitch and of noise,
+    separated by pauses.
+    """
+    out = np.zeros(int(seconds * RATE), dtype=np.float32)
+    position = 0
+    while position < len(out):
+        length = int(rng.uniform(0.12, 0.35) * RATE)
+        t = np.arange(length) / RATE
+        if rng.random() < 0.7:
+            pitch = f0 * (1 + 0.15 * np.sin(2 * np.pi * rng.uniform(1, 4) * t))
+            phase = 2 * np.pi * np.cumsum(pitch) / RATE
+            # Glottal pulses have harmonics up to Nyquist, falling at about 6 dB per octave, and some breath noise.
+            syllable = sum(np.sin(k * phase) / k for k in range(1, int(RATE / 2 / (1.2 * f0))))
+            syllable += 0.1 * rng.normal(0, 1, length)
+        else:
+            syllable = np.diff(rng.normal(0, 1, length + 1))
+        syllable *= np.sin(np.pi * t / t[-1]) ** 2
+        end = min(len(out), position + length)
+        out[position:end] = syllable[:end - position]
+        position = end + int(rng.uniform(0.02, 0.25) * RATE)
+    return (out / np.max(np.abs(out)) * level).astype(np.float32)
+
+def room_response(rng, delay_ms, tail_ms, gain):
+    """
+    Returns an impulse response: a direct path after delay_ms, then reflections decaying by 60 dB over tail_ms.
+    """
+    delay = int(delay_ms * RATE / 1000)
+    length = int(tail_ms * RATE / 1000)
+    decay = np.exp(-6.9 * np.arange(length) / length)
+    response = np.zeros(delay + length, dtype=np.float32)
+    response[delay] = 1.0
+    response[delay + 1:] = 0.3 * rng.normal(0, 1, length - 1) * decay[1:]
+    return response * gain
+
+def make_scenario(seconds, double_talk, echo_delay_ms, echo_tail_ms, echo_gain, seed=0):
+    """
+    Returns:
+        tuple: The far end, the mic, and the near end alone (None where there is none).
+    """
+    rng = np.random.default_rng(seed)
+    far = talker(rng, seconds, 120, 0.5)
+    echo = np.convolve(far, room_response(rng, echo_delay_ms, echo_tail_ms, echo_gain))[:len(far)]
+    near = np.zeros_like(far)
+    if double_talk is not None:
+        start = int(double_talk * RATE)
+        near[start:] = talker(rng, seconds - double_talk, 210, 0.15)[:len(far) - start]
+    noise = rng.normal(0, 10 ** (-60 / 20), len(far)).astype(np.float32)
+    return far, (echo + near + noise).astype(np.float32), near
+
+def run(far, mic, args):
+    """
+    Returns:
+        tuple: The output, the canceller and the CPU seconds.
+    """
+    canceller = EchoCanceller(rate=RATE, block=args.block, tail_ms=args.tail_ms, lookahead_ms=args.lookahead_ms, step=args.step)
+    b = canceller.block
+    lookahead = int(args.lookahead_ms * RATE / 1000)
+    n = len(mic) // b * b
+    reference = np.concatenate([far, np.zeros(lookahead + b, dtype=np.float32)])[lookahead:lookahead + n]
+    out = np.empty(n, dtype=np.float32)
+    cpu_start = time.process_time()
+    for i in range(0, n, b):
+        out[i:i + b] = canceller.process_block(mic[i:i + b], reference[i:i + b])
+    return out, canceller, time.process_time() - cpu_start
+
+def energy_db(x):
+    return 10 * np.log10(np.sum(x.astype(np.float64) ** 2) + 1e-12)
+
+def report(name, far, mic, near, args):
+    out, canceller, cpu_seconds = run(far, mic, args)
+    n = len(out)
+    far, mic = far[:n], mic[:n]
+    seconds = n / RATE
+    print(f"{name}:")
+    print(f"  Real-time factor {cpu_seconds / seconds:.4f}, {cpu_seconds / (n / canceller.block) * 1e6:.0f} us per {canceller.block} sample block "
+          f"({canceller.partitions} partitions, {canceller.active_blocks} of {canceller.blocks} blocks with reference)")
+
+    # Seconds where the far end plays and, if known, the near end does not.
+    second = RATE
+    echo_only = []
+    for start in range(0, n - second + 1, second):
+        window = slice(start, start + second)
+        if energy_db(far[window]) < -40 or (near is not None and np.any(near[window])):
+            continue
+        echo_only.append(start)
+    erle = [energy_db(mic[s:s + second]) - energy_db(out[s:s + second]) for s in echo_only]
+    settled = [e for s, e in zip(echo_only, erle) if s >= args.settle * RATE]
+    if settled:
+        mic_energy = sum(10 ** (energy_db(mic[s:s + second]) / 10) for s in echo_only if s >= args.settle * RATE)
+        out_energy = sum(10 ** (energy_db(out[s:s + second]) / 10) for s in echo_only if s >= args.settle * RATE)
+        print(f"  ERLE {10 * np.log10(mic_energy / out_energy):.1f} dB over {len(settled)} s of echo only after {args.settle:.0f} s "
+              f"(worst second {min(settled):.1f} dB)")
+    converged = next((s / RATE for s, e in zip(echo_only, erle) if e >= 20), None)
+    print(f"  ERLE first reached 20 dB in the second from {converged:.0f} s" if converged is not None else "  ERLE never reached 20 dB in a second")
+
+    if near is not None and np.any(near):
+        talk = np.abs(near[:n]) > 0
+        before = energy_db(near[:n][talk]) - energy_db((mic - near[:n])[talk])
+        after = energy_db(near[:n][talk]) - energy_db((out - near[:n])[talk])
+        print(f"  Double talk: near end to echo {before:.1f} dB in the mic, {after:.1f} dB in the output "
+              f"({canceller.double_talk_blocks} blocks held adaptation)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the echo canceller's real-time factor and ERLE.")
+    parser.add_argument("--pairs", type=str, nargs="+", default=None, help="Recorded far end and mic WAV files, in pairs, aligned at their start.")
+    parser.add_argument("--seconds", type=float, default=20.0, help="The length of the generated scenarios.")
+    parser.add_argument("--double_talk", type=float, default=14.0, help="When the generated near-end talker starts, in seconds.")
+    parser.add_argument("--echo_delay_ms", type=float, default=4.0, help="The direct path delay of the generated room.")
+    parser.add_argument("--echo_tail_ms", type=float, default=100.0, help="The reverb tail of the generated room.")
+    parser.add_argument("--echo_gain", type=float, default=0.5, help="The gain of the generated room's direct path.")
+    parser.add_argument("--settle", type=float, default=2.0, help="The seconds of convergence left out of the ERLE.")
+    parser.add_argument("--block", type=int, default=128, help="The block length in samples.")
+    parser.add_argument("--tail_ms", type=int, default=160, help="The modeled echo path length.")
+    parser.add_argument("--lookahead_ms", type=int, default=16, help="How far ahead of the mic the reference is read.")
+    parser.add_argument("--step", type=float, default=0.5, help="The NLMS step size.")
+    args = parser.parse_args()
+
+    if args.pairs is not None:
+        if len(args.pairs) % 2 != 0:
+            parser.error("--pairs takes a far end and a mic file per recording")
+        for far_path, mic_path in zip(args.pairs[::2], args.pairs[1::2]):
+            far, mic = read_wav(far_path), read_wav(mic_path)
+            n = min(len(far), len(mic))
+            report(f"{far_path} / {mic_path}", far[:n], mic[:n], None, args)
+        return
+
+    scenarios = [
+        ("Echo only", dict(double_talk=None)),
+        ("Long reverb", dict(double_talk=None, echo_tail_ms=min(args.echo_tail_ms * 1.5, args.tail_ms - args.lookahead_ms))),
+        ("Double talk", dict(double_talk=args.double_talk)),
+    ]
+    for name, overrides in scenarios:
+        params = dict(seconds=args.seconds, double_talk=args.double_talk, echo_delay_ms=args.echo_delay_ms,
+                      echo_tail_ms=args.echo_tail_ms, echo_gain=args.echo_gain)
+        params.update(overrides)
+        far, mic, near = make_scenario(**params)
+        report(name, far, mic, near, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Local stand-ins for the audio devices and remote services, for running Assistant without a mic,
+speaker, Riva, Google STT or OpenAI. Each fake reports its milestones to a Recorder.
+
+Importing this module installs empty stand-in modules for the device and client packages that are
+not installed, so the benchmarks run without them, e.g. in CI. Installed packages are left alone.
+Import it before the pipeline modules.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from types import ModuleType, SimpleNamespace
+import importlib
+import random
+import sys
+import threading
+import time
+import wave
+import numpy as np
+from frame_ring import FrameRing
+
+# The names the pipeline modules use at import time or with the fakes, per module. The pyaudio
+# constants are PortAudio's.
+_CLIENT_STUBS = {
+    "pyaudio": {"paInt16": 8, "paContinue": 0, "paComplete": 1, "paInputOverflow": 2, "paOutputUnderflow": 4,
+                "PyAudio": object, "Stream": object, "get_sample_size": lambda format: 2},
+    "pvporcupine": {"create": None},
+    "openai": {"OpenAI": object},
+    "httpx": {"Client": object, "Limits": object, "Timeout": object},
+    "grpc": {"Channel": object},
+    "riva.client": {"Auth": object},
+    "riva.client.tts": {"SpeechSynthesisService": object},
+    "google.cloud.speech": {},
+    "google.cloud.speech_v1.services.speech.transports": {"SpeechGrpcTransport": object},
+}
+
+def _stub_missing_clients():
+    for name, attrs in _CLIENT_STUBS.items():
+        try:
+            importlib.import_module(name)
+            continue
+        except ImportError:
+            pass
+        parts = name.split(".")
+        for i in range(1, len(parts) + 1):
+            path = ".".join(parts[:i])
+            module = sys.modules.get(path)
+            if module is None:
+                module = sys.modules[path] = ModuleType(path)
+                if i > 1:
+                    setattr(sys.modules[".".join(parts[:i - 1])], parts[i - 1], module)
+        module.__dict__.update(attrs)
+
+_stub_missing_clients()
+
+class Recorder(object):
+    """
+    Collects per-turn timestamps. A turn starts at each wake word, and later events belong to the latest turn.
+    """
+
+    def __init__(self):
+        self.turns = []
+        self._lock = threading.Lock()
+
+    def start_turn(self, **info):
+        with self._lock:
+            self.turns.append({"wake": time.perf_counter(), **info})
+
+    def mark(self, event, once=True, after=None):
+        """
+        Records an event of the latest turn. With once, only its first occurrence is kept, and with after,
+        it is ignored until that other event happened.
+        """
+        with self._lock:
+            if not self.turns:
+                return
+            turn = self.turns[-1]
+            if (once and event in turn) or (after is not None and after not in turn):
+                return
+            turn[event] = time.perf_counter()
+
+class Latency(object):
+    """
+    A latency with gaussian jitter, in seconds.
+    """
+
+    def __init__(self, mean, jitter=0.0, seed=None):
+        self.mean = mean
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    def sample(self):
+        return max(0.0, self._rng.gauss(self.mean, self.jitter)) if self.jitter > 0 else self.mean
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+class WaveMicrophone(object):
+    """
+    Replays a 16 bit mono WAV file in place of Microphone, paced like a real device and followed by
+    `tail_seconds` of silence. The capture ring is closed at the end, which ends Assistant.run().
+
+    With timestamps, writes are stamped like Microphone's, with the time the chunk started, so the
+    stamps show how late each write was. They only match the audio at a speed of 1.
+    """
+
+    def __init__(self, path, speed=1.0, tail_seconds=3.0, timestamps=False):
+        with wave.open(path, "rb") as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+                raise ValueError(f"{path}: expected 16 bit mono audio")
+            self.rate = wf.getframerate()
+            self.pcm = wf.readframes(wf.getnframes()) + bytes(int(self.rate * tail_seconds) * 2)
+        self.speed = speed
+        self.timestamps = timestamps
+        self._write_offsets = []
+        self._write_times = []
+
+    @property
+    def duration(self):
+        return len(self.pcm) / 2 / self.rate
+
+    def write_time(self, offset):
+        """
+        Returns the wall time at which the byte at `offset` was captured.
+        """
+        i = min(bisect_left(self._write_offsets, offset), len(self._write_times) - 1)
+        return self._write_times[i]
+
+    @contextmanager
+    def capture(self, rate=16000, period=256, seconds=2.0, format=None, ring=None):
+        if rate != self.rate:
+            raise ValueError(f"The WAV file is {self.rate} Hz, but {rate} Hz was requested.")
+        if ring is None:
+            ring = FrameRing(int(rate * 2 * seconds))
+        stopped = threading.Event()
+
+        def replay():
+            chunk = period * 2
+            interval = period / rate / self.speed
+            next_time = time.perf_counter()
+            for offset in range(0, len(self.pcm), chunk):
+                if stopped.is_set():
+                    break
+                ring.write(self.pcm[offset:offset + chunk], timestamp=time.monotonic() - interval if self.timestamps else None)
+                self._write_offsets.append(offset + chunk)
+                self._write_times.append(time.perf_counter())
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+            ring.close()
+
+        thread = threading.Thread(target=replay, name="fake-mic", daemon=True)
+        thread.start()
+        try:
+            yield ring
+        finally:
+            stopped.set()
+            thread.join()
+
+class FakeSpeaker(object):
+    """
+    Drives an output stream callback in real time in place of Speaker, and records the first
+    non-silent period of each reply as its first audio out.
+    """
+
+    def __init__(self, recorder: Recorder, speed=1.0, native_rate=48000):
+        self._recorder = recorder
+        self.speed = speed
+        self.native_rate = native_rate
+        self._player = None
+
+    def player(self):
+        from devices.async_player import AsyncPlayer
+        if self._player is None:
+            self._player = AsyncPlayer(self, sample_rate=self.native_rate)
+            self._player.start()
+        return self._player
+
+    @contextmanager
+    def output_stream(self, rate=16000, chunk_size=1024, channels=1, format=None, stream_callback=None):
+        stopped = threading.Event()
+
+        def drive():
+            interval = chunk_size / rate / self.speed
+            next_time = time.perf_counter()
+            while not stopped.is_set():
+                data, _ = stream_callback(None, chunk_size, None, 0)
+                if np.any(np.frombuffer(data, dtype=np.int16)):
+                    # The tail of the previous reply may still be fading out after a wake word.
+                    self._recorder.mark("first_audio", after="chat_request")
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+
+        thread = threading.Thread(target=drive, name="fake-speaker", daemon=True)
+        thread.start()
+        try:
+            yield None
+        finally:
+            stopped.set()
+            thread.join()
+
+class ScheduledWakeWord(object):
+    """
+    Fires the wake word at fixed positions of the mic audio, in place of WakeWordDetector.
+    """
+
+    frame_length = 512
+
+    def __init__(self, recorder: Recorder, mic: WaveMicrophone, times):
+        self._recorder = recorder
+        self._mic = mic
+        self._positions = sorted(int(t * mic.rate) for t in times)
+        self._position = 0
+
+    def detect(self, pcm):
+        self._position += len(pcm) // 2
+        if not self._positions or self._position < self._positions[0]:
+            return False
+
+        self._positions.pop(0)
+        captured = self._mic.write_time(self._position * 2)
+        self._recorder.start_turn(wake_delay=time.perf_counter() - captured)
+        return True
+
+class FakeSTT(object):
+    """
+    Consumes the audio stream like Google STT until it ends or `max_audio_seconds` were sent,
+    then returns a fixed transcript after a latency. Interim transcripts reveal one more word
+    every `seconds_per_word` of audio.
+    """
+
+    def __init__(self, recorder: Recorder, transcript, latency: Latency, max_audio_seconds=8.0, rate=16000, seconds_per_word=0.25):
+        self._recorder = recorder
+        self._transcript = transcript
+        self._latency = latency
+        self._rate = rate
+        self._max_bytes = int(max_audio_seconds * rate * 2)
+        self._seconds_per_word = seconds_per_word
+
+    def recognize_stream_command(self, stream, on_call=None, on_interim=None):
+        self._recorder.mark("stt_start")
+        words = self._transcript.split()
+        sent = 0
+        for chunk in stream:
+            sent += len(chunk)
+            if on_interim is not None:
+                revealed = int(sent / 2 / self._rate / self._seconds_per_word)
+                if revealed > 0:
+                    on_interim(" ".join(words[:revealed]))
+            if sent >= self._max_bytes:
+                break
+        self._recorder.mark("stt_audio_end")
+        self._latency.sleep()
+        self._recorder.mark("stt_final")
+        return self._transcript
+
+class _FakeResponse(object):
+    def __init__(self, recorder: Recorder, text, first_token: Latency, token_interval: Latency):
+        self._recorder = recorder
+        self._tokens = [t + " " for t in text.split()]
+        self._first_token = first_token
+        self._token_interval = token_interval
+        self._closed = threading.Event()
+
+    def close(self):
+        self._closed.set()
+
+    def __iter__(self):
+        if self._closed.wait(self._first_token.sample()):
+            return
+        for i, token in enumerate(self._tokens):
+            if i > 0 and self._closed.wait(self._token_interval.sample()):
+                return
+            if i == 0:
+                # A later request replaces a discarded speculative one.
+                self._recorder.mark("first_token", once=False)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+class FakeCommandBackend(object):
+    """
+    Carries out commands after a latency, in place of a home automation backend.
+    """
+
+    def __init__(self, recorder: Recorder, latency: Latency):
+        self._recorder = recorder
+        self._latency = latency
+
+    def execute(self, command):
+        self._latency.sleep()
+        self._recorder.mark("command_done", once=False)
+
+class FakeChat(object):
+    """
+    Streams a fixed reply in place of Chat, token by token, with a real ChatContext.
+    """
+
+    def __init__(self, recorder: Recorder, reply, first_token: Latency, token_interval: Latency):
+        from chat import get_system_message
+        from chat_context import ChatContext, TokenCounter
+        self._recorder = recorder
+        self._reply = reply
+        self._first_token = first_token
+        self._token_interval = token_interval
+        self.context = ChatContext(get_system_message(), TokenCounter("gpt-3.5-turbo"))
+
+    def add_assistant_message(self, text):
+        from chat import get_message
+        self.context.append(get_message("assistant", text))
+
+    def add_exchange(self, text, reply):
+        from chat import get_message
+        self.context.append(get_message("user", text))
+        self.add_assistant_message(reply)
+
+    def chat_stream(self, text, trace=None, record=True):
+        from chat import ChatStream
+        self._recorder.mark("chat_request", once=False)
+        if trace is not None:
+            trace.mark("chat_request")
+        return ChatStream(self, _FakeResponse(self._recorder, self._reply, self._first_token, self._token_interval), trace=trace,
+                          request=text if record else None)
+
+class FakeSynthesisService(object):
+    """
+    Returns a tone for each text in place of Riva's SpeechSynthesisService, after a latency that
+    grows with the length of the text. The audio lasts `seconds_per_char` per character.
+    """
+
+    def __init__(self, latency: Latency, latency_per_char=0.0005, seconds_per_char=0.06):
+        self._latency = latency
+        self._latency_per_char = latency_per_char
+        self._seconds_per_char = seconds_per_char
+
+    def synthesize(self, text, voice_name=None, sample_rate_hz=22050, **kwargs):
+        time.sleep(self._latency.sample() + self._latency_per_char * len(text))
+        t = np.arange(int(len(text) * self._seconds_per_char * sample_rate_hz)) / sample_rate_hz
+        audio = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16).tobytes()
+        return SimpleNamespace(audio=audio)
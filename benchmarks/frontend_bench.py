@@ -0,0 +1,150 @@
+"""
+Measures the timing jitter of mic capture and wake word detection, with the audio front end in the
+main process and in a process of its own (AudioFrontend), while the main process is loaded.
+
+A generated recording with a wake word every --wake_interval seconds is replayed by WaveMicrophone at
+real time, and read like Assistant.run() does: a loop in the main process reads wake word frames and
+calls the detector. In process, that detector is a ScheduledWakeWord-like fake; with the front end,
+the fake runs in the front-end process and the loop calls its RemoteWakeWord. Meanwhile --load_threads
+threads keep the main process' GIL busy with JSON round trips, like the chat, STT and TTS clients do.
+
+For each mode it reports, as p50 / p99 / max:
+    capture     how late each mic period was written, relative to the recording's timeline
+    delivery    mic period written -> its frame read by the wake word loop
+    wake        end of the wake word frame in the recording's timeline -> detect() returned True in the
+                main process, so late capture counts too
+and the bytes the loop dropped, and the wake words missed.
+
+The fake detector costs almost nothing, so the numbers show the scheduling and transport alone.
+
+Run from the repository root:
+    python -m benchmarks.frontend_bench
+    python -m benchmarks.frontend_bench --seconds 30 --load_threads 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import wave
+from functools import partial
+import numpy as np
+from audio_frontend import AudioFrontend
+from benchmarks.fakes import WaveMicrophone
+
+RATE = 16000
+FRAME_LENGTH = 512
+
+class PositionWakeWord(object):
+    """
+    Fires the wake word at fixed positions of the mic audio, in place of WakeWordDetector. Picklable,
+    so the front-end process can create it.
+    """
+
+    frame_length = FRAME_LENGTH
+
+    def __init__(self, positions):
+        self._positions = sorted(positions)
+        self._position = 0
+
+    def detect(self, pcm):
+        self._position += len(pcm) // 2
+        if not self._positions or self._position < self._positions[0]:
+            return False
+        self._positions.pop(0)
+        return True
+
+def load(stop):
+    payload = {"choices": [{"delta": {"content": "word " * 50}, "index": i} for i in range(200)]}
+    while not stop.is_set():
+        json.loads(json.dumps(payload))
+
+def run(mic, wake, args):
+    """
+    Returns:
+        dict: The capture lateness, delivery and wake latencies in seconds, and the dropped bytes.
+    """
+    stop = threading.Event()
+    loaders = [threading.Thread(target=load, args=(stop,), daemon=True) for _ in range(args.load_threads)]
+    for thread in loaders:
+        thread.start()
+
+    bytes_per_second = RATE * 2
+    capture, delivery, wake_latency = [], [], []
+    origin = None
+    reader = None
+    try:
+        with mic.capture(rate=RATE, period=args.period) as ring:
+            reader = ring.reader(wake.frame_length * 2)
+            for frame in reader:
+                now = time.monotonic()
+                # The end of the frame was captured when the period holding it was written.
+                end = reader.position
+                captured = ring.time_at(end - 1, bytes_per_second)
+                if captured is None:
+                    continue
+                captured += 1 / bytes_per_second
+                if origin is None:
+                    origin = captured - end / bytes_per_second
+                capture.append(captured - (origin + end / bytes_per_second))
+                delivery.append(now - captured)
+                if wake.detect(frame):
+                    # From the end of the frame the wake word was detected in, which the front end publishes.
+                    event = getattr(wake, "last_event", None)
+                    position = event[0] if event is not None else end
+                    wake_latency.append(now - (origin + position / bytes_per_second))
+    finally:
+        stop.set()
+        for thread in loaders:
+            thread.join()
+
+    # The first period may have been late itself, so the timeline is that of the earliest period.
+    earliest = min(capture)
+    return {"capture": np.array(capture) - earliest, "delivery": np.array(delivery), "wake": np.array(wake_latency) + earliest,
+            "dropped": reader.dropped}
+
+def stats(values):
+    if len(values) == 0:
+        return "n/a"
+    p50, p99 = np.percentile(values, [50, 99]) * 1000
+    return f"p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {np.max(values) * 1000:6.2f} ms  (n={len(values)})"
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures capture and wake word jitter with the audio front end in and out of process.")
+    parser.add_argument("--seconds", type=float, default=20.0, help="The length of the recording.")
+    parser.add_argument("--wake_interval", type=float, default=2.0, help="The seconds between wake words.")
+    parser.add_argument("--period", type=int, default=256, help="The capture period in samples.")
+    parser.add_argument("--load_threads", type=int, default=2, help="The threads loading the main process' GIL.")
+    parser.add_argument("--modes", type=str, nargs="+", default=["in_process", "frontend"], choices=["in_process", "frontend"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pcm = (rng.normal(0, 300, int(args.seconds * RATE))).astype(np.int16).tobytes()
+    wake_times = np.arange(args.wake_interval, args.seconds, args.wake_interval)
+    positions = [int(t * RATE) for t in wake_times]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = os.path.join(tmp, "mic.wav")
+        with wave.open(wav_path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(RATE)
+            wf.writeframes(pcm)
+        make_mic = partial(WaveMicrophone, wav_path, tail_seconds=0.0, timestamps=True)
+        make_wake = partial(PositionWakeWord, positions)
+
+        for mode in args.modes:
+            if mode == "in_process":
+                result = run(make_mic(), make_wake(), args)
+            else:
+                frontend = AudioFrontend(make_mic, make_wake)
+                result = run(frontend, frontend.wake_detector(), args)
+            print(f"{mode} ({args.load_threads} load threads):")
+            print(f"  capture   {stats(result['capture'])}")
+            print(f"  delivery  {stats(result['delivery'])}")
+            print(f"  wake      {stats(result['wake'])}")
+            print(f"  dropped {result['dropped']} bytes, missed {len(positions) - len(result['wake'])} of {len(positions)} wake words")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Checks that TextNormalizer matches the original RivaTTS._normalize_text output on a corpus of
+LLM-style replies, then compares their throughput. Of the intended differences (see TextNormalizer),
+only a number glued to "degrees" occurs in the corpus, and the check unglues it in the legacy output;
+tests/test_text_normalizer.py pins the exact outputs.
+
+Run from the repository root:
+    python -m benchmarks.normalizer_bench
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from num2words import num2words
+from text_normalizer import TextNormalizer
+
+def legacy_normalize_text(text):
+    # The original RivaTTS._normalize_text, kept here as the reference.
+    def convert_punctuated(m):
+        return num2words(m.group(1).replace(",", ""))
+    text = re.sub(r'(\d{0,3}(,\d{3})+)($|\D)', lambda m: f" {convert_punctuated(m)} {m.group(3)}", text)
+    text = re.sub(r'\d+', lambda m: f" {num2words(m.group())} ", text)
+
+    text = re.sub(r'([a-zA-Z])\.([a-zA-Z])', lambda m: f"{m.group(1)} dot {m.group(2)}", text)
+    text = text.replace("$", " dollars ")
+    text = text.replace("%", " percent ")
+    text = text.replace("€", " euros ")
+    text = text.replace("£", " pounds ")
+    text = text.replace("¥", " yen ")
+    text = text.replace("₪", " shekels ")
+    text = text.replace("*", " asterisk ")
+    text = text.replace("@", " at ")
+    text = text.replace("’", "'")
+
+    text = text.replace("NTFS", "N T F S")
+
+    text = text.replace(" °", "degrees")
+    text = text.replace("°", " degrees")
+
+    text = re.sub(r'(\s|^)([Mm][Rr]\.)(\s|$)', lambda m: f"{m.group(1)}mister{m.group(3)}", text)
+    text = re.sub(r'(\s|^)([Mm][Ss]\.)(\s|$)', lambda m: f"{m.group(1)}miss{m.group(3)}", text)
+    text = re.sub(r'(\s|^)([Mm][Rr][Ss]\.)(\s|$)', lambda m: f"{m.group(1)}missus{m.group(3)}", text)
+
+    text = re.sub(r'(\s|^)(USA|usa)(\s|$|\?|!|,)', lambda m: f"{m.group(1)}U S AY{m.group(3)}", text)
+    text = re.sub(r'(\s|^)(UK|uk)(\s|$|\?|!|,)', lambda m: f"{m.group(1)}U KAY{m.group(3)}", text)
+
+    text = re.sub(r'(\s|^)(AI|ai)(\s|$|\?|!|,|\.)', lambda m: f"{m.group(1)}AY IY{m.group(3)}", text)
+
+    return text
+
+GOLDEN = [
+    "Oh, it's you. It's been a long time.",
+    "The cake costs $5, or 12% of your 1,250,000 euros.",
+    "Mr. Smith and Mrs. Jones met Ms. Lee in the USA, then the UK.",
+    "Test chamber 19 is 21 ° warm, or 70°F in the usa!",
+    "Visit aperturescience.com or email glados@aperture.com.",
+    "Your NTFS drive is full * sarcastically * and it's your fault.",
+    "AI. AI? AI! ai, AI",
+    "I’m the AI that runs Aperture. You’re a test subject.",
+    "Mr.Smith has 3.5 cakes and 1,000 problems",
+    "€20 £30 ¥40 ₪50 $60",
+    "usa.gov and uk.gov",
+    "$USA %UK AI$ UK°",
+    "°C is cold, a.b.c is not. USA!",
+    "ai",
+]
+
+SENTENCES = [
+    "Congratulations, the test is now over.",
+    "You have been in this chamber for {n} minutes, which is {p}% longer than the average lab rat.",
+    "The Enrichment Center reminds you that the Weighted Companion Cube will never threaten to stab you.",
+    "Mr. {name} from the USA sold {big} portals to the UK for ${n} each.",
+    "The temperature in test chamber {n} is {n}°, perfect for neurotoxin.",
+    "As an AI, I find your NTFS formatted brain adorable.",
+    "Please send your complaints to complaints@aperturescience.com, where they will be ignored.",
+    "Ms. {name} scored {n} out of {n}, which is * still * a failure.",
+    "Your reward is {n} € worth of cake, or £{n} if you insist.",
+    "I’ve calculated a {p}% chance that you will survive the next {n} tests.",
+]
+
+NAMES = ["Johnson", "Cave", "Caroline", "Wheatley"]
+
+def make_corpus(count, sentences_per_reply, seed=0):
+    rng = random.Random(seed)
+    replies = []
+    for _ in range(count):
+        sentences = [rng.choice(SENTENCES).format(
+            n=rng.randint(0, 999),
+            p=rng.randint(0, 100),
+            big=f"{rng.randint(1, 999)},{rng.randint(0, 999):03d},{rng.randint(0, 999):03d}",
+            name=rng.choice(NAMES)) for _ in range(sentences_per_reply)]
+        replies.append(" ".join(sentences))
+    return replies
+
+# The original glued "21°" into " twenty-onedegrees", which TextNormalizer reads as " twenty-one degrees".
+GLUED_DEGREES = re.compile(r'(?<=\w)degrees')
+
+def check_parity(normalizer, texts):
+    mismatches = 0
+    for text in texts:
+        expected = GLUED_DEGREES.sub(" degrees", legacy_normalize_text(text))
+        actual = normalizer(text)
+        if expected != actual:
+            mismatches += 1
+            print(f"[Mismatch] {text!r}\n  legacy: {expected!r}\n  new:    {actual!r}")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="TextNormalizer parity check and benchmark")
+    parser.add_argument("--replies", type=int, default=200, help="Number of replies in the corpus")
+    parser.add_argument("--sentences", type=int, default=12, help="Sentences per reply")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best is reported")
+    args = parser.parse_args()
+
+    normalizer = TextNormalizer()
+    corpus = make_corpus(args.replies, args.sentences)
+    mismatches = check_parity(normalizer, GOLDEN + corpus)
+    print(f"Parity: {mismatches} mismatches over {len(GOLDEN) + len(corpus)} texts")
+
+    characters = sum(len(t) for t in corpus)
+    for name, func in [("legacy", legacy_normalize_text), ("TextNormalizer", normalizer)]:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for text in corpus:
+                func(text)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:<16}{best * 1000:>10.2f}ms {characters / best / 1e6:>8.2f} Mchars/s")
+
+    sys.exit(1 if mismatches > 0 else 0)
+
+if __name__ == "__main__":
+    main()
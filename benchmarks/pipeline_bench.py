@@ -0,0 +1,234 @@
+"""
+Offline end-to-end latency benchmark of the assistant pipeline.
+
+Runs the real Assistant (capture ring, wake word loop, VAD endpointing, STT session, turn worker,
+phrase splitting, TTS pool and player callback) against local fakes of the mic, the speaker, Google STT,
+OpenAI and Riva, whose latencies are configurable. Each turn is timed from the wake word to the first
+audible sample, and split into stages:
+
+    wake        capture of the wake word frame -> detection
+    endpoint    wake word -> end of the STT audio stream (speech + trailing silence)
+    stt         end of the STT audio stream -> final transcript
+    llm         chat request -> first token (a speculative request starts before the final transcript)
+    tts         first token -> first audible sample
+    response    end of the STT audio stream -> first audible sample, the latency the user perceives
+    command     end of the STT audio stream -> command carried out, with --command_latency
+
+It also reports the CPU time of each thread and the real-time factor (CPU seconds per second of mic audio).
+
+Run from the repository root, either on a generated scenario of tone "utterances":
+    python -m benchmarks.pipeline_bench --turns 5
+or on a recording, with the wake word times in seconds:
+    python -m benchmarks.pipeline_bench --wav session.wav --wake_times 1.2 9.8
+"""
+import argparse
+import os
+import re
+import tempfile
+import threading
+import time
+import wave
+import numpy as np
+from benchmarks.fakes import (Recorder, Latency, WaveMicrophone, FakeSpeaker, ScheduledWakeWord, FakeSTT, FakeChat,
+                              FakeSynthesisService, FakeCommandBackend)
+from commands import CommandExecutor
+from assistant import Assistant
+from riva_wrap import RivaTTS
+from tracing import Tracer
+
+REPLY = ("Sure, here is the forecast. Tomorrow will be mostly sunny with a high of twenty two degrees, "
+         "and a light breeze from the west in the afternoon. Enjoy your day!")
+
+STAGES = [
+    ("wake", None, None),
+    ("endpoint", "wake", "stt_audio_end"),
+    ("stt", "stt_audio_end", "stt_final"),
+    ("llm", "chat_request", "first_token"),
+    ("tts", "first_token", "first_audio"),
+    ("response", "stt_audio_end", "first_audio"),
+    ("command", "stt_audio_end", "command_done"),
+]
+
+# "Thread-3 (_feed_stt)" -> "_feed_stt", "riva-tts_2" -> "riva-tts"
+THREAD_NUMBER = re.compile(r"^Thread-\d+ \(|\)$|_\d+$")
+
+def write_wav(path, pcm, rate):
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+
+def make_scenario(path, turns, rate=16000, lead=1.0, speech=1.5, gap=12.0):
+    """
+    Writes a WAV file of `turns` utterances, each a voiced tone right after a wake word, and returns the wake word times.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(speech * rate)) / rate
+    # A harmonic tone with a syllable-like envelope, which the VAD classifies as speech.
+    voice = sum(np.sin(2 * np.pi * f * t) / k for k, f in enumerate((140, 280, 420), start=1))
+    voice *= 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 3 * t))
+    voice = voice / np.max(np.abs(voice)) * 0.3
+
+    parts = []
+    wake_times = []
+    position = 0.0
+    for _ in range(turns):
+        parts.append(rng.normal(0, 0.002, int(lead * rate)))
+        position += lead
+        wake_times.append(position)
+        parts.append(voice + rng.normal(0, 0.002, len(voice)))
+        parts.append(rng.normal(0, 0.002, int(gap * rate)))
+        position += speech + gap
+    pcm = (np.concatenate(parts) * 32767).astype(np.int16).tobytes()
+    write_wav(path, pcm, rate)
+    return wake_times
+
+class ThreadCPU(object):
+    """
+    Samples the CPU time of every thread of the process from /proc, so threads that exit are still counted.
+    """
+
+    def __init__(self, interval=0.2):
+        self._interval = interval
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._times = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cpu-sampler", daemon=True)
+
+    def _sample(self):
+        names = {t.native_id: t.name for t in threading.enumerate()}
+        for tid in os.listdir("/proc/self/task"):
+            try:
+                with open(f"/proc/self/task/{tid}/stat", "r") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except FileNotFoundError:
+                continue
+            # utime and stime are fields 14 and 15 of stat, counted from 1 including pid and comm.
+            cpu = (int(fields[11]) + int(fields[12])) / self._ticks
+            name = names.get(int(tid), self._times.get(int(tid), (f"native-{tid}", 0))[0])
+            self._times[int(tid)] = (name, cpu)
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._sample()
+
+    def by_name(self):
+        """
+        Returns the CPU seconds per thread name, with numbered threads of the same target or pool grouped.
+        """
+        totals = {}
+        for name, cpu in self._times.values():
+            group = THREAD_NUMBER.sub("", name)
+            totals[group] = totals.get(group, 0.0) + cpu
+        return totals
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+    return f"p50 {p50:7.1f} ms  p90 {p90:7.1f} ms  p99 {p99:7.1f} ms  (n={len(values)})"
+
+def report(recorder, cpu, audio_seconds, cpu_seconds, speculator=None):
+    print(f"{'Stage':<10} Latency")
+    for stage, start, end in STAGES:
+        if start is None:
+            values = [turn["wake_delay"] for turn in recorder.turns]
+        else:
+            values = [turn[end] - turn[start] for turn in recorder.turns if start in turn and end in turn]
+            if not values and stage == "command":
+                continue
+        print(f"{stage:<10} {percentiles(values)}")
+
+    incomplete = sum(1 for turn in recorder.turns if "first_audio" not in turn)
+    if incomplete > 0:
+        print(f"{incomplete} of {len(recorder.turns)} turns never played audio")
+    commanded = [turn for turn in recorder.turns if "command_done" in turn and "first_audio" in turn]
+    if commanded:
+        early = sum(1 for turn in commanded if turn["command_done"] <= turn["first_audio"])
+        print(f"Commands carried out before the reply started playing: {early} of {len(commanded)}")
+    if speculator is not None:
+        stats = speculator.stats()
+        print(f"Speculation: {stats['launched']} launched, {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['wasted_tokens']} wasted tokens")
+
+    print()
+    print(f"{'Thread':<24} CPU")
+    for name, seconds in sorted(cpu.by_name().items(), key=lambda item: -item[1]):
+        if seconds > 0:
+            print(f"{name:<24} {seconds:7.3f} s")
+    print(f"Process CPU {cpu_seconds:.2f} s over {audio_seconds:.1f} s of audio, real-time factor {cpu_seconds / audio_seconds:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the latency of the assistant pipeline against fake services.")
+    parser.add_argument("--wav", type=str, help="A 16 kHz 16 bit mono recording. Generated if not given.")
+    parser.add_argument("--wake_times", type=float, nargs="+", help="The wake word times of --wav, in seconds.")
+    parser.add_argument("--turns", type=int, default=5, help="The number of turns of the generated scenario.")
+    parser.add_argument("--speed", type=float, default=1.0, help="How much faster than real time the mic and speaker run.")
+    parser.add_argument("--stt_latency", type=float, default=0.25, help="STT latency after the audio stream ends, in seconds.")
+    parser.add_argument("--llm_latency", type=float, default=0.4, help="Latency of the first chat token, in seconds.")
+    parser.add_argument("--token_interval", type=float, default=0.02, help="Interval between chat tokens, in seconds.")
+    parser.add_argument("--tts_latency", type=float, default=0.08, help="Base latency of a synthesis request, in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.2, help="The standard deviation of each latency, relative to its mean.")
+    parser.add_argument("--tts_workers", type=int, default=4, help="The number of concurrent synthesis requests.")
+    parser.add_argument("--command_latency", type=float, help="Start the reply with a command tag, carried out with this latency in seconds.")
+    parser.add_argument("--speaker_rate", type=int, default=48000, help="The native rate of the fake speaker, in Hz.")
+    parser.add_argument("--no_endpointing", action="store_true", help="Disable the local VAD endpointing.")
+    parser.add_argument("--no_aec", action="store_true", help="Disable echo cancellation.")
+    parser.add_argument("--speculation_ms", type=int, default=300, help="Stability window of speculative chat requests, negative to disable.")
+    parser.add_argument("--trace", type=str, help="Also write the assistant's own turn traces to this JSONL file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = args.wav
+        wake_times = args.wake_times
+        if wav_path is None:
+            wav_path = os.path.join(tmp, "scenario.wav")
+            wake_times = make_scenario(wav_path, args.turns)
+        elif not wake_times:
+            parser.error("--wake_times is required with --wav")
+
+        # A silent chime, so any sound the speaker plays is the reply.
+        chime_path = os.path.join(tmp, "chime.wav")
+        write_wav(chime_path, bytes(2 * 1600), 16000)
+
+        def latency(mean, seed):
+            return Latency(mean, args.jitter * mean, seed=seed)
+
+        recorder = Recorder()
+        mic = WaveMicrophone(wav_path, speed=args.speed)
+        speaker = FakeSpeaker(recorder, speed=args.speed, native_rate=args.speaker_rate)
+        wake = ScheduledWakeWord(recorder, mic, wake_times)
+        stt_latency = latency(args.stt_latency, 1)
+        reply = REPLY if args.command_latency is None else "[Lights on] " + REPLY
+        commands = CommandExecutor(FakeCommandBackend(recorder, latency(args.command_latency, 5))) if args.command_latency is not None else None
+        chat = FakeChat(recorder, reply, latency(args.llm_latency, 2), latency(args.token_interval, 3))
+        tts = RivaTTS(api_url=None, max_workers=args.tts_workers, service=FakeSynthesisService(latency(args.tts_latency, 4)))
+
+        cpu = ThreadCPU()
+        cpu.start()
+        cpu_start = time.process_time()
+        tracer = Tracer(args.trace)
+        assistant = Assistant(chat, tts, wake, endpointing=not args.no_endpointing, chime_path=chime_path, mic=mic, speaker=speaker,
+                              stt=FakeSTT(recorder, "what's the weather tomorrow", stt_latency), tracer=tracer,
+                              speculation_ms=args.speculation_ms if args.speculation_ms >= 0 else None, commands=commands,
+                              echo_cancellation=not args.no_aec)
+        assistant.run()
+        cpu_seconds = time.process_time() - cpu_start
+        cpu.stop()
+        assistant.player.stop()
+        tracer.close()
+
+    print()
+    report(recorder, cpu, mic.duration, cpu_seconds, assistant.speculator)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures the polyphase resampler against the linear interpolation read_wave used before, on the
+rate pairs the assistant sees (Riva at 22050 Hz, the mic at 16 kHz, devices at 44.1 or 48 kHz).
+
+For each pair it reports the real-time factor (seconds of CPU per second of audio, for whole clips
+and for 20 ms chunks), and the signal to error ratio on a sweep of tones below the lower Nyquist
+frequency, against the exact resampled tones.
+
+Run from the repository root:
+    python -m benchmarks.resample_bench
+"""
+import argparse
+import time
+import numpy as np
+from devices.audio_format import Resampler, get_resampler
+
+PAIRS = [(22050, 16000), (22050, 44100), (22050, 48000), (16000, 48000), (44100, 48000), (48000, 16000)]
+TONES = [100, 440, 1000, 3000, 6000]
+
+def linear(samples, source_rate, target_rate):
+    # The previous read_wave resampling, kept here as the reference.
+    duration = len(samples) / source_rate
+    positions = np.arange(int(duration * target_rate)) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def tone(frequency, rate, length):
+    return 10000 * np.sin(2 * np.pi * frequency * np.arange(length) / rate)
+
+def signal_to_error(resample, source_rate, target_rate, seconds=1.0):
+    """
+    Returns:
+        float: The worst signal to error ratio in dB over TONES, ignoring the filter transients at the ends.
+    """
+    worst = np.inf
+    for frequency in TONES:
+        if frequency >= 0.45 * min(source_rate, target_rate):
+            continue
+        out = resample(tone(frequency, source_rate, int(source_rate * seconds)).astype(np.float32), source_rate, target_rate)
+        edge = target_rate // 100
+        expected = tone(frequency, target_rate, len(out))[edge:-edge]
+        error = out[edge:-edge] - expected
+        worst = min(worst, 10 * np.log10(np.mean(expected ** 2) / np.mean(error ** 2)))
+    return worst
+
+def time_per_second(fn, seconds, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the polyphase resampler.")
+    parser.add_argument("--seconds", type=float, default=10.0, help="The length of the clips.")
+    parser.add_argument("--repeat", type=int, default=5, help="The runs per measurement, the fastest counts.")
+    args = parser.parse_args()
+
+    polyphase = lambda samples, source_rate, target_rate: get_resampler(source_rate, target_rate)(samples)
+    rng = np.random.default_rng(0)
+
+    print(f"{'Rate pair':<14} {'Taps':>4} {'Setup':>8}  {'RTF clip':>9} {'RTF 20ms':>9} {'SER':>8}  {'RTF linear':>10} {'SER linear':>10}")
+    for source_rate, target_rate in PAIRS:
+        start = time.perf_counter()
+        resampler = Resampler(source_rate, target_rate)
+        setup = time.perf_counter() - start
+        get_resampler(source_rate, target_rate)
+
+        samples = rng.normal(0, 3000, int(source_rate * args.seconds)).astype(np.float32)
+        chunk = source_rate // 50
+        chunks = [samples[i:i + chunk] for i in range(0, len(samples), chunk)]
+
+        clip = time_per_second(lambda: resampler(samples), args.seconds, args.repeat)
+        chunked = time_per_second(lambda: [resampler(c) for c in chunks], args.seconds, args.repeat)
+        reference = time_per_second(lambda: linear(samples, source_rate, target_rate), args.seconds, args.repeat)
+        print(f"{source_rate:>5} -> {target_rate:<5} {resampler.taps:>4} {setup * 1000:6.1f}ms  {clip:9.5f} {chunked:9.5f} "
+              f"{signal_to_error(polyphase, source_rate, target_rate):6.1f}dB  {reference:10.5f} {signal_to_error(linear, source_rate, target_rate):8.1f}dB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Measures how many rooms one process can serve in real time.
+
+Runs a Supervisor with 1, 2, 4, ... rooms against the fakes of pipeline_bench. Every room hears the
+same generated scenario, with the wake words of each room shifted by --stagger seconds, so replies
+overlap and compete for the shared TTS pool. For each room count it reports the CPU time per second
+of audio (the cores the rooms keep busy), the response latency over all rooms and of the worst room,
+and the longest wait of a synthesis request in the fair pool.
+
+A room count is sustained in real time if it keeps less than one core busy (Python threads share one
+core for Python code) and the worst room's p90 response stays within --max_slowdown of a single room.
+The fakes cost almost no CPU, so the real wake word detector and network clients lower the result.
+
+Run from the repository root:
+    python -m benchmarks.rooms_bench --rooms 1 2 4 8 --speed 4
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.fakes import Recorder, Latency, WaveMicrophone, FakeSpeaker, ScheduledWakeWord, FakeSTT, FakeChat, FakeSynthesisService
+from benchmarks.pipeline_bench import REPLY, make_scenario, write_wav
+from riva_wrap import RivaTTS
+from rooms import Supervisor
+from tracing import Tracer
+
+def run(count, args, wav_path, wake_times, chime_path):
+    """
+    Returns:
+        tuple: The per-room recorders, the process CPU seconds, the audio seconds per room and the supervisor.
+    """
+    def latency(mean, seed):
+        return Latency(mean, args.jitter * mean, seed=seed)
+
+    tts = RivaTTS(api_url=None, service=FakeSynthesisService(latency(args.tts_latency, 4)))
+    supervisor = Supervisor(chat=None, tts=tts, stt=None, tracer=Tracer(), tts_workers=args.tts_workers)
+    recorders = []
+    mics = []
+    for i in range(count):
+        recorder = Recorder()
+        mic = WaveMicrophone(wav_path, speed=args.speed)
+        room_wake_times = [t + i * args.stagger for t in wake_times]
+        supervisor.add_room(f"room{i}", ScheduledWakeWord(recorder, mic, room_wake_times), mic=mic,
+                            speaker=FakeSpeaker(recorder, speed=args.speed), chime_path=chime_path,
+                            chat=FakeChat(recorder, REPLY, latency(args.llm_latency, 10 + i), latency(args.token_interval, 20 + i)),
+                            stt=FakeSTT(recorder, "what's the weather tomorrow", latency(args.stt_latency, 30 + i)))
+        recorders.append(recorder)
+        mics.append(mic)
+
+    cpu_start = time.process_time()
+    supervisor.run()
+    cpu_seconds = time.process_time() - cpu_start
+    for room in supervisor.rooms.values():
+        room.assistant.player.stop()
+    tts._pool.shutdown(wait=False)
+    supervisor.pool.shutdown(wait=False)
+    return recorders, cpu_seconds, mics[0].duration, supervisor
+
+def responses(recorder):
+    return [turn["first_audio"] - turn["stt_audio_end"] for turn in recorder.turns if "first_audio" in turn and "stt_audio_end" in turn]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how many rooms one process serves in real time.")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1, 2, 4, 8], help="The room counts to run.")
+    parser.add_argument("--turns", type=int, default=3, help="The turns per room.")
+    parser.add_argument("--stagger", type=float, default=0.3, help="The shift of each room's wake words against the previous room, in seconds.")
+    parser.add_argument("--speed", type=float, default=1.0, help="How much faster than real time the mics and speakers run.")
+    parser.add_argument("--stt_latency", type=float, default=0.25, help="STT latency after the audio stream ends, in seconds.")
+    parser.add_argument("--llm_latency", type=float, default=0.4, help="Latency of the first chat token, in seconds.")
+    parser.add_argument("--token_interval", type=float, default=0.02, help="Interval between chat tokens, in seconds.")
+    parser.add_argument("--tts_latency", type=float, default=0.08, help="Base latency of a synthesis request, in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.2, help="The standard deviation of each latency, relative to its mean.")
+    parser.add_argument("--tts_workers", type=int, default=4, help="The concurrent synthesis requests of all rooms.")
+    parser.add_argument("--max_slowdown", type=float, default=1.5, help="The worst room's p90 response, relative to one room, that still counts as sustained.")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = os.path.join(tmp, "scenario.wav")
+        wake_times = make_scenario(wav_path, args.turns)
+        chime_path = os.path.join(tmp, "chime.wav")
+        write_wav(chime_path, bytes(2 * 1600), 16000)
+        for count in args.rooms:
+            recorders, cpu_seconds, audio_seconds, supervisor = run(count, args, wav_path, wake_times, chime_path)
+            all_responses = [r for recorder in recorders for r in responses(recorder)]
+            worst_p90 = max(np.percentile(responses(recorder), 90) if responses(recorder) else np.inf for recorder in recorders)
+            max_wait = max(room["tts"].get("max_wait_ms", 0.0) for room in supervisor.stats().values())
+            # The CPU of one room's audio is what a real-time stream costs, whatever the speed.
+            cores = cpu_seconds / audio_seconds
+            results.append((count, cores, all_responses, worst_p90, max_wait))
+
+    print()
+    print(f"{'Rooms':>5} {'Cores':>6} {'Response p50':>13} {'p90':>9} {'Worst room p90':>15} {'TTS max wait':>13}")
+    baseline = None
+    sustained = 0
+    for count, cores, all_responses, worst_p90, max_wait in results:
+        p50, p90 = np.percentile(all_responses, [50, 90]) * 1000 if all_responses else (np.nan, np.nan)
+        print(f"{count:>5} {cores:6.3f} {p50:10.1f} ms {p90:6.1f} ms {worst_p90 * 1000:12.1f} ms {max_wait:10.1f} ms")
+        if baseline is None:
+            baseline = worst_p90
+        if cores < 1.0 and worst_p90 <= baseline * args.max_slowdown:
+            sustained = max(sustained, count)
+
+    count, cores = results[-1][0], results[-1][1]
+    print(f"Sustained in real time: {sustained} rooms. At {cores / count:.4f} cores per room, CPU alone would allow about {int(count / cores) if cores > 0 else 0} rooms per core.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Offline evaluation of the local VAD endpointing on 16 kHz, 16 bit mono WAV files.
+
+Each file is fed through a VADEndpointer in mic-sized chunks, as STTAction would receive it. For each
+file it reports where speech was detected, how much audio would have been sent to STT, and the
+processing real-time factor. With a labels file, it also reports the onset error, the endpointing
+delay after the labelled end of speech, and the frame accuracy of the detector.
+
+Run from the repository root:
+    python -m benchmarks.vad_eval recordings/*.wav --labels labels.json
+
+The labels file maps WAV file names to lists of [start, end] speech segments in seconds.
+"""
+import argparse
+import json
+import os
+import time
+import wave
+import numpy as np
+from vad import VoiceActivityDetector, VADEndpointer
+
+def read_wav(path):
+    with wave.open(path, "rb") as wf:
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected 16 bit mono audio")
+        return wf.getframerate(), wf.readframes(wf.getnframes())
+
+def evaluate(path, pcm, rate, args, labels=None):
+    vad = VoiceActivityDetector(sample_rate=rate, frame_ms=args.frame_ms)
+    endpointer = VADEndpointer(vad, trailing_silence_ms=args.trailing_silence_ms, no_speech_timeout_ms=args.no_speech_timeout_ms)
+    frame_s = vad.frame_length / rate
+    chunk_bytes = 2 * args.chunk_size
+
+    sent = 0
+    start = time.perf_counter()
+    for offset in range(0, len(pcm), chunk_bytes):
+        chunk = pcm[offset:offset + chunk_bytes]
+        if not endpointer.ended:
+            sent += len(endpointer.process(chunk))
+    elapsed = time.perf_counter() - start
+
+    duration = len(pcm) / 2 / rate
+    result = {
+        "file": os.path.basename(path),
+        "duration_s": duration,
+        "speech_start_s": None if endpointer.speech_start_frame is None else endpointer.speech_start_frame * frame_s,
+        "speech_end_s": None if endpointer.speech_end_frame is None else endpointer.speech_end_frame * frame_s,
+        "closed_at_s": endpointer.frames_seen * frame_s if endpointer.ended else None,
+        "sent_fraction": sent / len(pcm) if len(pcm) > 0 else 0.0,
+        "rtf": elapsed / duration if duration > 0 else 0.0,
+    }
+
+    if labels:
+        first_start = min(s for s, _ in labels)
+        last_end = max(e for _, e in labels)
+        if result["speech_start_s"] is not None:
+            result["onset_error_s"] = result["speech_start_s"] - first_start
+        if result["closed_at_s"] is not None:
+            result["endpoint_delay_s"] = result["closed_at_s"] - last_end
+
+        frame_vad = VoiceActivityDetector(sample_rate=rate, frame_ms=args.frame_ms)
+        predicted = np.concatenate([frame_vad.process(pcm[o:o + chunk_bytes]) for o in range(0, len(pcm), chunk_bytes)])
+        times = (np.arange(len(predicted)) + 0.5) * frame_s
+        truth = np.zeros(len(predicted), dtype=bool)
+        for s, e in labels:
+            truth |= (times >= s) & (times < e)
+        result["frame_accuracy"] = float(np.mean(predicted == truth)) if len(truth) > 0 else 0.0
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline VAD endpointing evaluation")
+    parser.add_argument("files", nargs="+", help="16 bit mono WAV files")
+    parser.add_argument("--labels", type=str, default=None, help="A JSON file of labelled speech segments per file")
+    parser.add_argument("--chunk_size", type=int, default=512, help="Samples per mic chunk")
+    parser.add_argument("--frame_ms", type=int, default=20, help="VAD frame length in ms")
+    parser.add_argument("--trailing_silence_ms", type=int, default=700, help="Silence that ends an utterance")
+    parser.add_argument("--no_speech_timeout_ms", type=int, default=5000, help="How long to wait for speech")
+    args = parser.parse_args()
+
+    labels = {}
+    if args.labels is not None:
+        with open(args.labels, "r") as f:
+            labels = json.load(f)
+
+    results = []
+    for path in args.files:
+        rate, pcm = read_wav(path)
+        result = evaluate(path, pcm, rate, args, labels.get(os.path.basename(path)))
+        results.append(result)
+        print(json.dumps(result))
+
+    sent = np.mean([r["sent_fraction"] for r in results])
+    rtf = np.mean([r["rtf"] for r in results])
+    print(f"[VAD] {len(results)} files, {sent * 100:.1f}% of audio sent on average, real-time factor {rtf:.4f}")
+    delays = [r["endpoint_delay_s"] for r in results if "endpoint_delay_s" in r]
+    if delays:
+        print(f"[VAD] Endpoint delay after labelled end of speech: mean {np.mean(delays):.3f}s, max {np.max(delays):.3f}s")
+
+if __name__ == "__main__":
+    main()
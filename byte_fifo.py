@@ -1,20 +1,276 @@
+from enum import Enum
+import threading
+import time
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    GROW = "grow"
+
 class ByteFIFO(object):
-    def __init__(self):
-        self._buf = bytearray()
+    """
+    A preallocated, thread-safe ring buffer of bytes.
+
+    Reads and writes copy straight into and out of a single fixed buffer, so no read ever shifts
+    the remaining data and a long backlog costs the same per read as a short one. Readers can block
+    until data arrives, and the policy decides what a write does when the buffer is full.
+
+    CPython already makes removing from the front of a bytearray cheap, so the ring is not faster than
+    a bare bytearray behind a lock for small reads and writes. In benchmarks/byte_fifo_bench.py it runs
+    at 0.5-0.8x for 1 KiB mic chunks, 1.2-1.8x for a backlog read in 1 KiB pieces, and 0.9-1.7x for
+    playback into a reused buffer. What it adds is blocking reads, bounded memory and no allocation in readinto().
+
+    Args:
+        capacity (int): The initial size of the buffer in bytes (default: 1 MiB).
+        overflow (OverflowPolicy): What to do when a write does not fit (default: GROW).
+    """
+
+    def __init__(self, capacity=1 << 20, overflow=OverflowPolicy.GROW):
+        if capacity <= 0:
+            raise ValueError(f"Capacity must be positive, received {capacity}.")
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._capacity = capacity
+        self._overflow = OverflowPolicy(overflow)
+        self._grows = self._overflow is OverflowPolicy.GROW
+        self._read = 0
+        self._size = 0
+        self._closed = False
+        self.dropped = 0
+        self._waiting = 0
+        # The hot paths take the bare lock, which is cheaper to enter than the condition.
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+
+        buf = bytearray(capacity)
+        self._copy_out(buf, self._size)
+        self._buf = buf
+        self._view = memoryview(buf)
+        self._capacity = capacity
+        self._read = 0
+
+    def _copy_out(self, dest, size):
+        # Copies `size` bytes from the read position into `dest` without consuming them.
+        read = self._read
+        first = min(size, self._capacity - read)
+        dest[:first] = self._view[read:read + first]
+        if size > first:
+            dest[first:size] = self._view[:size - first]
+
+    def _slice(self, size):
+        read = self._read
+        end = read + size
+        if end <= self._capacity:
+            return self._view[read:end].tobytes()
+        return self._view[read:].tobytes() + self._view[:end - self._capacity].tobytes()
+
+    def _copy_in(self, data):
+        # Writes through the memoryview, which is much cheaper than bytearray slice assignment.
+        capacity = self._capacity
+        write = self._read + self._size
+        if write >= capacity:
+            write -= capacity
+        end = write + len(data)
+        if end <= capacity:
+            self._view[write:end] = data
+        else:
+            first = capacity - write
+            self._view[write:] = data[:first]
+            self._view[:end - capacity] = data[first:]
+        self._size += len(data)
+
+    def _consume(self, size):
+        self._size -= size
+        if self._size == 0:
+            self._read = 0
+        else:
+            self._read = (self._read + size) % self._capacity
+
+    def _readable(self):
+        return self._size > 0 or self._closed
+
+    def _wait(self, predicate, timeout):
+        # Waiters are counted so the uncontended paths can skip notify_all().
+        self._waiting += 1
+        try:
+            return self._cond.wait_for(predicate, timeout)
+        finally:
+            self._waiting -= 1
 
-    def put(self, data):
-        self._buf.extend(data)
+    def put(self, data, timeout=None):
+        """
+        Appends data to the buffer.
 
-    def get(self, size):
-        data = self._buf[:size]
-        self._buf[:size] = b''
-        return data
+        Args:
+            data (bytes-like): The data to append.
+            timeout (float): How long a BLOCK buffer waits for room (default: forever).
+
+        Returns:
+            int: The number of bytes written. Less than len(data) only if a BLOCK buffer timed out,
+                 or the buffer is closed.
+        """
+        if type(data) is not bytes and not isinstance(data, bytearray):
+            data = memoryview(data).cast("B")
+        size = len(data)
+        with self._lock:
+            if self._closed:
+                return 0
+
+            if self._grows:
+                if self._size + size > self._capacity:
+                    self._grow(self._size + size)
+                # _copy_in(), inlined as this is the hottest path.
+                write = self._read + self._size
+                if write >= self._capacity:
+                    write -= self._capacity
+                if write + size <= self._capacity:
+                    self._view[write:write + size] = data
+                else:
+                    self._copy_in(data)
+                    size = 0
+                self._size += size
+                if self._waiting:
+                    self._cond.notify_all()
+                return len(data)
+
+            if self._overflow is OverflowPolicy.DROP_OLDEST:
+                capacity = self._capacity
+                if len(data) > capacity:
+                    self.dropped += len(data) - capacity
+                    data = data[-capacity:]
+                excess = self._size + len(data) - capacity
+                if excess > 0:
+                    self.dropped += excess
+                    self._consume(excess)
+                self._copy_in(data)
+                if self._waiting:
+                    self._cond.notify_all()
+                return len(data)
+
+            written = 0
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while written < len(data):
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                if not self._wait(lambda: self._closed or self._size < self._capacity, remaining):
+                    break
+                if self._closed:
+                    break
+                n = min(len(data) - written, self._capacity - self._size)
+                self._copy_in(data[written:written + n])
+                written += n
+                if self._waiting:
+                    self._cond.notify_all()
+            return written
+
+    def readinto(self, buf, timeout=0):
+        """
+        Moves up to len(buf) bytes into a caller-owned buffer, without allocating.
+
+        Args:
+            buf (writable bytes-like): The destination buffer.
+            timeout (float): How long to wait for data. 0 returns immediately, None waits until data
+                             arrives or the buffer is closed (default: 0).
+
+        Returns:
+            int: The number of bytes read. 0 if no data arrived in time, or the buffer is closed and empty.
+        """
+        if not isinstance(buf, bytearray):
+            buf = memoryview(buf).cast("B")
+        with self._lock:
+            # timeout == 0 never waits, None waits forever.
+            if self._size == 0 and timeout != 0:
+                self._wait(self._readable, timeout)
+            size = min(len(buf), self._size)
+            if size > 0:
+                self._copy_out(buf, size)
+                self._consume(size)
+                if self._waiting:
+                    self._cond.notify_all()
+            return size
+
+    def get(self, size, timeout=0):
+        """
+        Removes and returns up to `size` bytes, waiting up to `timeout` for any data to arrive.
+        See readinto() for the meaning of timeout.
+
+        Returns:
+            bytes: The data, immutable as protobuf requires of e.g. STT audio_content.
+        """
+        with self._lock:
+            if self._size == 0 and timeout != 0:
+                self._wait(self._readable, timeout)
+            if size > self._size:
+                size = self._size
+            if size <= 0:
+                return b""
+            # _slice() and _consume(), inlined as this is the hottest path.
+            read = self._read
+            end = read + size
+            if end < self._capacity:
+                data = self._view[read:end].tobytes()
+            else:
+                data = self._slice(size)
+                end -= self._capacity
+            self._size -= size
+            self._read = end if self._size else 0
+            if self._waiting:
+                self._cond.notify_all()
+            return data
 
     def peek(self, size):
-        return self._buf[:size]
-    
+        with self._lock:
+            return self._slice(min(size, self._size))
+
+    def wait_nonempty(self, timeout=None):
+        """
+        Blocks until the buffer holds data or is closed.
+
+        Returns:
+            bool: True if data is available.
+        """
+        with self._lock:
+            self._wait(self._readable, timeout)
+            return self._size > 0
+
+    def wait_size(self, size, timeout=None):
+        """
+        Blocks until the buffer holds at least `size` bytes or is closed.
+
+        Returns:
+            bool: True if `size` bytes are available.
+        """
+        with self._lock:
+            if self._size < size:
+                self._wait(lambda: self._size >= size or self._closed, timeout)
+            return self._size >= size
+
     def clear(self):
-        self._buf = bytearray()
+        with self._lock:
+            self._read = 0
+            self._size = 0
+            if self._waiting:
+                self._cond.notify_all()
+
+    def close(self):
+        """
+        Wakes every blocked reader and writer. Remaining data can still be read, later puts are ignored.
+        """
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
 
     def __len__(self):
-        return len(self._buf)
+        return self._size
@@ -1,10 +1,16 @@
 import openai
+import httpx
+import copy
 import json
 from riva_wrap import RivaTTS
+from chat_context import ChatContext, TokenCounter
+from intents import SURE_REPLY
+import threading
 import time
+import re
 
-"""
-You are GLaDOS from Portal. You will answer with the classic GLaDOS sarcasm, while still remaining credible.  You will be conscise and to the point. If possible, your replies will contain references to the portal game.
+# Appended to the system prompt when commands are enabled. commands.strip_commands() removes the tags from the spoken reply.
+COMMAND_PROMPT = """
 The user will either just chat with you, or request a command. If a command is detected, specify the commands name and each parameter, all enclosed with square parantheses. You must specify all parameters. You must obey and say something after the command.
 Command List:
 [PlayMusic]
@@ -17,7 +23,7 @@ Command List:
 
 
 
-SYSTEM_PROMPT = "You are GLaDOS from Portal. You will answer with the classic GLaDOS sarcasm, while still remaining credible.  You will be conscise and to the point. If possible, your replies will contain references to the portal game. If you are asked to stop or shut up, just reply \"Sure\""
+SYSTEM_PROMPT = "You are GLaDOS from Portal. You will answer with the classic GLaDOS sarcasm, while still remaining credible.  You will be conscise and to the point. If possible, your replies will contain references to the portal game. If you are asked to stop or shut up, just reply \"" + SURE_REPLY + "\""
 
 def get_message(role, text):
     return {
@@ -30,40 +36,226 @@ def get_message(role, text):
         ]
     }
 
-def get_system_message():
-    return get_message("system", SYSTEM_PROMPT)
+def get_system_message(commands=False):
+    return get_message("system", SYSTEM_PROMPT + COMMAND_PROMPT if commands else SYSTEM_PROMPT)
+
+SUMMARY_PROMPT = "Summarize the following conversation between a user and an assistant in at most three sentences. Keep names, facts and requests the assistant may need later. If a previous summary is given, merge it into the new one."
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=\S[.!?;:])\s+|\n+')
+CLAUSE_BOUNDARY = re.compile(r'(?<=\S[,)\]])\s+')
+WHITESPACE = re.compile(r'\s+')
+
+def split_phrases(deltas, min_clause_length=40, max_length=RivaTTS.MAX_CHARACTERS):
+    """
+    Cuts a stream of text deltas into speakable phrases as soon as they are complete.
+
+    A phrase ends on a sentence boundary, or on a comma once it is at least min_clause_length characters long.
+    A phrase that grows past max_length without a boundary is cut on its last whitespace, or right after
+    its first word if that word alone is longer.
+
+    Args:
+        deltas (iterable): The text deltas, e.g. from Chat.chat_stream().
+        min_clause_length (int): The minimum length of a phrase cut on a comma (default: 40).
+        max_length (int): The maximum length of a phrase (default: RivaTTS.MAX_CHARACTERS).
+
+    Yields:
+        str: The phrases, in order.
+    """
+    buff = ""
+    for delta in deltas:
+        buff += delta
+        while True:
+            match = SENTENCE_BOUNDARY.search(buff)
+            if match is None:
+                match = CLAUSE_BOUNDARY.search(buff, min_clause_length)
+            if match is None and len(buff) > max_length:
+                cut = buff.rfind(" ", 0, max_length)
+                match = WHITESPACE.match(buff, cut) if cut > 0 else WHITESPACE.search(buff, max_length)
+            if match is None:
+                break
+
+            phrase = buff[:match.start()].strip()
+            buff = buff[match.end():]
+            if phrase:
+                yield phrase
+
+    if buff.strip():
+        yield buff.strip()
+
+class ChatStream(object):
+    """
+    A streaming chat reply. Iterating yields the text deltas as they arrive. With a request, the request
+    and the reply are appended to the chat history together once the stream ends, unless it was cancelled,
+    failed or returned no text, so the history never holds a request without its reply.
+
+    cancel() may be called from any thread, and aborts the underlying HTTP stream.
+    If a TurnTrace is given, the first delta and the end of the stream are marked on it.
+    """
+
+    def __init__(self, chat, response, trace=None, request=None):
+        self._chat = chat
+        self._response = response
+        self._trace = trace
+        self._request = request
+        self._cancelled = threading.Event()
+        self.text = ""
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._response.close()
+
+    def __iter__(self):
+        try:
+            for chunk in self._response:
+                if self.cancelled:
+                    break
+                if len(chunk.choices) == 0:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if self._trace is not None:
+                        self._trace.mark("chat_first_token")
+                    self.text += delta
+                    yield delta
+            if self.text and self._request is not None and not self.cancelled:
+                self._chat.add_exchange(self._request, self.text)
+        except Exception:
+            # Closing the stream from another thread makes the pending read fail.
+            if not self.cancelled:
+                raise
+        finally:
+            if self._trace is not None:
+                self._trace.mark("chat_response")
 
 class Chat(object):
-    def __init__(self, api_key, model="gpt-3.5-turbo-16k", chat_elpased_time=60):
-        self.openai = openai.OpenAI(api_key=api_key)
+    """
+    A GLaDOS conversation with OpenAI's chat API.
+
+    The history is kept under max_context_tokens by a ChatContext. With summarize, the exchanges it evicts
+    are summarized in the background, so older context survives in a compact form. After chat_elpased_time
+    seconds without a request, everything but the last exchange is evicted (and summarized) at once.
+
+    Requests share a pool of HTTP connections, which are kept open for keepalive_expiry seconds
+    between requests instead of httpx's default of 5 seconds.
+
+    Args:
+        api_key (str): The OpenAI API key.
+        model (str): The chat model (default: "gpt-3.5-turbo-16k").
+        chat_elpased_time (float): The idle time in seconds after which the history is compacted (default: 60).
+        max_context_tokens (int): The token budget of each request's messages (default: 3000).
+        summarize (bool): Whether evicted history is summarized instead of dropped (default: True).
+        keepalive_expiry (float): How long idle connections are kept open, in seconds (default: 120).
+        commands (bool): Whether the system prompt asks for command tags, see commands.py (default: False).
+    """
+
+    def __init__(self, api_key, model="gpt-3.5-turbo-16k", chat_elpased_time=60, max_context_tokens=3000, summarize=True, keepalive_expiry=120.0,
+                 commands=False):
+        http_client = httpx.Client(limits=httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=keepalive_expiry),
+                                   timeout=httpx.Timeout(60.0, connect=5.0))
+        self.openai = openai.OpenAI(api_key=api_key, http_client=http_client)
         self.last_prompt_time = 0
         self.model = model
         self.chat_elpased_time = chat_elpased_time
-        self.message_buff = []
-        self._reset_message_buff()
+        self.max_context_tokens = max_context_tokens
+        self.summarize = summarize
+        self.commands = commands
+        self.context = self._new_context(TokenCounter(model))
+
+    def _new_context(self, counter):
+        return ChatContext(get_system_message(self.commands), counter, max_tokens=self.max_context_tokens,
+                           summarizer=self._summarize if self.summarize else None)
 
-    def _reset_message_buff(self):
-        self.message_buff = [get_system_message()]
+    def conversation(self):
+        """
+        Returns a Chat with a history of its own, sharing this one's connection pool, e.g. for another room.
+        """
+        chat = copy.copy(self)
+        chat.last_prompt_time = 0
+        chat.context = self._new_context(self.context.counter)
+        return chat
+
+    @property
+    def message_buff(self):
+        return self.context.messages()
 
     def _did_message_reset_timeout_elapse(self):
         return time.time() - self.last_prompt_time > self.chat_elpased_time
 
-    def chat(self, text):
+    def _start_request(self):
         if self._did_message_reset_timeout_elapse():
-            self._reset_message_buff()
+            self.context.compact()
 
         self.last_prompt_time = time.time()
-        self.message_buff.append(get_message("user", text))
+
+    def _add_user_message(self, text):
+        self._start_request()
+        self.context.append(get_message("user", text))
+
+    def warm_up(self):
+        """
+        Opens a pooled connection to the API with a cheap request, ahead of the first chat request.
+        """
+        self.openai.models.retrieve(self.model)
+
+    def add_assistant_message(self, text):
+        self.context.append(get_message("assistant", text))
+
+    def add_exchange(self, text, reply):
+        """
+        Records a request that was answered without the chat model, so later requests have its context.
+        """
+        self._add_user_message(text)
+        self.add_assistant_message(reply)
+
+    def _summarize(self, previous_summary, messages):
+        lines = [f"Previous summary: {previous_summary}"] if previous_summary else []
+        for message in messages:
+            lines.append(f"{message['role']}: {' '.join(part['text'] for part in message['content'])}")
+
+        response = self.openai.chat.completions.create(
+            model=self.model,
+            messages=[get_message("system", SUMMARY_PROMPT), get_message("user", "\n".join(lines))],
+            max_tokens=150,
+        )
+        return response.choices[0].message.content
+
+    def chat(self, text):
+        self._add_user_message(text)
 
         response = self.openai.chat.completions.create(
             model=self.model,
             messages=self.message_buff,
         )
 
-        self.message_buff.append(get_message("assistant", response.choices[0].message.content))
-        print(len(self.message_buff))
+        self.add_assistant_message(response.choices[0].message.content)
         return response.choices[0].message.content
 
+    def chat_stream(self, text, trace=None, record=True) -> ChatStream:
+        """
+        Like chat(), but returns the reply as a ChatStream of text deltas as soon as the request is sent.
+        If a TurnTrace is given, the request and the stream are timed on it.
+
+        With record, the request and the reply are added to the history once the reply is complete, see
+        ChatStream. With record=False, they are not, e.g. for a speculative request. add_exchange()
+        records them if the reply is used.
+        """
+        if record:
+            self._start_request()
+        messages = self.message_buff + [get_message("user", text)]
+        if trace is not None:
+            trace.mark("chat_request")
+
+        response = self.openai.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+        )
+        return ChatStream(self, response, trace=trace, request=text if record else None)
+
 if __name__ == "__main__":
     with open("secrets.json", "r") as f:
         secrets = json.load(f)
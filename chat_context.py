@@ -0,0 +1,171 @@
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens added by the chat format around each message, and to prime the reply.
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+class TokenCounter(object):
+    """
+    Counts the tokens of chat messages with the model's tiktoken encoding, or estimates them at
+    about four characters per token if tiktoken is not installed.
+    """
+
+    def __init__(self, model):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_text(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    def count(self, message):
+        content = message["content"]
+        if isinstance(content, str):
+            return MESSAGE_OVERHEAD + self.count_text(content)
+        return MESSAGE_OVERHEAD + sum(self.count_text(part["text"]) for part in content if part.get("type") == "text")
+
+class ChatContext(object):
+    """
+    The conversation history sent with each chat request, kept under a token budget.
+
+    Every message is counted once when it is added. When the history exceeds max_tokens, the oldest
+    exchanges are evicted until it fits in low_water * max_tokens, so the history is trimmed in steps
+    rather than on every turn. The system prompt always comes first and never changes, and the rest of
+    the history only changes at its end between evictions, so provider-side prompt caching keeps applying.
+
+    With a summarizer, evicted exchanges are folded into a running summary on a background thread, which
+    is sent as a second system message. Requests never wait for it: they use the latest summary available.
+
+    Args:
+        system_message (dict): The system prompt message.
+        counter (TokenCounter): Counts the tokens of messages.
+        max_tokens (int): The token budget of the whole context, system prompt and summary included (default: 3000).
+        low_water (float): The fraction of max_tokens an eviction trims the context down to (default: 0.75).
+        summarizer (callable): Called as summarizer(previous_summary, messages) with the evicted messages,
+                               returns the new summary text. None drops evicted messages (default: None).
+    """
+
+    def __init__(self, system_message, counter: TokenCounter, max_tokens=3000, low_water=0.75, summarizer=None):
+        self.system_message = system_message
+        self.counter = counter
+        self._system_tokens = counter.count(system_message)
+        self.max_tokens = max_tokens
+        self.low_water = low_water
+        self._summarizer = summarizer
+        self._history = []
+        self._history_tokens = 0
+        self._summary = None
+        self._summary_text = None
+        self._summary_tokens = 0
+        self._evicted = []
+        self._summarizing = False
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @property
+    def tokens(self):
+        """
+        The token count of the next request.
+        """
+        with self._lock:
+            return self._system_tokens + self._summary_tokens + self._history_tokens + REPLY_OVERHEAD
+
+    @property
+    def summary(self):
+        return self._summary_text
+
+    def messages(self):
+        """
+        Returns:
+            list: The messages to send, starting with the system prompt.
+        """
+        with self._lock:
+            messages = [self.system_message]
+            if self._summary is not None:
+                messages.append(self._summary)
+            messages.extend(message for message, _ in self._history)
+            return messages
+
+    def append(self, message):
+        tokens = self.counter.count(message)
+        with self._lock:
+            self._history.append((message, tokens))
+            self._history_tokens += tokens
+            if self._system_tokens + self._summary_tokens + self._history_tokens + REPLY_OVERHEAD > self.max_tokens:
+                self._evict(int(self.max_tokens * self.low_water))
+
+    def compact(self, keep=2):
+        """
+        Evicts all but the last `keep` messages, e.g. once the conversation has been idle for a while.
+        """
+        with self._lock:
+            count = max(0, len(self._history) - keep)
+            while 0 < count < len(self._history) - 1 and self._history[count][0]["role"] != "user":
+                count += 1
+            self._evict_messages(count)
+
+    def clear(self):
+        with self._lock:
+            self._history = []
+            self._history_tokens = 0
+            self._summary = None
+            self._summary_text = None
+            self._summary_tokens = 0
+            self._evicted = []
+
+    def _evict(self, target):
+        # Must be called with the lock held. Whole exchanges are evicted, so the history never starts
+        # with an assistant reply, but the latest message is always kept.
+        count = 0
+        tokens = self._system_tokens + self._summary_tokens + self._history_tokens + REPLY_OVERHEAD
+        while count < len(self._history) - 1 and (tokens > target or self._history[count][0]["role"] != "user"):
+            tokens -= self._history[count][1]
+            count += 1
+        self._evict_messages(count)
+
+    def _evict_messages(self, count):
+        # Must be called with the lock held.
+        if count == 0:
+            return
+        evicted = self._history[:count]
+        self._history = self._history[count:]
+        self._history_tokens -= sum(tokens for _, tokens in evicted)
+        self.evictions += 1
+        if self._summarizer is not None:
+            self._evicted.extend(message for message, _ in evicted)
+            if not self._summarizing:
+                self._summarizing = True
+                threading.Thread(target=self._summarize, daemon=True).start()
+
+    def _summarize(self):
+        while True:
+            with self._lock:
+                evicted = self._evicted
+                self._evicted = []
+                previous = self._summary_text
+                if not evicted:
+                    self._summarizing = False
+                    return
+
+            try:
+                text = self._summarizer(previous, evicted)
+            except Exception as e:
+                print(f"[Chat] Summarizing the history failed: {e}")
+                continue
+
+            summary = {"role": "system", "content": [{"type": "text", "text": f"Summary of the earlier conversation: {text}"}]}
+            tokens = self.counter.count(summary)
+            with self._lock:
+                self._summary = summary
+                self._summary_text = text
+                self._summary_tokens = tokens
@@ -0,0 +1,225 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from tracing import Histogram, TurnTrace
+import threading
+import time
+
+# The commands of the chat protocol, as (name, parameter names). The last parameter of
+# BroadcastMessage takes the rest of the tag, spaces included.
+COMMANDS = [
+    ("PlayMusic", []),
+    ("StopMusic", []),
+    ("Lights", ["state"]),
+    ("LightsColor", ["color"]),
+    ("ACMain", ["state", "temp"]),
+    ("BroadcastMessage", ["message"]),
+]
+COMMAND_PARAMS = dict(COMMANDS)
+REST_PARAMS = {"message"}
+
+# Longer bracketed text is spoken as is, so an unmatched "[" cannot hold back the rest of the reply.
+MAX_TAG_LENGTH = 200
+
+class Command(object):
+    """
+    A parsed command tag, e.g. "[ACMain on 22]".
+
+    Attributes:
+        name (str): The command name.
+        params (dict): The parameters by name.
+        tag (str): The tag as written.
+    """
+
+    def __init__(self, name, params, tag):
+        self.name = name
+        self.params = params
+        self.tag = tag
+
+    def __repr__(self):
+        return self.tag
+
+def parse_command(tag):
+    """
+    Parses a command tag, with or without its brackets.
+
+    Returns:
+        Command: The command, or None if the tag is not a known command with the right parameters.
+    """
+    body = tag.strip()
+    if body.startswith("[") and body.endswith("]"):
+        body = body[1:-1].strip()
+    parts = body.split(None, 1)
+    if not parts or parts[0] not in COMMAND_PARAMS:
+        return None
+    name = parts[0]
+    names = COMMAND_PARAMS[name]
+    rest = parts[1] if len(parts) > 1 else ""
+    values = rest.split(None, len(names) - 1) if names and names[-1] in REST_PARAMS else rest.split()
+    if len(values) != len(names):
+        return None
+    return Command(name, dict(zip(names, values)), f"[{body}]")
+
+def strip_commands(deltas, on_command):
+    """
+    Removes command tags from a stream of text deltas as they arrive, so they are executed instead of spoken.
+
+    Text is passed through as soon as it cannot be part of a tag. From a "[" on, it is held back until the
+    tag closes: known commands go to on_command and are dropped, anything else is passed through as text.
+
+    Args:
+        deltas (iterable): The text deltas, e.g. from Chat.chat_stream().
+        on_command (callable): Receives each Command as soon as its tag is complete.
+
+    Yields:
+        str: The text deltas without command tags.
+    """
+    buff = ""
+    for delta in deltas:
+        buff += delta
+        out = []
+        while buff:
+            start = buff.find("[")
+            if start < 0:
+                out.append(buff)
+                buff = ""
+                break
+            if start > 0:
+                out.append(buff[:start])
+                buff = buff[start:]
+            end = buff.find("]")
+            if end < 0:
+                if len(buff) > MAX_TAG_LENGTH:
+                    out.append(buff[0])
+                    buff = buff[1:]
+                    continue
+                break
+            tag = buff[:end + 1]
+            buff = buff[end + 1:]
+            command = parse_command(tag)
+            if command is None:
+                out.append(tag)
+            else:
+                on_command(command)
+        text = "".join(out)
+        if text:
+            yield text
+    if buff:
+        yield buff
+
+class CommandBackend(object):
+    """
+    Carries out commands, e.g. by calling a home automation API. execute() runs on a worker thread of
+    the CommandExecutor, and raises if the command failed.
+    """
+
+    def execute(self, command: Command):
+        raise NotImplementedError()
+
+class LocalBackend(CommandBackend):
+    """
+    Logs commands instead of carrying them out, after an optional simulated latency, and keeps them
+    for inspection. For tests, benchmarks and setups without home automation.
+    """
+
+    def __init__(self, latency=0.0, verbose=True):
+        self.latency = latency
+        self.verbose = verbose
+        self.executed = []
+        self._lock = threading.Lock()
+
+    def execute(self, command: Command):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            self.executed.append(command)
+        if self.verbose:
+            print(f"[Command] {command.tag}")
+
+class WebhookBackend(CommandBackend):
+    """
+    Posts each command as JSON ({"command": name, "params": {...}}) to a URL, e.g. a Home Assistant webhook.
+    The HTTP connection is kept open between commands.
+    """
+
+    def __init__(self, url, timeout=5.0):
+        import httpx
+        self.url = url
+        self._client = httpx.Client(timeout=timeout)
+
+    def execute(self, command: Command):
+        response = self._client.post(self.url, json={"command": command.name, "params": command.params})
+        response.raise_for_status()
+
+class CommandExecutor(object):
+    """
+    Runs commands on a small thread pool as soon as they are parsed, so an action usually happens
+    before its spoken confirmation starts playing. Commands of the same name run in submission order,
+    e.g. "lights on" then "lights off".
+
+    The latency of each command, from submit() to the end of execute(), is kept in a histogram per
+    command name.
+
+    Args:
+        backend (CommandBackend): Carries out the commands (default: a LocalBackend).
+        max_workers (int): The number of commands run concurrently (default: 4).
+    """
+
+    def __init__(self, backend: CommandBackend = None, max_workers=4):
+        self.backend = backend if backend is not None else LocalBackend()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="command")
+        self._lock = threading.Lock()
+        self._last = {}
+        self.latency = {name: Histogram() for name, _ in COMMANDS}
+        self.failures = {name: 0 for name, _ in COMMANDS}
+
+    def submit(self, command: Command, trace: TurnTrace = None) -> Future:
+        """
+        Runs a command in the background. If a trace is given, the dispatch and the end of its
+        last command are marked on it as "command" and "command_done".
+        """
+        if trace is not None:
+            trace.mark("command")
+        submitted = time.monotonic()
+        with self._lock:
+            previous = self._last.get(command.name)
+            future = self._pool.submit(self._run, command, submitted, previous, trace)
+            self._last[command.name] = future
+        return future
+
+    def _run(self, command: Command, submitted, previous: Future, trace: TurnTrace):
+        if previous is not None:
+            try:
+                previous.result()
+            except Exception:
+                pass
+        try:
+            self.backend.execute(command)
+        except Exception as e:
+            print(f"[Command] {command.tag} failed: {e}")
+            with self._lock:
+                self.failures[command.name] += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - submitted
+            with self._lock:
+                self.latency[command.name].observe(elapsed)
+            if trace is not None:
+                trace.mark("command_done", once=False)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per command that ran, its count, failures, and mean and p90 latency in ms.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": h.count,
+                    "failures": self.failures[name],
+                    "mean_ms": h.sum / h.count * 1000,
+                    "p90_ms": h.quantile(0.9) * 1000,
+                }
+                for name, h in self.latency.items() if h.count > 0
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import grpc
+
+# Pings idle gRPC connections so NATs and load balancers do not drop them between turns.
+GRPC_KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+def wait_for_channel(channel: grpc.Channel, timeout=10.0):
+    """
+    Connects a gRPC channel if it is idle (DNS, TCP and TLS), and waits until it is ready.
+
+    Raises:
+        grpc.FutureTimeoutError: If the channel is not ready within the timeout.
+    """
+    grpc.channel_ready_future(channel).result(timeout=timeout)
+
+class KeepAlive(object):
+    """
+    Warms up the remote clients at startup, all in parallel, and then pings them periodically,
+    so the first turn after a long idle period connects as fast as any other.
+
+    Args:
+        interval (float): The seconds between pings (default: 60).
+    """
+
+    def __init__(self, interval=60.0):
+        self.interval = interval
+        self._services = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, name, warm_up, ping=None):
+        """
+        Args:
+            name (str): The name of the service, for logging.
+            warm_up (callable): Connects the client, called once by warm_up().
+            ping (callable): Keeps the connection alive, called every interval. Defaults to warm_up.
+        """
+        self._services.append((name, warm_up, ping if ping is not None else warm_up))
+
+    def _call(self, name, fn, verbose):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            print(f"[Net] {name} is unreachable: {e}")
+            return False
+        if verbose:
+            print(f"[Net] {name} ready in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def warm_up(self):
+        """
+        Warms up every service in parallel. Failures are logged, not raised: the service may come up later.
+
+        Returns:
+            bool: Whether every service is ready.
+        """
+        if not self._services:
+            return True
+        with ThreadPoolExecutor(max_workers=len(self._services), thread_name_prefix="warm-up") as pool:
+            results = list(pool.map(lambda s: self._call(s[0], s[1], True), self._services))
+        return all(results)
+
+    def _run(self, warm_up):
+        if warm_up:
+            self.warm_up()
+        while not self._stopped.wait(self.interval):
+            for name, _, ping in self._services:
+                self._call(name, ping, False)
+
+    def start(self, warm_up=False):
+        """
+        Starts pinging in the background.
+
+        Args:
+            warm_up (bool): Whether to warm up every service first, on the same thread, so startup
+                            does not wait for the network (default: False).
+        """
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(warm_up,), name="keep-alive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,34 +1,61 @@
+from collections import deque
+from contextlib import ExitStack
 from devices.speaker import Speaker
-from byte_fifo import ByteFIFO
+from devices.audio_format import convert
+from byte_fifo import ByteFIFO, OverflowPolicy
+import numpy as np
+import pyaudio
 import threading
 import time
 
+class _Source(object):
+    def __init__(self, capacity):
+        self.fifo = ByteFIFO(capacity=capacity, overflow=OverflowPolicy.GROW)
+        # Byte positions in the stream of this source, and the callbacks due at each position,
+        # as (position, callback, callback if the position is dropped instead).
+        self.queued = 0
+        self.played = 0
+        self.marks = deque()
+
 class AsyncPlayer(object):
-    def __init__(self, speaker: Speaker, chunk_size=16000*3, sample_rate=16000):
+    """
+    Plays 16 bit mono PCM through a single persistent output stream driven by a PortAudio callback.
+
+    Audio is queued per named source (e.g. "speech" and "chime"), and all sources are mixed into
+    each period. stop_now() fades out and drops everything queued, taking effect within one period.
+    play() can attach callbacks to the moment its audio starts and ends playing, which run on the
+    audio callback and must only record what happened, and to stop_now() dropping it. Audio at another
+    rate is resampled by play(), on the caller's thread, so the stream always runs at one rate.
+
+    Listeners receive each mixed period as it is handed to the device, e.g. as the echo canceller's reference.
+
+    Args:
+        speaker (Speaker): The output device.
+        sample_rate (int): The sample rate in Hz of all queued audio (default: 16000).
+        period (int): The number of frames per callback (default: 256).
+        fade_ms (int): The length of the fade-out of stop_now() (default: 10).
+    """
+
+    def __init__(self, speaker: Speaker, sample_rate=16000, period=256, fade_ms=10):
         self._speaker = speaker
-        self._lock = threading.Lock()
-        self._fifo = ByteFIFO()
-        self._chunk_size = chunk_size
-        self._running = False
         self._sample_rate = sample_rate
-        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._period = period
+        self._sources = {}
+        self._sources_lock = threading.Lock()
+        self._positions_lock = threading.Lock()
+        self._fade_frames = max(1, sample_rate * fade_ms // 1000)
+        self._fade_ramp = np.linspace(1, 0, self._fade_frames, endpoint=False).astype(np.float32)
+        self._fade = None
+        self._fade_lock = threading.Lock()
+        self._read_buf = bytearray()
+        self._stack = None
+        self._listeners = []
+        self.underruns = 0
+        self.starved_periods = 0
 
     def __del__(self):
         self.stop()
 
-    def _run(self):
-        with self._speaker.output_stream(self._sample_rate) as stream:
-            while self._running:
-                while len(self._fifo) == 0 and self._running:
-                    time.sleep(0.1)
-
-                with self._lock:
-                    data = self._fifo.get(self._chunk_size)
-
-                while len(data) > 0 and self._running:
-                    stream.write(bytes(data[:self._chunk_size]))
-                    data = data[self._chunk_size:]
-    
     def __enter__(self):
         self.start()
         return self
@@ -36,22 +63,165 @@ class AsyncPlayer(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
 
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    def add_listener(self, fn):
+        """
+        Args:
+            fn (callable): Called from the audio callback with each period's 16 bit PCM and the time.monotonic()
+                           at which it starts playing. Must only record it.
+        """
+        self._listeners.append(fn)
+
+    def _source(self, name):
+        with self._sources_lock:
+            source = self._sources.get(name)
+            if source is None:
+                source = _Source(capacity=self._sample_rate * 2 * 30)
+                self._sources[name] = source
+            return source
+
+    @staticmethod
+    def _due_marks(source):
+        # Must be called with the positions lock held.
+        due = []
+        while source.marks and source.marks[0][0] <= source.played:
+            fn = source.marks.popleft()[1]
+            if fn is not None:
+                due.append(fn)
+        return due
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paOutputUnderflow:
+            self.underruns += 1
+
+        if len(self._read_buf) < frame_count * 2:
+            self._read_buf = bytearray(frame_count * 2)
+        read_view = memoryview(self._read_buf)[:frame_count * 2]
+        read_samples = np.frombuffer(self._read_buf, dtype=np.int16, count=frame_count)
+        mix = np.zeros(frame_count, dtype=np.int32)
+
+        with self._sources_lock:
+            sources = list(self._sources.values())
+        due = []
+        for source in sources:
+            was_playing = len(source.fifo) > 0
+            with self._positions_lock:
+                size = source.fifo.readinto(read_view)
+                source.played += size
+                if source.marks:
+                    due.extend(self._due_marks(source))
+            if size > 0:
+                mix[:size // 2] += read_samples[:size // 2]
+            if was_playing and size < len(read_view):
+                self.starved_periods += 1
+        for fn in due:
+            fn()
+
+        with self._fade_lock:
+            if self._fade is not None:
+                n = min(frame_count, len(self._fade))
+                mix[:n] += self._fade[:n]
+                self._fade = self._fade[n:] if n < len(self._fade) else None
+
+        out = np.clip(mix, -32768, 32767).astype(np.int16).tobytes()
+        if self._listeners:
+            # PortAudio's clock may differ from time.monotonic(), so only its latency is used.
+            play_time = time.monotonic()
+            if time_info and time_info.get("output_buffer_dac_time"):
+                play_time += time_info["output_buffer_dac_time"] - time_info["current_time"]
+            for fn in self._listeners:
+                fn(out, play_time)
+        return out, pyaudio.paContinue
+
     def start(self):
-        self._running = True
-        self._thread.start()
+        self._stack = ExitStack()
+        self._stack.enter_context(self._speaker.output_stream(self._sample_rate, chunk_size=self._period, stream_callback=self._callback))
 
     def stop(self):
-        self._running = False
-        self._thread.join()
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+
+    def stop_now(self):
+        """
+        Stops all playback within one period. The next fade_ms of queued audio are faded out,
+        and the rest is dropped. The on_stop callbacks of the dropped audio run on this thread,
+        its other callbacks never do.
+        """
+        tail = np.zeros(self._fade_frames, dtype=np.int32)
+        buf = bytearray(self._fade_frames * 2)
+        with self._sources_lock:
+            sources = list(self._sources.values())
+        stopped = []
+        for source in sources:
+            with self._positions_lock:
+                size = source.fifo.readinto(buf)
+                source.fifo.clear()
+                source.played = source.queued
+                stopped.extend(on_stop for _, _, on_stop in source.marks if on_stop is not None)
+                source.marks.clear()
+            tail[:size // 2] += np.frombuffer(buf, dtype=np.int16, count=size // 2)
+        for fn in stopped:
+            fn()
+
+        with self._fade_lock:
+            if self._fade is not None:
+                n = min(len(self._fade), self._fade_frames)
+                tail[:n] += self._fade[:n]
+            self._fade = (tail * self._fade_ramp).astype(np.int32)
 
     def clear(self):
-        with self._lock:
-            self._fifo.clear()
-
-    def is_playing(self):
-        with self._lock:
-            return len(self._fifo) > 0
-    
-    def play(self, samples):
-        with self._lock:
-            self._fifo.put(samples)
+        self.stop_now()
+
+    def is_playing(self, source=None):
+        if source is not None:
+            return len(self._source(source).fifo) > 0
+        with self._sources_lock:
+            return any(len(s.fifo) > 0 for s in self._sources.values())
+
+    def play(self, samples, source="speech", on_start=None, on_end=None, rate=None, on_stop=None):
+        """
+        Queues audio on a source.
+
+        Args:
+            samples (bytes): 16 bit mono PCM.
+            source (str): The source to queue on (default: "speech").
+            on_start (callable): Called from the audio callback once the first sample of `samples` is played (default: None).
+            on_end (callable): Called from the audio callback once the last sample of `samples` is played.
+                               For empty samples, once everything queued before is played (default: None).
+            rate (int): The sample rate of `samples`, None for the player's sample rate (default: None).
+            on_stop (callable): Called instead of on_end if stop_now() drops the audio before its end, e.g. to
+                                release a caller waiting for on_end (default: None).
+        """
+        if rate is not None and rate != self._sample_rate:
+            samples = convert(samples, rate, self._sample_rate)
+        source = self._source(source)
+        with self._positions_lock:
+            start = source.queued
+            source.fifo.put(samples)
+            source.queued += len(samples)
+            if on_start is not None:
+                source.marks.append((start + 1 if len(samples) > 0 else start, on_start, None))
+            if on_end is not None or on_stop is not None:
+                source.marks.append((source.queued, on_end, on_stop))
+            due = self._due_marks(source)
+        for fn in due:
+            fn()
+
+    def queue_depth(self):
+        """
+        Returns:
+            dict: The seconds of audio queued per source.
+        """
+        with self._sources_lock:
+            return {name: len(source.fifo) / 2 / self._sample_rate for name, source in self._sources.items()}
+
+    def stats(self):
+        return {
+            "underruns": self.underruns,
+            "starved_periods": self.starved_periods,
+            "queue_depth": self.queue_depth(),
+        }
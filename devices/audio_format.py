@@ -0,0 +1,158 @@
+from functools import lru_cache
+from math import gcd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+class Resampler(object):
+    """
+    A polyphase windowed-sinc resampler between two fixed rates.
+
+    The rate ratio is reduced to up / down, and the Kaiser-windowed sinc filter is stored as one row
+    of taps per output phase. The phases repeat every `up` output samples, so a whole block of periods
+    is computed as a single product of input windows and filter rows, without a Python loop per sample.
+    Use get_resampler(), which builds one per rate pair and caches it.
+
+    Args:
+        source_rate (int): The input sample rate in Hz.
+        target_rate (int): The output sample rate in Hz.
+        taps (int): The filter taps per output sample when upsampling, more when downsampling (default: 32).
+        rolloff (float): The cutoff relative to the lower Nyquist frequency (default: 0.9).
+        beta (float): The Kaiser window parameter (default: 8.0).
+    """
+
+    BLOCK = 8192
+
+    def __init__(self, source_rate, target_rate, taps=32, rolloff=0.9, beta=8.0):
+        g = gcd(source_rate, target_rate)
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.up = target_rate // g
+        self.down = source_rate // g
+        # Downsampling lowers the cutoff relative to the input, which needs a proportionally longer filter.
+        self.taps = 2 * int(np.ceil(taps * max(1.0, self.down / self.up) / 2))
+        half = self.taps // 2
+
+        # The distance of each tap to the output sample, at the upsampled rate, per phase.
+        phases = np.arange(self.up)
+        distances = phases[:, None] + (half - 1 - np.arange(self.taps))[None, :] * self.up
+        cutoff = rolloff * 0.5 / max(self.up, self.down)
+        span = (half + 1) * self.up
+        window = np.i0(beta * np.sqrt(np.clip(1 - (distances / span) ** 2, 0, 1))) / np.i0(beta)
+        bank = np.sinc(2 * cutoff * distances) * window
+        # Unit gain at DC for every phase.
+        bank /= bank.sum(axis=1, keepdims=True)
+
+        # Output sample q * up + r reads its window at input q * down + offsets[r] with filter row rows[r].
+        r = np.arange(self.up)
+        self._offsets = (r * self.down) // self.up
+        self._rows = bank[(r * self.down) % self.up].astype(np.float32)
+
+    def output_length(self, length):
+        return -(-length * self.up // self.down)
+
+    def __call__(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resamples a whole clip. Beyond its ends, the input is taken as silence.
+
+        Args:
+            samples (np.ndarray): Mono samples.
+
+        Returns:
+            np.ndarray: The float32 samples at the target rate.
+        """
+        n_out = self.output_length(len(samples))
+        half = self.taps // 2
+        padded = np.zeros(len(samples) + 2 * half, dtype=np.float32)
+        padded[half:half + len(samples)] = samples
+        windows = sliding_window_view(padded, self.taps)
+        last = len(windows) - 1
+
+        out = np.empty(n_out, dtype=np.float32)
+        periods = max(1, self.BLOCK // self.up)
+        for start in range(0, n_out, periods * self.up):
+            q = np.arange(start // self.up, min(start // self.up + periods, -(-n_out // self.up)))
+            starts = np.minimum((q * self.down)[:, None] + self._offsets[None, :] + 1, last)
+            block = np.einsum("qrt,rt->qr", windows[starts], self._rows).ravel()
+            end = min(n_out, start + len(block))
+            out[start:end] = block[:end - start]
+        return out
+
+class ResampleStream(object):
+    """
+    Resamples a continuous stream chunk by chunk, with the same filter as Resampler, so chunk boundaries
+    leave no trace. Output sample n is at input time n / target_rate, like for a whole clip, but is only
+    returned once the input it depends on has arrived, taps / 2 input samples later.
+    """
+
+    def __init__(self, source_rate, target_rate):
+        self._resampler = get_resampler(source_rate, target_rate)
+        half = self._resampler.taps // 2
+        # The input before the stream starts is silence.
+        self._buffer = np.zeros(half, dtype=np.float32)
+        self._offset = -half
+        self._next = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        r = self._resampler
+        half = r.taps // 2
+        self._buffer = np.concatenate([self._buffer, np.asarray(samples, dtype=np.float32)])
+        available = self._offset + len(self._buffer)
+        # One past the last output whose taps end at or before the last input sample.
+        end = max(self._next, ((available - half) * r.up - 1) // r.down + 1) if available > half else self._next
+        if end == self._next:
+            return np.zeros(0, dtype=np.float32)
+
+        n = np.arange(self._next, end)
+        phase = n % r.up
+        starts = (n // r.up) * r.down + r._offsets[phase] - half + 1 - self._offset
+        windows = sliding_window_view(self._buffer, r.taps)
+        out = np.einsum("nt,nt->n", windows[starts], r._rows[phase])
+
+        self._next = end
+        keep = (end // r.up) * r.down + r._offsets[end % r.up] - half + 1 - self._offset
+        self._buffer = self._buffer[keep:]
+        self._offset += keep
+        return out
+
+@lru_cache(maxsize=16)
+def get_resampler(source_rate, target_rate) -> Resampler:
+    return Resampler(source_rate, target_rate)
+
+def to_mono(data: bytes, channels=1, width=2) -> np.ndarray:
+    """
+    Decodes interleaved PCM of 8 to 32 bit samples into mono float32 samples at 16 bit scale.
+    """
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) * 256
+    elif width == 2:
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+    elif width == 3:
+        # The upper two bytes of each little-endian 24 bit sample.
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = np.ascontiguousarray(raw[:, 1:]).view(np.int16).ravel().astype(np.float32)
+    elif width == 4:
+        samples = np.frombuffer(data, dtype=np.int32).astype(np.float32) / 65536
+    else:
+        raise ValueError(f"[AUDIO] Unsupported sample width of {width} bytes.")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+def convert(data: bytes, rate, target_rate=None, channels=1, width=2) -> bytes:
+    """
+    Converts PCM audio to mono 16 bit PCM at target_rate, or at its own rate if None.
+    Audio already in that format is returned as is.
+    """
+    target_rate = rate if target_rate is None else target_rate
+    if channels == 1 and width == 2 and rate == target_rate:
+        return data
+    samples = to_mono(data, channels, width)
+    if rate != target_rate:
+        samples = get_resampler(rate, target_rate)(samples)
+    return np.clip(np.round(samples), -32768, 32767).astype(np.int16).tobytes()
+
+def resample(data: bytes, rate, target_rate) -> bytes:
+    """
+    Resamples mono 16 bit PCM.
+    """
+    return convert(data, rate, target_rate)
@@ -1,7 +1,9 @@
 from typing import Generator, List
 from contextlib import contextmanager
 from .pyaudio_wrap import PyAudioDevice
+from frame_ring import FrameRing
 import pyaudio
+import time
 
 class Microphone(PyAudioDevice):
     def _get_default(self):
@@ -15,24 +17,44 @@ class Microphone(PyAudioDevice):
         return [d for d in devices if d["maxInputChannels"] > 0]
 
     @contextmanager
-    def mic_stream(self, rate=16000, chunk_size=1024, format=pyaudio.paInt16) -> Generator[pyaudio.Stream, None, None]:
-        stream = self._pyaudio.open(format=format, channels=1, rate=rate, input=True, frames_per_buffer=chunk_size, input_device_index=self._dev_info["index"])
+    def mic_stream(self, rate=16000, chunk_size=1024, format=pyaudio.paInt16, stream_callback=None) -> Generator[pyaudio.Stream, None, None]:
+        stream = self._pyaudio.open(format=format, channels=1, rate=rate, input=True, frames_per_buffer=chunk_size, input_device_index=self._dev_info["index"],
+                                    stream_callback=stream_callback)
         yield stream
         stream.stop_stream()
         stream.close()
-    
-    @contextmanager
-    def record(self, rate=16000, chunk_size=4096, format=pyaudio.paInt16):
-        stopped = False
-        def _read_chunks(stream):
-            while not stopped:
-                yield stream.read(chunk_size)
-        
-        with self.mic_stream(rate=rate, chunk_size=chunk_size, format=format) as stream:
-            yield _read_chunks(stream)
-
-        stopped = True
-
-
 
+    @contextmanager
+    def capture(self, rate=16000, period=256, seconds=2.0, format=pyaudio.paInt16, ring=None) -> Generator[FrameRing, None, None]:
+        """
+        Captures audio on a PortAudio callback into a FrameRing holding the last `seconds` of audio.
+        Consumers read it through their own FrameRing.reader() at their native frame size, so a slow
+        consumer never stalls capture. The ring counts PortAudio input overflows.
+
+        Each period is timestamped on the ring with its capture time on the time.monotonic() clock.
+        A ring with the interface of FrameRing may be passed in, e.g. a SharedFrameRing, in place of a new one.
+        """
+        if ring is None:
+            ring = FrameRing(int(rate * pyaudio.get_sample_size(format) * seconds))
+
+        def callback(in_data, frame_count, time_info, status):
+            if status & pyaudio.paInputOverflow:
+                ring.overflows += 1
+            # PortAudio's clock may differ from time.monotonic(), so only its latency is used.
+            if time_info and time_info.get("input_buffer_adc_time"):
+                captured = time.monotonic() - (time_info["current_time"] - time_info["input_buffer_adc_time"])
+            else:
+                captured = time.monotonic() - frame_count / rate
+            ring.write(in_data, timestamp=captured)
+            return None, pyaudio.paContinue
+
+        try:
+            with self.mic_stream(rate=rate, chunk_size=period, format=format, stream_callback=callback):
+                yield ring
+        finally:
+            ring.close()
 
+    @contextmanager
+    def record(self, rate=16000, chunk_size=4096, format=pyaudio.paInt16):
+        with self.capture(rate=rate, format=format) as ring:
+            yield ring.reader(chunk_size * pyaudio.get_sample_size(format))
@@ -1,10 +1,35 @@
+import threading
 import pyaudio
 
+_lock = threading.Lock()
+_pyaudio = None
+_devices = None
+
+def shared_pyaudio() -> pyaudio.PyAudio:
+    """
+    Returns the PortAudio instance shared by every device, initialized on first use.
+    Initializing PortAudio probes every host API, which takes a while, so it is only done once.
+    """
+    global _pyaudio
+    with _lock:
+        if _pyaudio is None:
+            _pyaudio = pyaudio.PyAudio()
+        return _pyaudio
+
+def list_devices(refresh=False):
+    """
+    Returns the info of every audio device, enumerated once and shared by every device.
+    """
+    global _devices
+    p = shared_pyaudio()
+    with _lock:
+        if _devices is None or refresh:
+            _devices = [p.get_device_info_by_index(i) for i in range(p.get_device_count())]
+        return list(_devices)
+
 class PyAudioDevice(object):
     def _get_devices(self):
-        device_count = self._pyaudio.get_device_count()
-        devices = [self._pyaudio.get_device_info_by_index(i) for i in range(device_count)]
-        return devices
+        return list_devices()
     
     def _filter_device_by_name(self, devices, name: str):
         matching_candidates = [m for m in devices if name == m["name"]]
@@ -27,5 +52,5 @@ class PyAudioDevice(object):
         raise NotImplementedError()
 
     def __init__(self, name=None):
-        self._pyaudio = pyaudio.PyAudio()
-        self._dev_info = self._get_default() if name is None else self._filter_device_by_name(self._get_devices(), name)
\ No newline at end of file
+        self._pyaudio = shared_pyaudio()
+        self._dev_info = self._get_default() if name is None else self._filter_device_by_name(self._get_devices(), name)
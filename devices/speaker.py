@@ -1,39 +1,94 @@
 from typing import Generator, List
 from contextlib import contextmanager
+import threading
 import wave
 from .pyaudio_wrap import PyAudioDevice
+from .audio_format import convert
 import pyaudio
 
+def read_wave(path, rate=None) -> bytes:
+    """
+    Decodes a wave file into mono 16 bit PCM, resampled to `rate` if given.
+    """
+    with wave.open(path, 'rb') as wf:
+        data = wf.readframes(wf.getnframes())
+        return convert(data, wf.getframerate(), rate, channels=wf.getnchannels(), width=wf.getsampwidth())
+
 class Speaker(PyAudioDevice):
+    """
+    An output device. Everything it plays goes through one AsyncPlayer at the device's native rate,
+    whose stream is opened on first use and kept open for the life of the process, so playing a
+    sound never waits for a new stream and every source is resampled once on its way in.
+    """
+
     def _get_default(self):
         return self._pyaudio.get_default_output_device_info()
 
     def __init__(self, name=None):
         super().__init__(name=name)
+        self._player = None
+        self._player_lock = threading.Lock()
+
+    @property
+    def native_rate(self):
+        return int(self._dev_info["defaultSampleRate"])
+
+    def player(self):
+        """
+        Returns:
+            AsyncPlayer: The speaker's player, started on first use.
+        """
+        with self._player_lock:
+            if self._player is None:
+                from .async_player import AsyncPlayer
+                self._player = AsyncPlayer(self, sample_rate=self.native_rate)
+                self._player.start()
+            return self._player
+
+    def close(self):
+        with self._player_lock:
+            if self._player is not None:
+                self._player.stop()
+                self._player = None
 
     def _get_devices(self) -> List[dict]:
         devices = super()._get_devices()
         return [d for d in devices if d["maxOutputChannels"] > 0]
 
     @contextmanager
-    def output_stream(self, rate=16000, chunk_size=1024, channels=1, format=pyaudio.paInt16) -> Generator[pyaudio.Stream, None, None]:
-        stream = self._pyaudio.open(format=format, channels=channels, rate=rate, output=True, frames_per_buffer=chunk_size, output_device_index=self._dev_info["index"])
+    def output_stream(self, rate=16000, chunk_size=1024, channels=1, format=pyaudio.paInt16, stream_callback=None) -> Generator[pyaudio.Stream, None, None]:
+        stream = self._pyaudio.open(format=format, channels=channels, rate=rate, output=True, frames_per_buffer=chunk_size, output_device_index=self._dev_info["index"],
+                                    stream_callback=stream_callback)
         yield stream
         stream.stop_stream()
         stream.close()
 
 
-    def play(self, samples, rate=16000, chunk_size=4096, format=pyaudio.paInt16):
-        with self.output_stream(rate=rate, chunk_size=chunk_size, format=format) as stream:
-            stream.write(samples)
+    def play(self, samples, rate=16000, format=pyaudio.paInt16, channels=1):
+        """
+        Plays PCM audio on the speaker's player, and waits until it has been played, or was stopped by
+        AsyncPlayer.stop_now(), e.g. on a barge-in.
+
+        Returns:
+            bool: Whether the audio was played to its end.
+        """
+        player = self.player()
+        samples = convert(samples, rate, player.sample_rate, channels=channels, width=pyaudio.get_sample_size(format))
+        return self._play_and_wait(player, samples)
 
     def play_wave(self, path):
-        with wave.open(path, 'rb') as wf:
-            with self.output_stream(rate=wf.getframerate(), 
-                                    channels = wf.getnchannels(), 
-                                    chunk_size=512, 
-                                    format=self._pyaudio.get_format_from_width(wf.getsampwidth())) as stream:
-                data = wf.readframes(512)
-                while data:
-                    stream.write(data)
-                    data = wf.readframes(512)
+        """
+        Like play(), for a WAV file.
+        """
+        player = self.player()
+        return self._play_and_wait(player, read_wave(path, rate=player.sample_rate))
+
+    def _play_and_wait(self, player, samples):
+        done = threading.Event()
+        result = []
+        # Audio queued before on the same source plays first. The margin covers the device latency, the
+        # timeout a stream that stopped calling back.
+        timeout = player.queue_depth().get("play", 0.0) + len(samples) / 2 / player.sample_rate + 2.0
+        player.play(samples, source="play", on_end=lambda: (result.append(True), done.set()), on_stop=done.set)
+        done.wait(timeout)
+        return bool(result)
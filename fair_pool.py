@@ -0,0 +1,134 @@
+from collections import deque
+from concurrent.futures import Future
+import threading
+import time
+
+class Lane(object):
+    """
+    One client's queue of a FairPool, with the submit() and map() of an Executor, so it can stand in
+    for a ThreadPoolExecutor.
+    """
+
+    def __init__(self, pool, name):
+        self._pool = pool
+        self.name = name
+        self.tasks = deque()
+        self.submitted = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return self._pool._submit(self, fn, args, kwargs)
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+
+        def results():
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+        return results()
+
+class FairPool(object):
+    """
+    A thread pool shared by several clients, e.g. rooms, each submitting through its own Lane.
+
+    Workers serve the lanes with pending tasks round robin, one task at a time, so a client with a long
+    backlog cannot starve the others: a new task waits for at most one task of every other busy lane.
+    Within a lane, tasks run in submission order.
+
+    Args:
+        max_workers (int): The number of worker threads.
+        thread_name_prefix (str): The prefix of the worker thread names (default: "fair-pool").
+    """
+
+    def __init__(self, max_workers, thread_name_prefix="fair-pool"):
+        self.max_workers = max_workers
+        self._lanes = {}
+        self._ready = deque()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._workers = [threading.Thread(target=self._work, name=f"{thread_name_prefix}_{i}", daemon=True) for i in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def lane(self, name) -> Lane:
+        """
+        Returns the lane of a client, created on first use.
+        """
+        with self._condition:
+            lane = self._lanes.get(name)
+            if lane is None:
+                lane = self._lanes[name] = Lane(self, name)
+            return lane
+
+    def _submit(self, lane: Lane, fn, args, kwargs):
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot submit to a pool that was shut down")
+            if not lane.tasks:
+                self._ready.append(lane)
+            lane.tasks.append((future, fn, args, kwargs, time.monotonic()))
+            lane.submitted += 1
+            self._condition.notify()
+        return future
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._ready and not self._shutdown:
+                    self._condition.wait()
+                if not self._ready:
+                    return
+                lane = self._ready.popleft()
+                future, fn, args, kwargs, submitted_at = lane.tasks.popleft()
+                # The lane goes to the back of the line if it has more work.
+                if lane.tasks:
+                    self._ready.append(lane)
+                wait = time.monotonic() - submitted_at
+                lane.wait_seconds += wait
+                lane.max_wait_seconds = max(lane.max_wait_seconds, wait)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self._condition:
+                lane.completed += 1
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once every queued task has run.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per lane, the tasks submitted, completed and queued, and the mean and max queueing delay.
+        """
+        with self._condition:
+            return {
+                name: {
+                    "submitted": lane.submitted,
+                    "completed": lane.completed,
+                    "queued": len(lane.tasks),
+                    "mean_wait_ms": lane.wait_seconds / (lane.submitted - len(lane.tasks)) * 1000 if lane.submitted > len(lane.tasks) else 0.0,
+                    "max_wait_ms": lane.max_wait_seconds * 1000,
+                }
+                for name, lane in self._lanes.items()
+            }
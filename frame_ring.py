@@ -0,0 +1,429 @@
+from collections import deque
+from multiprocessing import shared_memory
+import struct
+import threading
+import time
+
+class FrameRing(object):
+    """
+    A fixed ring of bytes with one writer and any number of independent readers.
+
+    The writer never waits for readers: a reader that falls behind by the capacity of the ring skips
+    ahead and counts the dropped bytes. Each reader cuts the stream into frames of its own size.
+    Writes can be timestamped, e.g. with their capture time, and time_at() maps a position back to a time.
+
+    Args:
+        capacity (int): The size of the ring in bytes, rounded up to a multiple of `alignment`.
+        alignment (int): Frames whose size divides the capacity never wrap around the end of the ring,
+                         so they are returned as views instead of copies. The default covers 512 sample,
+                         10 ms, 20 ms and 100 ms frames of 16 kHz 16 bit audio (default: 25600).
+    """
+
+    def __init__(self, capacity, alignment=25600):
+        capacity = -(-capacity // alignment) * alignment
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._written = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        # The positions and timestamps of recent writes, enough to cover the ring at small periods.
+        self._stamps = deque(maxlen=256)
+        self.overflows = 0
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    @property
+    def written(self):
+        return self._written
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def write(self, data, timestamp=None):
+        """
+        Appends data, overwriting the oldest data in the ring. Only one thread may write.
+
+        Args:
+            data (bytes-like): The data to append.
+            timestamp (float): The time of the first byte of data, see time_at() (default: None).
+        """
+        data = memoryview(data).cast("B")
+        capacity = len(self._buf)
+        skipped = 0
+        if len(data) > capacity:
+            skipped = len(data) - capacity
+            data = data[skipped:]
+
+        pos = (self._written + skipped) % capacity
+        first = min(len(data), capacity - pos)
+        self._view[pos:pos + first] = data[:first]
+        if len(data) > first:
+            self._view[:len(data) - first] = data[first:]
+
+        with self._cond:
+            if timestamp is not None:
+                self._stamps.append((self._written, timestamp))
+            self._written += skipped + len(data)
+            self._cond.notify_all()
+
+    def time_at(self, position, bytes_per_second):
+        """
+        Returns the time of the byte at `position`, from the timestamp of the latest write at or before it
+        and the data rate, or None if no such write was timestamped.
+        """
+        with self._cond:
+            for start, timestamp in reversed(self._stamps):
+                if start <= position:
+                    return timestamp + (position - start) / bytes_per_second
+        return None
+
+    def reader(self, frame_size, history=0, start=None):
+        """
+        Creates a reader of frames of `frame_size` bytes, starting `history` bytes in the past, or at the
+        ring position `start`, e.g. where a wake word was detected.
+        """
+        return FrameReader(self, frame_size, history, start)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class FrameReader(object):
+    """
+    A reader of a FrameRing, returning frames of a fixed size.
+
+    A returned frame is a view into the ring when it does not wrap around, and is only valid until the
+    next read() of this reader. Readers that keep frames longer must copy them.
+    """
+
+    def __init__(self, ring: FrameRing, frame_size, history=0, start=None):
+        if frame_size > ring.capacity // 2:
+            raise ValueError(f"Frame size {frame_size} is too large for a ring of {ring.capacity} bytes.")
+        self._ring = ring
+        self.frame_size = frame_size
+        self._scratch = bytearray(frame_size)
+        if start is None:
+            start = ring.written - history
+        # Aligning the cursor to the frame size keeps frames from wrapping when they divide the capacity.
+        start = max(0, start, ring.written - ring.capacity + frame_size)
+        self._cursor = start - start % frame_size
+        self.dropped = 0
+
+    @property
+    def closed(self):
+        return self._ring.closed
+
+    @property
+    def position(self):
+        """
+        The ring position of the next frame, i.e. the end of the last frame read.
+        """
+        return self._cursor
+
+    def available(self):
+        return self._ring.written - self._cursor
+
+    def read(self, timeout=None):
+        """
+        Waits for the next frame.
+
+        Returns:
+            memoryview: The frame, or None if the timeout passed or the ring was closed.
+        """
+        ring = self._ring
+        with ring._cond:
+            if ring._written - self._cursor < self.frame_size:
+                ring._cond.wait_for(lambda: ring._written - self._cursor >= self.frame_size or ring._closed, timeout)
+            written = ring._written
+            if written - self._cursor < self.frame_size:
+                return None
+
+        capacity = ring.capacity
+        # Keep a frame of slack, the writer may be filling the space right behind the cursor.
+        if written - self._cursor > capacity - self.frame_size:
+            skip_to = written - capacity + 2 * self.frame_size
+            skip_to += -skip_to % self.frame_size
+            self.dropped += skip_to - self._cursor
+            self._cursor = skip_to
+
+        start = self._cursor % capacity
+        self._cursor += self.frame_size
+        if start + self.frame_size <= capacity:
+            return ring._view[start:start + self.frame_size]
+
+        first = capacity - start
+        self._scratch[:first] = ring._view[start:]
+        self._scratch[first:] = ring._view[:self.frame_size - first]
+        return memoryview(self._scratch)
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+class SharedFrameRing(object):
+    """
+    A FrameRing in shared memory, written by one process and read by any number of readers in any
+    process, without pickling or locks.
+
+    Like a seqlock, the writer announces the end of each write before it copies the data in, and advances
+    the count of bytes written, which publishes the data, once it is done. A reader copies a frame out,
+    then checks the announced end to detect that a write, finished or still in progress, reached the frame
+    meanwhile, and retries further ahead if so. This relies on aligned 8 byte stores being atomic.
+    Readers poll, as there is no lock to wait on.
+
+    Besides the data, the segment holds the timestamps of recent writes (see time_at()) and a table of
+    events published by position, e.g. wake words.
+
+    Create the ring in one process, and attach() to it by name in the others.
+
+    Args:
+        capacity (int): The size of the ring in bytes, rounded up to a multiple of `alignment`.
+        alignment (int): See FrameRing (default: 25600).
+        name (str): The segment to attach to, or None to create one (default: None).
+    """
+
+    # The header fields, as int64 at these offsets.
+    _WRITTEN, _CLOSED, _OVERFLOWS, _STAMP_COUNT, _EVENT_COUNT, _CAPACITY, _WRITING = range(0, 56, 8)
+    _HEADER_SIZE = 64
+    # Tables of (position, time) as two float64, for timestamps and for events.
+    _MAX_STAMPS = 256
+    _MAX_EVENTS = 64
+    _STAMPS = _HEADER_SIZE
+    _EVENTS = _STAMPS + 16 * _MAX_STAMPS
+    _DATA = _EVENTS + 16 * _MAX_EVENTS
+
+    def __init__(self, capacity, alignment=25600, name=None):
+        if name is None:
+            capacity = -(-capacity // alignment) * alignment
+            self._shm = shared_memory.SharedMemory(create=True, size=self._DATA + capacity)
+            self._buf = self._shm.buf
+            self._buf[:self._DATA] = bytes(self._DATA)
+            self._set(self._CAPACITY, capacity)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._buf = self._shm.buf
+        self._owner = name is None
+        self._capacity = self._get(self._CAPACITY)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(0, name=name)
+
+    def _get(self, offset):
+        return struct.unpack_from("q", self._buf, offset)[0]
+
+    def _set(self, offset, value):
+        struct.pack_into("q", self._buf, offset, value)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def written(self):
+        return self._get(self._WRITTEN)
+
+    @property
+    def writing(self):
+        """
+        The end of the write in progress, or the count of bytes written if there is none.
+        """
+        return self._get(self._WRITING)
+
+    @property
+    def closed(self):
+        return self._get(self._CLOSED) != 0
+
+    @property
+    def overflows(self):
+        return self._get(self._OVERFLOWS)
+
+    @overflows.setter
+    def overflows(self, value):
+        self._set(self._OVERFLOWS, value)
+
+    def write(self, data, timestamp=None):
+        """
+        Appends data, overwriting the oldest data in the ring. Only one thread of one process may write.
+
+        Args:
+            data (bytes-like): The data to append.
+            timestamp (float): The time of the first byte of data, see time_at() (default: None).
+        """
+        data = memoryview(data).cast("B")
+        capacity = self._capacity
+        written = self._get(self._WRITTEN)
+        skipped = 0
+        if len(data) > capacity:
+            skipped = len(data) - capacity
+            data = data[skipped:]
+
+        # Announcing the end first tells readers which bytes may change under them.
+        self._set(self._WRITING, written + skipped + len(data))
+        pos = self._DATA + (written + skipped) % capacity
+        first = min(len(data), self._DATA + capacity - pos)
+        self._buf[pos:pos + first] = data[:first]
+        if len(data) > first:
+            self._buf[self._DATA:self._DATA + len(data) - first] = data[first:]
+
+        if timestamp is not None:
+            count = self._get(self._STAMP_COUNT)
+            struct.pack_into("dd", self._buf, self._STAMPS + 16 * (count % self._MAX_STAMPS), written, timestamp)
+            self._set(self._STAMP_COUNT, count + 1)
+        # Advancing the count last publishes the data.
+        self._set(self._WRITTEN, written + skipped + len(data))
+
+    def time_at(self, position, bytes_per_second):
+        """
+        See FrameRing.time_at().
+        """
+        count = self._get(self._STAMP_COUNT)
+        for i in range(count - 1, max(count - self._MAX_STAMPS, 0) - 1, -1):
+            start, timestamp = struct.unpack_from("dd", self._buf, self._STAMPS + 16 * (i % self._MAX_STAMPS))
+            if start <= position:
+                return timestamp + (position - start) / bytes_per_second
+        return None
+
+    @property
+    def event_count(self):
+        return self._get(self._EVENT_COUNT)
+
+    def publish(self, position, timestamp):
+        """
+        Publishes an event at a ring position, e.g. the end of the frame a wake word was detected in.
+        Only the writer's process may publish.
+        """
+        count = self._get(self._EVENT_COUNT)
+        struct.pack_into("dd", self._buf, self._EVENTS + 16 * (count % self._MAX_EVENTS), position, timestamp)
+        self._set(self._EVENT_COUNT, count + 1)
+
+    def events(self, since=0):
+        """
+        Returns:
+            list: The (position, time) of the events published after the first `since`, at most the last 64.
+        """
+        count = self._get(self._EVENT_COUNT)
+        events = []
+        for i in range(max(since, count - self._MAX_EVENTS), count):
+            position, timestamp = struct.unpack_from("dd", self._buf, self._EVENTS + 16 * (i % self._MAX_EVENTS))
+            events.append((int(position), timestamp))
+        return events
+
+    def reader(self, frame_size, history=0, start=None, poll=0.002):
+        """
+        Like FrameRing.reader(), for a reader that checks for new data every `poll` seconds while it waits.
+        """
+        return SharedFrameReader(self, frame_size, history, start, poll)
+
+    def close(self):
+        self._set(self._CLOSED, 1)
+
+    def release(self):
+        """
+        Frees the segment once every process has detached, if this process created it. Readers in this
+        process keep working, as the memory stays mapped until the ring is garbage collected.
+        """
+        if self._owner:
+            self._owner = False
+            self._shm.unlink()
+
+class SharedFrameReader(object):
+    """
+    A reader of a SharedFrameRing, with the interface of FrameReader.
+
+    Frames are always copies, as the writer never waits, and are only valid until the next read() of
+    this reader.
+    """
+
+    def __init__(self, ring: SharedFrameRing, frame_size, history=0, start=None, poll=0.002):
+        if frame_size > ring.capacity // 2:
+            raise ValueError(f"Frame size {frame_size} is too large for a ring of {ring.capacity} bytes.")
+        self._ring = ring
+        self.frame_size = frame_size
+        self.poll = poll
+        self._frame = bytearray(frame_size)
+        written = ring.written
+        if start is None:
+            start = written - history
+        start = max(0, start, written - ring.capacity + frame_size)
+        self._cursor = start - start % frame_size
+        self.dropped = 0
+
+    @property
+    def closed(self):
+        return self._ring.closed
+
+    @property
+    def position(self):
+        """
+        The ring position of the next frame, i.e. the end of the last frame read.
+        """
+        return self._cursor
+
+    def available(self):
+        return self._ring.written - self._cursor
+
+    def _skip_ahead(self, end):
+        # To a frame of slack behind `end`. The writer may still be filling the bytes up to it, in which
+        # case read() waits for them to be published.
+        skip_to = end - self._ring.capacity + 2 * self.frame_size
+        skip_to += -skip_to % self.frame_size
+        self.dropped += skip_to - self._cursor
+        self._cursor = skip_to
+
+    def read(self, timeout=None):
+        """
+        Waits for the next frame.
+
+        Returns:
+            memoryview: The frame, or None if the timeout passed or the ring was closed.
+        """
+        ring = self._ring
+        capacity = ring.capacity
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            written = ring.written
+            if written - self._cursor < self.frame_size:
+                # Closed is set after the last write, so the count is read again.
+                if ring.closed and ring.written - self._cursor < self.frame_size:
+                    return None
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.poll)
+                continue
+
+            # Keep a frame of slack, the writer may be filling the space right behind the cursor.
+            writing = ring.writing
+            if writing - self._cursor > capacity - self.frame_size:
+                self._skip_ahead(writing)
+                continue
+            start = ring._DATA + self._cursor % capacity
+            first = min(self.frame_size, ring._DATA + capacity - start)
+            self._frame[:first] = ring._buf[start:start + first]
+            if first < self.frame_size:
+                self._frame[first:] = ring._buf[ring._DATA:ring._DATA + self.frame_size - first]
+            writing = ring.writing
+            if writing - self._cursor > capacity - self.frame_size:
+                # A write, finished or not, reached the frame while it was copied.
+                self._skip_ahead(writing)
+                continue
+            self._cursor += self.frame_size
+            return memoryview(self._frame)
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
@@ -0,0 +1,236 @@
+from collections import Counter
+import math
+import re
+import threading
+import time
+
+# The reply to "stop", shared with the chat model's system prompt so both sound alike.
+SURE_REPLY = "Sure"
+
+# Intents answered locally, as (name, regexes over the normalized transcript, reply, command, default parameters).
+# A regex must match the whole transcript, or what is left of it without LEADING_FILLER and TRAILING_FILLER, and its named groups are the command's parameters.
+# Every literal word of a regex is a keyword: a rule is only tried if the transcript contains one of them.
+RULES = [
+    ("stop", [r"(please )?(stop|shut up|be quiet|quiet|silence|enough)( please| now)*"], SURE_REPLY, None, {}),
+    ("play_music", [r"(please )?(play|start|put on) (some |the )?music( please)?"], "Fine. Music. As if that will help.", "PlayMusic", {}),
+    ("stop_music", [r"(please )?(stop|pause) (the )?music( please)?"], "Finally, some peace and quiet.", "StopMusic", {}),
+    ("lights", [r"(please )?(turn|switch) (the )?lights? (?P<state>on|off)( please)?",
+                r"(please )?(turn|switch) (?P<state>on|off) (the )?lights?( please)?",
+                r"lights? (?P<state>on|off)"], "Done. Try not to trip over anything.", "Lights", {}),
+    ("lights_color", [r"(please )?(set|make|turn|change) (the )?lights? (to )?(?P<color>red|green|blue|white|yellow|orange|purple|pink)( please)?"],
+     "There. A new color. How thrilling.", "LightsColor", {}),
+    ("ac_power", [r"(please )?(turn|switch) (the )?(ac|air conditioning|air conditioner) (?P<state>on|off)( please)?",
+                  r"(please )?(turn|switch) (?P<state>on|off) (the )?(ac|air conditioning|air conditioner)( please)?"],
+     "As you wish. I will adjust the atmosphere.", "ACMain", {"temp": "24"}),
+    ("ac_temp", [r"(please )?set (the )?(ac|air conditioning|air conditioner|temperature) to (?P<temp>1[6-9]|2[0-9]|30)( degrees)?( please)?"],
+     "As you wish. I will adjust the atmosphere.", "ACMain", {"state": "on"}),
+]
+
+# Example utterances of the parameterless intents, for the optional bag-of-words classifier.
+# "none" holds requests that must go to the chat model.
+EXAMPLES = {
+    "stop": ["stop", "stop it", "stop talking", "please stop talking", "shut up", "be quiet", "quiet please", "that's enough", "enough already",
+             "okay stop", "stop stop"],
+    "play_music": ["play music", "play some music", "play me some music", "put some music on", "start the music", "can you play music",
+                   "i want to hear some music", "music please"],
+    "stop_music": ["stop the music", "stop playing music", "pause the music", "turn the music off", "no more music", "kill the music"],
+    "none": ["what's the weather", "tell me a joke", "how are you", "what time is it", "who are you", "what is the cake made of",
+             "play a game with me", "stop being so mean", "can you turn the music down a bit", "what is the meaning of life",
+             "tell me about portals", "set a timer", "what's the news today", "why are you like this"],
+}
+
+# Politeness and filler around a request, e.g. "lights off please" or "can you stop the music now".
+LEADING_FILLER = re.compile(r"^(?:(?:please|okay|ok|hey|so|um|uh|can you|could you|would you|will you) )+")
+TRAILING_FILLER = re.compile(r"(?: (?:please|now|right now|for me|thanks|thank you))+$")
+
+NON_WORD = re.compile(r"[^a-z0-9' ]+")
+WHITESPACE = re.compile(r"\s+")
+REGEX_WORD = re.compile(r"(?<![?\\<])\b[a-z][a-z']+\b")
+
+def normalize(text):
+    """
+    Lowercases a transcript and strips its punctuation, e.g. "Shut up!" -> "shut up".
+    """
+    return WHITESPACE.sub(" ", NON_WORD.sub(" ", text.lower().replace("’", "'"))).strip()
+
+class Intent(object):
+    """
+    A locally matched intent.
+
+    Attributes:
+        name (str): The intent name.
+        reply (str): The spoken reply.
+        command (str): The command tag, e.g. "[Lights on]", or None.
+        params (dict): The command parameters.
+        confidence (float): 1 for rule matches, the class probability for the classifier.
+    """
+
+    def __init__(self, name, reply, command=None, params=None, confidence=1.0):
+        self.name = name
+        self.reply = reply
+        self.params = params or {}
+        self.command = command
+        self.confidence = confidence
+
+class IntentClassifier(object):
+    """
+    A tiny multinomial naive Bayes classifier over the words of normalized transcripts.
+
+    A prediction only counts if its probability is at least min_probability, and most of the words of
+    the transcript were seen in the examples of that intent, so unfamiliar requests fall through to "none".
+
+    Args:
+        examples (dict): Example utterances per intent, including a "none" class (default: EXAMPLES).
+        min_probability (float): The minimum class probability (default: 0.8).
+        min_coverage (float): The minimum fraction of known words (default: 0.75).
+    """
+
+    def __init__(self, examples=None, min_probability=0.8, min_coverage=0.75):
+        examples = EXAMPLES if examples is None else examples
+        self.min_probability = min_probability
+        self.min_coverage = min_coverage
+        self._vocabulary = {word for utterances in examples.values() for u in utterances for word in normalize(u).split()}
+        total = sum(len(utterances) for utterances in examples.values())
+        self._priors = {}
+        self._likelihoods = {}
+        self._unseen = {}
+        self._words = {}
+        for intent, utterances in examples.items():
+            counts = Counter(word for u in utterances for word in normalize(u).split())
+            size = sum(counts.values()) + len(self._vocabulary)
+            self._priors[intent] = math.log(len(utterances) / total)
+            self._likelihoods[intent] = {word: math.log((count + 1) / size) for word, count in counts.items()}
+            self._unseen[intent] = math.log(1 / size)
+            self._words[intent] = set(counts)
+
+    def predict(self, text):
+        """
+        Returns:
+            tuple: The intent and its probability, or (None, 0.0) for "none" or an uncertain prediction.
+        """
+        words = text.split()
+        if not words:
+            return None, 0.0
+
+        scores = {}
+        for intent, prior in self._priors.items():
+            likelihoods = self._likelihoods[intent]
+            unseen = self._unseen[intent]
+            scores[intent] = prior + sum(likelihoods.get(word, unseen) for word in words)
+        best = max(scores, key=scores.get)
+        total = sum(math.exp(score - scores[best]) for score in scores.values())
+        probability = 1 / total
+
+        coverage = sum(1 for word in words if word in self._words[best]) / len(words)
+        if best == "none" or probability < self.min_probability or coverage < self.min_coverage:
+            return None, 0.0
+        return best, probability
+
+class IntentMatcher(object):
+    """
+    Answers common commands locally instead of with a chat request.
+
+    Rules are compiled once, and indexed by their keywords, so a transcript only runs the regexes of rules
+    sharing a word with it. Only whole-transcript matches count, once leading and trailing politeness and
+    filler are stripped, which keeps false positives rare: "stop" and "stop now please" match, "stop being
+    so mean" goes to the chat model. If no rule matches, the optional classifier may still recognize a
+    parameterless intent.
+
+    Args:
+        rules (list): The rules, as in RULES (default: RULES).
+        classifier (IntentClassifier): The fallback classifier, None to only use rules (default: None).
+    """
+
+    def __init__(self, rules=None, classifier=None):
+        self._rules = []
+        self._index = {}
+        for name, patterns, reply, command, defaults in (RULES if rules is None else rules):
+            rule = (name, [re.compile(p) for p in patterns], reply, command, defaults)
+            self._rules.append(rule)
+            for pattern in patterns:
+                for word in REGEX_WORD.findall(pattern):
+                    self._index.setdefault(word, []).append(rule)
+        self._by_name = {rule[0]: rule for rule in self._rules}
+        self._classifier = classifier
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.match_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def replies(self):
+        """
+        Returns:
+            list: Every reply, e.g. to pre-render them into the TTS cache.
+        """
+        return sorted({rule[2] for rule in self._rules})
+
+    def _intent(self, rule, params, confidence):
+        name, _, reply, command, defaults = rule
+        params = {**defaults, **params}
+        tag = None
+        if command is not None:
+            # The parameters in the order the command list in the system prompt gives them.
+            values = [params[key] for key in ("state", "color", "temp") if key in params]
+            tag = "[" + " ".join([command] + values) + "]"
+        return Intent(name, reply, tag, params, confidence)
+
+    def _match(self, text):
+        candidates = []
+        for word in text.split():
+            for rule in self._index.get(word, ()):
+                if rule not in candidates:
+                    candidates.append(rule)
+
+        stripped = TRAILING_FILLER.sub("", LEADING_FILLER.sub("", text))
+        for rule in candidates:
+            for pattern in rule[1]:
+                m = pattern.fullmatch(text) or pattern.fullmatch(stripped)
+                if m is not None:
+                    return self._intent(rule, {k: v for k, v in m.groupdict().items() if v is not None}, 1.0)
+
+        if self._classifier is not None:
+            name, probability = self._classifier.predict(text)
+            rule = self._by_name.get(name)
+            # The classifier cannot extract parameters, so only intents without any are accepted.
+            if rule is not None and not any(pattern.groupindex for pattern in rule[1]):
+                return self._intent(rule, {}, probability)
+        return None
+
+    def match(self, transcript):
+        """
+        Returns:
+            Intent: The intent of the transcript, or None if it should go to the chat model.
+        """
+        start = time.perf_counter()
+        intent = self._match(normalize(transcript))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.lookups += 1
+            self.match_seconds += elapsed
+            if intent is not None:
+                self.hits += 1
+        return intent
+
+    def peek(self, transcript):
+        """
+        Like match(), but not counted in the statistics.
+        """
+        return self._match(normalize(transcript))
+
+    def add_saved(self, seconds):
+        """
+        Adds the latency a local answer saved compared to a chat request.
+        """
+        with self._lock:
+            self.saved_seconds += max(0.0, seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups > 0 else 0.0,
+                "mean_match_us": self.match_seconds / self.lookups * 1e6 if self.lookups > 0 else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
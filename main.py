@@ -1,20 +1,124 @@
+import argparse
 import json
-from chat import Chat
-from riva_wrap import RivaTTS
-from assistant import Assistant
-from wake_word import WakeWordDetector
-from devices.mic_wrapper import Microphone
+from functools import partial
+from startup import StartupProfiler
 
 def main():
+    parser = argparse.ArgumentParser(description="GLaDOS voice assistant")
+    parser.add_argument("--profile-startup", dest="profile_startup", action="store_true", help="Print the import and init time of each component once listening")
+    parser.add_argument("--rooms", dest="rooms", type=str, default=None,
+                        help="Serve several rooms from a JSON list of {\"name\", \"mic\", \"speaker\", \"keyword_paths\", \"model_path\", \"sensitivities\"} objects")
+    parser.add_argument("--no-aec", dest="aec", action="store_false", help="Disable echo cancellation, e.g. with a headset or a mic that cancels echo itself")
+    parser.add_argument("--audio-process", dest="audio_process", action="store_true",
+                        help="Capture the mic and detect the wake word in a separate process, so the main process' load cannot delay them. "
+                             "The wake word then hears the mic before echo cancellation")
+    args = parser.parse_args()
+    if args.audio_process and args.aec:
+        print("[Frontend] The wake word runs before echo cancellation with --audio-process, so barge-in over a reply is less reliable")
+
+    profiler = StartupProfiler()
     with open("secrets.json", "r") as f:
         secrets = json.load(f)
+    rooms = None
+    if args.rooms is not None:
+        with open(args.rooms, "r") as f:
+            rooms = json.load(f)
+
+    def make_riva():
+        with profiler.step("riva", "import"):
+            from riva_wrap import RivaTTS
+            from tts_cache import TTSCache
+            from text_normalizer import TextNormalizer
+        with profiler.step("riva", "init"):
+            cache = TTSCache(secrets.get("tts_cache_dir", "tts_cache"))
+            normalizer = TextNormalizer.from_file(secrets["tts_rules"]) if "tts_rules" in secrets else None
+            return RivaTTS(api_url=secrets["riva_url"], rate=22050, cache=cache, normalizer=normalizer)
+
+    def make_chat():
+        with profiler.step("chat", "import"):
+            from chat import Chat
+            from intents import IntentMatcher
+        with profiler.step("chat", "init"):
+            return Chat(secrets["openai_key"], commands=True), IntentMatcher()
+
+    def make_stt():
+        with profiler.step("stt", "import"):
+            from stt import STT
+        with profiler.step("stt", "init"):
+            return STT()
+
+    def make_room(room):
+        # Every device shares one PortAudio instance and device list, and every room needs its own wake word detector.
+        name = room.get("name", "room")
+        with profiler.step(name, "import"):
+            from wake_word import WakeWordDetector
+            from devices.mic_wrapper import Microphone
+            from devices.speaker import Speaker
+        with profiler.step(name, "init"):
+            make_wake = partial(WakeWordDetector, secrets["picovoice_key"], sample_rate=16000, keyword_paths=room.get("keyword_paths", ["glados_de_windows_v3_0_0.ppn"]),
+                                model_path=room.get("model_path", "porcupine_params_de.pv"), sensitivities=room.get("sensitivities"))
+            speaker = Speaker(room.get("speaker", "Anker Speakers"))
+            if args.audio_process:
+                # The detector and the mic are created in the front-end process.
+                from audio_frontend import AudioFrontend
+                frontend = AudioFrontend(partial(Microphone, room.get("mic", "Anker Mic")), make_wake)
+                return frontend.wake_detector(), frontend, speaker
+            return make_wake(), Microphone(room.get("mic", "Anker Mic")), speaker
+
+    room_configs = rooms if rooms is not None else [{}]
+    initializers = {f"room {i}": (lambda room=room: make_room(room)) for i, room in enumerate(room_configs)}
+    components = profiler.parallel(riva=make_riva, chat=make_chat, stt=make_stt, **initializers)
+    riva = components["riva"]
+    chat, intents = components["chat"]
+    stt = components["stt"]
+    devices = [components[f"room {i}"] for i in range(len(room_configs))]
+
+    with profiler.step("assistant", "import"):
+        from assistant import Assistant
+        from chat import SURE_REPLY
+        from connections import KeepAlive
+        from tracing import Tracer
+        from commands import CommandExecutor, LocalBackend, WebhookBackend
+
+    with profiler.step("assistant", "init"):
+        def warm_up_riva():
+            riva.warm_up()
+            riva.warm_cache([SURE_REPLY] + intents.replies())
+
+        # Connections are warmed up in the background: listening starts without waiting for the network.
+        keepalive = KeepAlive(interval=secrets.get("keepalive_interval", 60))
+        keepalive.add("Google STT", stt.warm_up)
+        keepalive.add("Riva", warm_up_riva, ping=riva.warm_up)
+        keepalive.add("OpenAI", chat.warm_up)
+        keepalive.start(warm_up=True)
+
+        # Without a webhook, commands are only logged. Each room gets its own executor on the shared backend,
+        # as an Assistant exports its executor's counts labelled with its room.
+        backend = WebhookBackend(secrets["command_webhook"]) if secrets.get("command_webhook") else LocalBackend()
+
+        tracer = Tracer(secrets.get("trace_path"))
+        if "metrics_port" in secrets:
+            tracer.serve(secrets["metrics_port"])
+
+        if rooms is None:
+            wake, mic, speaker = devices[0]
+            assistant = Assistant(chat, riva, wake, mic=mic, speaker=speaker, stt=stt, tracer=tracer, intents=intents, commands=CommandExecutor(backend),
+                                  echo_cancellation=args.aec)
+        else:
+            from rooms import Supervisor
+            supervisor = Supervisor(chat, riva, stt, tracer=tracer, tts_workers=secrets.get("tts_workers", 4))
+            for room, (wake, mic, speaker) in zip(rooms, devices):
+                supervisor.add_room(room["name"], wake, mic=mic, speaker=speaker, commands=CommandExecutor(backend), echo_cancellation=args.aec)
 
-    riva = RivaTTS(api_url=secrets["riva_url"], rate=22050)
-    chat = Chat(secrets["openai_key"])
-    wake = WakeWordDetector(secrets["picovoice_key"], sample_rate=16000, keyword_paths=["glados_de_windows_v3_0_0.ppn"], model_path="porcupine_params_de.pv")
+    def on_listening():
+        profiler.ready()
+        if args.profile_startup:
+            profiler.report()
 
-    assistant = Assistant(chat, riva, wake, mic_name="Anker Mic", speaker_name="Anker Speakers")
-    assistant.run()
+    if rooms is None:
+        assistant.run(on_listening=on_listening)
+    else:
+        supervisor.run(on_listening=on_listening)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 from riva.client.tts import SpeechSynthesisService
 from riva.client import Auth
-from IPython.display import Audio
-from num2words import num2words
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+import copy
+import hashlib
+from text_normalizer import TextNormalizer
+from connections import GRPC_KEEPALIVE_OPTIONS, wait_for_channel
 import numpy as np
+import os
+import shutil
 import wave
-import pyaudio
+import queue
 import re
+import threading
+import time
 
 class RivaTTS:
     """
@@ -19,56 +27,66 @@ class RivaTTS:
     Args:
         api_url (str): The URL of the RivaTTS API.
         rate (int): The sample rate in Hz for the audio data (default: 22050).
+        max_workers (int): The maximum number of concurrent synthesis requests (default: 4).
+        voice (str): The Riva voice name, None for the server's default voice (default: None).
+        cache (TTSCache): A cache of synthesized audio, None to always synthesize (default: None).
+        normalizer (TextNormalizer): The text normalizer, None for the default rules (default: None).
+        service (SpeechSynthesisService): The synthesis service, None to connect to api_url (default: None).
+        executor (Executor): Runs the synthesis requests, None for a pool of max_workers threads (default: None).
     """
 
     SAMPLE_WIDTH = 2
     NUM_CHANNELS = 1
     MAX_CHARACTERS = 400
+    SENTENCE_END = re.compile(r'(?<=\S[.!?;:])\s+')
 
-    def __init__(self, api_url, rate=22050):
+    def __init__(self, api_url, rate=22050, max_workers=4, voice=None, cache=None, normalizer=None, service=None, executor=None):
         """
         Initializes a new instance of the RivaTTS class.
 
         Args:
             api_url (str): The URL of the RivaTTS API.
             rate (int): The sample rate in Hz for the audio data (default: 22050).
+            max_workers (int): The maximum number of concurrent synthesis requests (default: 4).
+            voice (str): The Riva voice name, None for the server's default voice (default: None).
+            cache (TTSCache): A cache of synthesized audio, None to always synthesize (default: None).
+            normalizer (TextNormalizer): The text normalizer, None for the default rules (default: None).
+            service (SpeechSynthesisService): The synthesis service, None to connect to api_url (default: None).
+            executor (Executor): Runs the synthesis requests, None for a pool of max_workers threads (default: None).
         """
-        self.s = SpeechSynthesisService(Auth(uri=api_url))
+        self.s = service if service is not None else SpeechSynthesisService(self._connect(api_url))
         self.rate = rate
+        self.max_workers = max_workers
+        self.voice = voice
+        self.cache = cache
+        self.normalizer = normalizer if normalizer is not None else TextNormalizer()
+        self._pool = executor if executor is not None else ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="riva-tts")
+
+    def share(self, executor):
+        """
+        Returns a RivaTTS sharing this one's connection, cache and normalizer, whose requests run on
+        another executor, e.g. a room's lane of a FairPool.
+        """
+        tts = copy.copy(self)
+        tts._pool = executor
+        return tts
+
+    @staticmethod
+    def _connect(api_url):
+        try:
+            return Auth(uri=api_url, options=GRPC_KEEPALIVE_OPTIONS)
+        except TypeError:
+            # Older Riva clients cannot pass channel options.
+            return Auth(uri=api_url)
+
+    def warm_up(self, timeout=10.0):
+        """
+        Connects to the Riva server ahead of the first request.
+        """
+        wait_for_channel(self.s.auth.channel, timeout)
 
     def _normalize_text(self, text):
-        def convert_punctuated(m):
-            return num2words(m.group(1).replace(",", ""))
-        text = re.sub(r'(\d{0,3}(,\d{3})+)($|\D)', lambda m: f" {convert_punctuated(m)} {m.group(3)}", text)
-        text = re.sub(r'\d+', lambda m: f" {num2words(m.group())} ", text)
-
-        text = re.sub(r'([a-zA-Z])\.([a-zA-Z])', lambda m: f"{m.group(1)} dot {m.group(2)}", text)
-        text = text.replace("$", " dollars ")
-        text = text.replace("%", " percent ")
-        text = text.replace("€", " euros ")
-        text = text.replace("£", " pounds ")
-        text = text.replace("¥", " yen ")
-        text = text.replace("₪", " shekels ")
-        text = text.replace("*", " asterisk ")
-        text = text.replace("@", " at ")
-        text = text.replace("’", "'")
-        
-        text = text.replace("NTFS", "N T F S")
-        
-        text = text.replace(" °", "degrees")
-        text = text.replace("°", " degrees")
-
-        text = re.sub(r'(\s|^)([Mm][Rr]\.)(\s|$)', lambda m: f"{m.group(1)}mister{m.group(3)}", text)
-        text = re.sub(r'(\s|^)([Mm][Ss]\.)(\s|$)', lambda m: f"{m.group(1)}miss{m.group(3)}", text)
-        text = re.sub(r'(\s|^)([Mm][Rr][Ss]\.)(\s|$)', lambda m: f"{m.group(1)}missus{m.group(3)}", text)
-
-        text = re.sub(r'(\s|^)(USA|usa)(\s|$|\?|!|,)', lambda m: f"{m.group(1)}U S AY{m.group(3)}", text)
-        text = re.sub(r'(\s|^)(UK|uk)(\s|$|\?|!|,)', lambda m: f"{m.group(1)}U KAY{m.group(3)}", text)
-        
-        text = re.sub(r'(\s|^)(AI|ai)(\s|$|\?|!|,|\.)', lambda m: f"{m.group(1)}AY IY{m.group(3)}", text)
-
-        return text
-        
+        return self.normalizer(text)
 
     def _split_text(self, text):
             """
@@ -104,6 +122,289 @@ class RivaTTS:
 
             return result
 
+    def _split_sentences(self, text):
+        """
+        Splits the given text on sentence boundaries, further splitting sentences longer than 400 characters.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list: The list of split strings.
+        """
+        segments = []
+        for sentence in self.SENTENCE_END.split(text.strip()):
+            if sentence:
+                segments.extend(self._split_text(sentence))
+        return segments
+
+    def _synthesize_segment(self, text, trace=None):
+        span = trace.segment(len(text)) if trace is not None else None
+        audio = self.cache.get(text, self.rate, self.voice) if self.cache is not None else None
+        if audio is None:
+            audio = self.s.synthesize(text, voice_name=self.voice, sample_rate_hz=self.rate).audio
+            if self.cache is not None:
+                self.cache.put(text, self.rate, self.voice, audio)
+        elif span is not None:
+            span["cached"] = True
+
+        if span is not None:
+            span["end"] = time.monotonic()
+        return audio
+
+    def warm_cache(self, phrases):
+        """
+        Pre-renders the given phrases into the cache, skipping the ones already cached.
+
+        Args:
+            phrases (iterable): The phrases to render, as they will be passed to the synthesize methods.
+
+        Returns:
+            int: The number of segments that were synthesized.
+        """
+        if self.cache is None:
+            raise ValueError("warm_cache() requires a RivaTTS with a cache.")
+
+        segments = {segment for phrase in phrases for segment in self._split_sentences(self._normalize_text(phrase))}
+        missing = [segment for segment in segments if (segment, self.rate, self.voice) not in self.cache]
+        for _ in self._pool.map(self._synthesize_segment, missing):
+            pass
+        return len(missing)
+
+    def _at_rate(self, rate):
+        if rate is None or rate == self.rate:
+            return self
+        tts = copy.copy(self)
+        tts.rate = rate
+        return tts
+
+    def _digest(self, text):
+        # Identifies what a batch file was rendered from, like the keys of TTSCache.
+        return hashlib.sha1(repr((text, self.rate, self.voice)).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _write_digest(path, digest):
+        # Written after the WAV file is in place, so a digest never vouches for a file that is not.
+        with open(path + ".sha1.part", "w") as f:
+            f.write(digest)
+        os.replace(path + ".sha1.part", path + ".sha1")
+
+    def _is_rendered(self, path, digest):
+        # A WAV file is only ever in place once it was completely written, see _render(), and its digest
+        # sidecar tells whether it was rendered from the same text.
+        try:
+            with open(path + ".sha1", "r") as f:
+                if f.read().strip() != digest:
+                    return False
+            with wave.open(path, "rb") as f:
+                return f.getframerate() == self.rate and f.getnframes() > 0
+        except (FileNotFoundError, EOFError, wave.Error):
+            return False
+
+    def _render(self, text, path):
+        """
+        Synthesizes a normalized text into a WAV file, writing each sentence as soon as it is ready.
+        The file is written under a temporary name and moved into place once complete.
+
+        Returns:
+            int: The number of frames written.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        partial = path + ".part"
+        frames = 0
+        with wave.open(partial, "wb") as f:
+            f.setnchannels(self.NUM_CHANNELS)
+            f.setsampwidth(self.SAMPLE_WIDTH)
+            f.setframerate(self.rate)
+            for segment in self._split_sentences(text):
+                audio = self._synthesize_segment(segment)
+                f.writeframes(audio)
+                frames += len(audio) // self.SAMPLE_WIDTH
+        os.replace(partial, path)
+        return frames
+
+    def synthesize_batch(self, jobs, concurrency=None, resume=True, on_done=None):
+        """
+        Renders many texts into WAV files, e.g. announcements and cached replies.
+
+        Texts that are identical once normalized (at the same rate) are synthesized once, and the file is
+        copied to their other paths. Up to `concurrency` texts are synthesized at once, one Riva request
+        each, so the server sees a bounded load however long the batch is. Each file is written sentence by
+        sentence as the audio arrives, and only moved into place once complete. Next to each file, a
+        "<out_path>.sha1" file records the normalized text, rate and voice it was rendered from. With resume,
+        files already in place are kept if that still matches, so an interrupted batch continues where it
+        stopped, and a changed text is rendered again.
+
+        An out_path listed more than once is rendered once if the entries agree, and rejected if they do not.
+
+        Args:
+            jobs (iterable): Dicts with "text", "out_path" and optionally "rate" (default: this instance's rate).
+            concurrency (int): The number of concurrent synthesis requests (default: max_workers).
+            resume (bool): Whether files already rendered are kept (default: True).
+            on_done (callable): Called with each out_path once it is written, or with it and the error if it failed (default: None).
+
+        Returns:
+            dict: The jobs, the unique texts, the files kept, rendered, copied and failed, the characters and
+                  audio seconds synthesized, and the wall time in seconds.
+
+        Raises:
+            ValueError: If an out_path is listed with different texts or rates. Nothing is rendered then.
+        """
+        groups = {}
+        # Jobs writing the same file would race on its temporary file.
+        keys_by_path = {}
+        stats = {"jobs": 0, "unique": 0, "kept": 0, "rendered": 0, "copied": 0, "failed": 0, "characters": 0, "audio_seconds": 0.0, "seconds": 0.0}
+        for job in jobs:
+            tts = self._at_rate(job.get("rate"))
+            key = (tts._normalize_text(job["text"]), tts.rate)
+            path = os.path.abspath(job["out_path"])
+            if path in keys_by_path:
+                if keys_by_path[path] != key:
+                    raise ValueError(f"[TTS] {job['out_path']} is listed more than once, with different texts or rates.")
+                continue
+            keys_by_path[path] = key
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = (tts, [])
+            group[1].append(job["out_path"])
+            stats["jobs"] += 1
+        stats["unique"] = len(groups)
+
+        lock = threading.Lock()
+        start = time.monotonic()
+
+        # Every path but the rendered one ends here, copied or failed.
+        def finish(path, error=None):
+            with lock:
+                stats["failed" if error is not None else "copied"] += 1
+            if on_done is None:
+                return
+            if error is not None:
+                on_done(path, error)
+            else:
+                on_done(path)
+
+        def run(text, tts, paths):
+            digest = tts._digest(text)
+            done = [path for path in paths if resume and tts._is_rendered(path, digest)]
+            pending = [path for path in paths if path not in done]
+            with lock:
+                stats["kept"] += len(done)
+            if not pending:
+                return
+            if done:
+                source = done[0]
+            else:
+                source = pending.pop(0)
+                try:
+                    frames = tts._render(text, source)
+                    tts._write_digest(source, digest)
+                except Exception as e:
+                    for path in [source] + pending:
+                        finish(path, e)
+                    return
+                with lock:
+                    stats["rendered"] += 1
+                    stats["characters"] += len(text)
+                    stats["audio_seconds"] += frames / tts.rate
+                if on_done is not None:
+                    on_done(source)
+            for path in pending:
+                try:
+                    directory = os.path.dirname(path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    shutil.copyfile(source, path + ".part")
+                    os.replace(path + ".part", path)
+                    tts._write_digest(path, digest)
+                except Exception as e:
+                    finish(path, e)
+                else:
+                    finish(path)
+
+        # A pool of its own: each worker runs its requests one by one, so it holds at most one in flight.
+        with ThreadPoolExecutor(max_workers=concurrency or self.max_workers, thread_name_prefix="riva-batch") as pool:
+            for future in [pool.submit(run, text, tts, paths) for (text, _), (tts, paths) in groups.items()]:
+                future.result()
+        stats["seconds"] = time.monotonic() - start
+        return stats
+
+    def synthesize_stream(self, text):
+        """
+        Synthesizes the given text sentence by sentence, yielding audio as soon as each sentence is ready.
+
+        Sentences are synthesized concurrently on a bounded worker pool, and yielded in order.
+        Closing the generator early cancels the sentences that have not started yet.
+
+        Args:
+            text (str): The text to synthesize.
+
+        Yields:
+            bytes: The raw audio data of each sentence.
+        """
+        segments = deque(self._split_sentences(self._normalize_text(text)))
+        pending = deque()
+        try:
+            while segments or pending:
+                # Keep at most max_workers sentences in flight, so a long reply does not flood the server.
+                while segments and len(pending) < self.max_workers:
+                    pending.append(self._pool.submit(self._synthesize_segment, segments.popleft()))
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def synthesize_iter(self, texts, trace=None):
+        """
+        Synthesizes phrases as they arrive from an iterable, yielding audio in order as soon as each one is ready.
+
+        The iterable is consumed on a separate thread, so a slow producer (e.g. a streaming chat reply)
+        does not hold back audio of the phrases that already arrived. Closing the generator early stops
+        consuming the iterable and cancels the phrases that have not started yet.
+
+        Args:
+            texts (iterable): The phrases to synthesize.
+            trace (TurnTrace): Records the synthesis time of each segment (default: None).
+
+        Yields:
+            bytes: The raw audio data of each phrase.
+        """
+        futures = queue.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for text in texts:
+                    for segment in self._split_sentences(self._normalize_text(text)):
+                        if stopped.is_set():
+                            return
+                        future = self._pool.submit(self._synthesize_segment, segment, trace)
+                        futures.put(future)
+                        if stopped.is_set():
+                            future.cancel()
+            except Exception as e:
+                failed = Future()
+                failed.set_exception(e)
+                futures.put(failed)
+            finally:
+                futures.put(None)
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                future = futures.get()
+                if future is None:
+                    break
+                yield future.result()
+        finally:
+            stopped.set()
+            while not futures.empty():
+                future = futures.get_nowait()
+                if future is not None:
+                    future.cancel()
+
     def synthesize_raw(self, text):
         """
         Synthesizes the given text into raw audio data.
@@ -114,12 +415,7 @@ class RivaTTS:
         Returns:
             bytes: The raw audio data.
         """
-        text = self._normalize_text(text)
-        texts = self._split_text(text)
-
-        audio_segments = [self.s.synthesize(t, sample_rate_hz=self.rate).audio for t in texts]
-
-        return b"".join(audio_segments)
+        return b"".join(self.synthesize_stream(text))
     
     def synthesize_display(self, text, autoplay=False):
         """
@@ -132,6 +428,8 @@ class RivaTTS:
         Returns:
             Audio: The Audio object for display.
         """
+        # IPython is slow to import and only needed in notebooks.
+        from IPython.display import Audio
         return Audio(np.frombuffer(self.synthesize_raw(text), dtype=np.int16), rate=self.rate, autoplay=autoplay)
 
     def synthesize_wave_stream(self, text, stream):
@@ -170,24 +468,68 @@ class RivaTTS:
         Args:
             text (str): The text to synthesize.
         """
-        p = pyaudio.PyAudio()
+        import pyaudio
+        from devices.pyaudio_wrap import shared_pyaudio
+        p = shared_pyaudio()
         stream = p.open(format=pyaudio.paInt16, channels=self.NUM_CHANNELS, rate=self.rate, output=True)
         stream.write(self.synthesize_raw(text))
         stream.stop_stream()
         stream.close()
-        p.terminate()
 
 if __name__ == "__main__":
     import argparse
     import sys
+    from tts_cache import TTSCache
 
     parser = argparse.ArgumentParser(description="Text-to-Speech Wrapper")
     parser.add_argument("--stdin", dest="stdin", action="store_const", const=True, default=False, help="Read text from stdin (Otherwise is interactive)")
     parser.add_argument("--api_url", dest="api_url", type=str, help="The URL of the RivaTTS API", required=True)
     parser.add_argument("--rate", dest="rate", type=int, help="The sample rate in Hz for the audio data", default=22050)
+    parser.add_argument("--voice", dest="voice", type=str, help="The Riva voice name", default=None)
+    parser.add_argument("--cache_dir", dest="cache_dir", type=str, help="The directory of the on-disk TTS cache", default=None)
+    parser.add_argument("--rules", dest="rules", type=str, help="A JSON file of extra text normalization rules", default=None)
+    parser.add_argument("--warm_cache", dest="warm_cache", type=str, help="Pre-render every line of this file into the cache and exit", default=None)
+    parser.add_argument("--batch", dest="batch", type=str, help="Render a JSONL manifest of {\"text\", \"out_path\", \"rate\"} objects into WAV files and exit", default=None)
+    parser.add_argument("--concurrency", dest="concurrency", type=int, help="The concurrent synthesis requests of --batch", default=4)
+    parser.add_argument("--no_resume", dest="resume", action="store_false", help="Render every file of --batch again, instead of keeping the ones already written")
     args = vars(parser.parse_args())
 
-    riva_tts = RivaTTS(api_url=args["api_url"], rate=args["rate"])
+    cache = TTSCache(args["cache_dir"]) if args["cache_dir"] is not None else None
+    normalizer = TextNormalizer.from_file(args["rules"]) if args["rules"] is not None else None
+    riva_tts = RivaTTS(api_url=args["api_url"], rate=args["rate"], voice=args["voice"], cache=cache, normalizer=normalizer)
+    if args["warm_cache"]:
+        if cache is None:
+            parser.error("--warm_cache requires --cache_dir")
+        with open(args["warm_cache"], "r") as f:
+            phrases = [line.strip() for line in f if line.strip()]
+        rendered = riva_tts.warm_cache(phrases)
+        print(f"[TTS] Rendered {rendered} new segments for {len(phrases)} phrases into {args['cache_dir']}")
+        exit()
+
+    if args["batch"]:
+        import json
+        with open(args["batch"], "r") as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+        finished = [0]
+
+        def on_done(path, error=None):
+            finished[0] += 1
+            if error is not None:
+                print(f"[TTS] {path} failed: {error}")
+            elif finished[0] % 50 == 0:
+                print(f"[TTS] {finished[0]} files written")
+
+        try:
+            stats = riva_tts.synthesize_batch(jobs, concurrency=args["concurrency"], resume=args["resume"], on_done=on_done)
+        except ValueError as e:
+            parser.error(str(e))
+        seconds = max(stats["seconds"], 1e-9)
+        print(f"[TTS] {stats['jobs']} files from {stats['unique']} unique texts: {stats['rendered']} rendered, {stats['copied']} copied, "
+              f"{stats['kept']} kept from a previous run, {stats['failed']} failed")
+        print(f"[TTS] {stats['characters']} characters into {stats['audio_seconds']:.1f} s of audio in {stats['seconds']:.1f} s: "
+              f"{stats['characters'] / seconds:.0f} characters/s, {stats['audio_seconds'] / seconds:.1f} audio seconds/s")
+        exit(1 if stats["failed"] else 0)
+
     if args["stdin"]:
         text = sys.stdin.read()
         riva_tts.synthesize_wave_stream(text, sys.stdout.buffer)
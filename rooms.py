@@ -0,0 +1,127 @@
+from assistant import Assistant
+from chat import Chat
+from fair_pool import FairPool
+from intents import IntentMatcher
+from riva_wrap import RivaTTS
+from stt import STT
+from tracing import Tracer
+from functools import partial
+import threading
+
+class Room(object):
+    """
+    A capture/playback endpoint of the Supervisor and the Assistant serving it.
+    """
+
+    def __init__(self, name, assistant: Assistant):
+        self.name = name
+        self.assistant = assistant
+        self.thread: threading.Thread = None
+        self.restarts = 0
+        self.error = None
+
+class Supervisor(object):
+    """
+    Serves several rooms from one process, each with its own mic, speaker, wake word detector,
+    conversation history and intent statistics.
+
+    The rooms share one Riva connection and TTS cache, one chat connection pool and one STT client.
+    Synthesis requests of all rooms run on one FairPool with a lane per room, which serves the rooms
+    round robin, so a room reading out a long reply cannot starve the others.
+
+    Each room runs its Assistant on its own thread. If it fails, e.g. because its mic was unplugged,
+    it is restarted after restart_delay seconds, and the other rooms keep running.
+
+    Args:
+        chat (Chat): The chat backend. Each room gets a conversation() of it.
+        tts (RivaTTS): The TTS backend. Each room gets a share() of it on its lane.
+        stt (STT): The STT client of every room.
+        tracer (Tracer): The tracer of every room, whose turns and metrics are labelled by room (default: None).
+        tts_workers (int): The number of concurrent synthesis requests of all rooms (default: 4).
+        restart_delay (float): The seconds before a failed room is restarted (default: 2).
+    """
+
+    def __init__(self, chat: Chat, tts: RivaTTS, stt: STT, tracer: Tracer = None, tts_workers=4, restart_delay=2.0):
+        self.chat = chat
+        self.tts = tts
+        self.stt = stt
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.pool = FairPool(tts_workers, thread_name_prefix="room-tts")
+        self.restart_delay = restart_delay
+        self.rooms = {}
+        self._stopped = threading.Event()
+
+    def add_room(self, name, wake_word_detector, mic=None, speaker=None, chat=None, stt=None, intents=None, **assistant_args) -> Room:
+        """
+        Adds a room. mic, speaker, chat and stt default to devices opened by name, a new conversation
+        and the shared STT client.
+
+        Args:
+            name (str): The room name, which labels its turns and metrics.
+            wake_word_detector (WakeWordDetector): The room's own detector, as detectors are stateful.
+            assistant_args: Passed on to the Assistant, e.g. mic_name and speaker_name.
+        """
+        if name in self.rooms:
+            raise ValueError(f"[Rooms] Duplicate room '{name}'.")
+        assistant = Assistant(chat if chat is not None else self.chat.conversation(), self.tts.share(self.pool.lane(name)), wake_word_detector,
+                              mic=mic, speaker=speaker, stt=stt if stt is not None else self.stt, tracer=self.tracer,
+                              intents=intents if intents is not None else IntentMatcher(), room=name, **assistant_args)
+        room = self.rooms[name] = Room(name, assistant)
+        return room
+
+    def _run_room(self, room: Room, on_listening):
+        while not self._stopped.is_set():
+            try:
+                room.assistant.run(on_listening=on_listening)
+                return
+            except Exception as e:
+                room.error = e
+                room.restarts += 1
+                print(f"[Rooms] {room.name} failed, restarting in {self.restart_delay:.0f}s: {e}")
+                if self._stopped.wait(self.restart_delay):
+                    return
+
+    def start(self, on_listening=None):
+        """
+        Args:
+            on_listening (callable): Called once every room's mic is capturing (default: None).
+        """
+        self._stopped.clear()
+        waiting = set(self.rooms)
+        lock = threading.Lock()
+
+        def room_listening(name):
+            with lock:
+                if name not in waiting:
+                    return
+                waiting.discard(name)
+                done = not waiting
+            if done and on_listening is not None:
+                on_listening()
+
+        for room in self.rooms.values():
+            room.thread = threading.Thread(target=self._run_room, args=(room, partial(room_listening, room.name)), name=f"room-{room.name}", daemon=True)
+            room.thread.start()
+        print(f"[Rooms] Serving {len(self.rooms)} rooms: {', '.join(self.rooms)}")
+
+    def run(self, on_listening=None):
+        """
+        Serves every room until all of their mic streams end.
+        """
+        self.start(on_listening)
+        for room in self.rooms.values():
+            room.thread.join()
+
+    def stop(self):
+        """
+        Stops restarting failed rooms.
+        """
+        self._stopped.set()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per room, its restarts and the queueing of its synthesis requests.
+        """
+        lanes = self.pool.stats()
+        return {name: {"restarts": room.restarts, "tts": lanes.get(name, {})} for name, room in self.rooms.items()}
@@ -0,0 +1,215 @@
+from chat import Chat, get_message
+from intents import normalize
+from tracing import TurnTrace
+import queue
+import threading
+import time
+
+class Speculation(object):
+    """
+    A chat request started from an interim transcript, before the final one is known.
+
+    The reply is read ahead on a background thread, and nothing is added to the chat history until
+    accept() is called. It can be iterated and cancelled like a ChatStream.
+    """
+
+    def __init__(self, chat: Chat, request: str):
+        self.request = request
+        self.text = ""
+        self.requested_at = time.monotonic()
+        self.first_token_at = None
+        self._chat = chat
+        self._deltas = queue.Queue()
+        self._stream = None
+        self._cancelled = threading.Event()
+        self._accepted = False
+        self._done = False
+        self._trace: TurnTrace = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            if self._stream is not None and not self._stream.cancelled:
+                self._stream.cancel()
+
+    def accept(self, trace: TurnTrace = None):
+        """
+        Uses the reply for the turn: its request and reply are added to the history once it ends,
+        and its timings are copied to the trace.
+        """
+        with self._lock:
+            self._accepted = True
+            self._trace = trace
+            done = self._done
+            if trace is not None:
+                trace.mark("chat_request", at=self.requested_at)
+                if self.first_token_at is not None:
+                    trace.mark("chat_first_token", at=self.first_token_at)
+        if done:
+            self._record()
+
+    def _record(self):
+        if self.text:
+            self._chat.add_exchange(self.request, self.text)
+        if self._trace is not None:
+            self._trace.mark("chat_response")
+
+    def _run(self):
+        try:
+            stream = self._chat.chat_stream(self.request, record=False)
+            with self._lock:
+                self._stream = stream
+            if self.cancelled:
+                stream.cancel()
+
+            for delta in stream:
+                if self.first_token_at is None:
+                    with self._lock:
+                        self.first_token_at = time.monotonic()
+                        if self._trace is not None:
+                            self._trace.mark("chat_first_token", at=self.first_token_at)
+                self.text += delta
+                self._deltas.put(delta)
+        except Exception as e:
+            if not self.cancelled:
+                self._deltas.put(e)
+        finally:
+            self._deltas.put(None)
+            with self._lock:
+                self._done = True
+                accepted = self._accepted
+            if accepted:
+                self._record()
+
+    def __iter__(self):
+        while not self.cancelled:
+            delta = self._deltas.get()
+            if delta is None:
+                return
+            if isinstance(delta, Exception):
+                raise delta
+            yield delta
+
+class Speculator(object):
+    """
+    Starts chat requests from interim STT transcripts, to overlap the chat latency with STT endpointing.
+
+    Once an interim transcript has not changed for stable_ms, a Speculation is started for it. When the
+    final transcript arrives, take() returns that Speculation if both transcripts have the same words,
+    and cancels it otherwise, so the caller issues a regular request instead. A changing interim
+    transcript also cancels a Speculation that no longer matches it.
+
+    Args:
+        chat (Chat): The chat to send requests to.
+        stable_ms (int): How long an interim transcript must stay the same (default: 300).
+        min_words (int): The minimum number of words of a speculative request (default: 2).
+        accept (callable): Decides whether a transcript is worth a chat request, e.g. not a local intent (default: None).
+    """
+
+    def __init__(self, chat: Chat, stable_ms=300, min_words=2, accept=None):
+        self._chat = chat
+        self.stable_ms = stable_ms
+        self.min_words = min_words
+        self._accept = accept
+        self._lock = threading.Lock()
+        self._interim = None
+        self._timer = None
+        self._speculation: Speculation = None
+        self._speculation_tokens = 0
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted_tokens = 0
+
+    def _worth_it(self, text):
+        return len(text.split()) >= self.min_words and (self._accept is None or self._accept(text))
+
+    def _discard(self):
+        # Must be called with the lock held.
+        speculation = self._speculation
+        if speculation is None:
+            return
+        self._speculation = None
+        speculation.cancel()
+        self.misses += 1
+        counter = self._chat.context.counter
+        self.wasted_tokens += self._speculation_tokens + counter.count_text(speculation.text)
+
+    def on_interim(self, transcript):
+        """
+        Handles an interim transcript, from the STT thread.
+        """
+        text = normalize(transcript)
+        with self._lock:
+            if text == self._interim:
+                return
+            self._interim = text
+            if self._timer is not None:
+                self._timer.cancel()
+            if self._speculation is not None and normalize(self._speculation.request) != text:
+                self._discard()
+            if self._speculation is None and self._worth_it(text):
+                self._timer = threading.Timer(self.stable_ms / 1000, self._launch, args=(transcript, text))
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _launch(self, transcript, text):
+        with self._lock:
+            if self._interim != text or self._speculation is not None:
+                return
+            self._speculation = Speculation(self._chat, transcript)
+            self._speculation_tokens = self._chat.context.tokens + self._chat.context.counter.count(get_message("user", transcript))
+            self.launched += 1
+            print(f"[Chat] Speculating on: {transcript}")
+
+    def take(self, transcript, trace: TurnTrace = None) -> Speculation:
+        """
+        Ends the utterance with its final transcript.
+
+        Returns:
+            Speculation: The accepted speculation, or None if the caller has to send a regular request.
+        """
+        with self._lock:
+            self._interim = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            speculation = self._speculation
+            if speculation is None:
+                return None
+            if transcript and normalize(transcript) == normalize(speculation.request) and self._worth_it(normalize(transcript)):
+                self._speculation = None
+                self.hits += 1
+            else:
+                self._discard()
+                return None
+        speculation.accept(trace)
+        return speculation
+
+    def cancel(self):
+        """
+        Drops the current utterance, e.g. when its STT session is cancelled.
+        """
+        with self._lock:
+            self._interim = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._discard()
+
+    def stats(self):
+        with self._lock:
+            decided = self.hits + self.misses
+            return {
+                "launched": self.launched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / decided if decided > 0 else 0.0,
+                "wasted_tokens": self.wasted_tokens,
+            }
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import time
+
+class StartupProfiler(object):
+    """
+    Times the import and init steps of each component at startup, and runs independent
+    initializers concurrently.
+
+    Heavy modules (the Riva, Google and OpenAI clients, Porcupine, PortAudio) are imported inside
+    the initializers, so their imports overlap as well, instead of running one after another at load.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.ready_at = None
+        self._steps = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self, component, phase):
+        """
+        Times a step of a component, e.g. step("riva", "import").
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._steps.append((component, phase, start - self.started_at, end - start, threading.current_thread().name))
+
+    def parallel(self, **initializers):
+        """
+        Runs independent initializers concurrently.
+
+        Args:
+            initializers (callable): The initializer of each component, by name.
+
+        Returns:
+            dict: The result of each initializer, by name.
+
+        Raises:
+            Exception: The first exception of an initializer, once all of them have finished.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, len(initializers)), thread_name_prefix="startup") as pool:
+            futures = {name: pool.submit(fn) for name, fn in initializers.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def ready(self):
+        """
+        Marks the moment the assistant is listening.
+        """
+        self.ready_at = time.perf_counter()
+
+    def report(self):
+        with self._lock:
+            steps = sorted(self._steps, key=lambda s: s[2])
+        totals = {}
+        for component, phase, _, seconds, _ in steps:
+            phases = totals.setdefault(component, {})
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+        print(f"[Startup] {'Component':<12} {'Import':>9} {'Init':>9}")
+        for component, phases in totals.items():
+            imported = phases.get("import", 0.0) * 1000
+            init = phases.get("init", 0.0) * 1000
+            print(f"[Startup] {component:<12} {imported:7.1f}ms {init:7.1f}ms")
+        print(f"[Startup] {'Step':<20} {'Start':>9} {'Duration':>9}  Thread")
+        for component, phase, start, seconds, thread in steps:
+            print(f"[Startup] {component + ' ' + phase:<20} {start * 1000:7.1f}ms {seconds * 1000:7.1f}ms  {thread}")
+        if self.ready_at is not None:
+            print(f"[Startup] Listening after {(self.ready_at - self.started_at) * 1000:.1f}ms")
@@ -1,54 +1,173 @@
 from google.cloud import speech
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
 import threading
-from byte_fifo import ByteFIFO
+from byte_fifo import ByteFIFO, OverflowPolicy
+from connections import GRPC_KEEPALIVE_OPTIONS, wait_for_channel
 
 def _requests_generator(stream):
     for chunk in stream:
         yield speech.StreamingRecognizeRequest(audio_content=chunk)
 
+def _keepalive_channel(*args, options=(), **kwargs):
+    return SpeechGrpcTransport.create_channel(*args, options=list(options) + GRPC_KEEPALIVE_OPTIONS, **kwargs)
+
 class STT(object):
+    """
+    A Google STT client. Its gRPC channel is kept alive while idle, so a single instance can serve
+    every STT session without reconnecting.
+    """
+
     def __init__(self):
-        self.client = speech.SpeechClient()
+        self.client = speech.SpeechClient(transport=SpeechGrpcTransport(channel=_keepalive_channel))
+
+    def warm_up(self, timeout=10.0):
+        """
+        Connects the channel ahead of the first request.
+        """
+        wait_for_channel(self.client.transport.grpc_channel, timeout)
+
+    def recognize_stream_command(self, stream, on_call=None, on_interim=None) -> str:
+        """
+        Streams audio chunks to Google STT until the first final transcript.
 
-    def recognize_stream_command(self, stream) -> str:
+        Args:
+            stream (iterable): The audio chunks. The request stream ends when it is exhausted.
+            on_call (callable): Receives the streaming call as soon as it is opened, so it can be cancelled.
+            on_interim (callable): If set, interim results are requested, and it receives each interim transcript.
+
+        Returns:
+            str: The transcript, or None if the stream ended without one.
+        """
         config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
             sample_rate_hertz=16000,
             language_code="en-US",
         )
-        streaming_config = speech.StreamingRecognitionConfig(config=config, single_utterance=True)
+        streaming_config = speech.StreamingRecognitionConfig(config=config, single_utterance=True, interim_results=on_interim is not None)
         responses = self.client.streaming_recognize(streaming_config, _requests_generator(stream))
+        if on_call is not None:
+            on_call(responses)
 
         for response in responses:
             for result in response.results:
                 if result.is_final:
                     return result.alternatives[0].transcript
+            if on_interim is not None and response.results:
+                # Interim results are consecutive pieces of the utterance, the first one the most stable.
+                on_interim("".join(result.alternatives[0].transcript for result in response.results if result.alternatives))
 
 class STTAction(object):
-    def __init__(self, chunk_size=4096):
-        self._stt = STT()
+    """
+    Runs a single STT request on a background thread, fed by handle_chunk().
+
+    Args:
+        chunk_size (int): The target size in bytes of each request sent to STT (default: 4096).
+        max_latency (float): If set, requests are held back until chunk_size bytes were aggregated
+                             or max_latency seconds passed. Otherwise whatever audio is available is
+                             sent as soon as it arrives (default: None).
+        on_result (callable): Called from the STT thread with the transcript, or None if the request failed,
+                              unless cancelled (default: None).
+        on_interim (callable): Called from the STT thread with each interim transcript, unless cancelled (default: None).
+        endpointer (VADEndpointer): If set, audio is only sent once it detects speech, and the stream is
+                                    closed once it detects the end of the utterance (default: None).
+        stt (STT): The STT backend, shared between sessions. None creates a new one on the STT thread (default: None).
+        trace (TurnTrace): Records when audio starts and stops streaming, and the final result (default: None).
+    """
+
+    def __init__(self, chunk_size=4096, max_latency=None, on_result=None, endpointer=None, stt=None, trace=None, on_interim=None):
         self.result = None
-        self._fifo = ByteFIFO()
+        self._on_interim = on_interim
+        self._trace = trace
+        self._stt = stt
+        self._on_result = on_result
+        self._endpointer = endpointer
+        self._fifo = ByteFIFO(capacity=16000 * 2 * 10, overflow=OverflowPolicy.DROP_OLDEST)
         self._chunk_size = chunk_size
-        self._lock = threading.Lock()
+        self._max_latency = max_latency
+        self._cancelled = threading.Event()
+        self._call = None
+        self._call_lock = threading.Lock()
         self._thread = threading.Thread(target=self._run, args=(self._chunks_generator(),), daemon=True)
         self._thread.start()
 
     def handle_chunk(self, chunk):
-        with self._lock:
-            self._fifo.put(chunk)
+        if self._endpointer is not None:
+            chunk = self._endpointer.process(chunk)
+            if len(chunk) > 0:
+                self._fifo.put(chunk)
+            if self._endpointer.ended:
+                self.close()
+            return
+
+        self._fifo.put(chunk)
 
     def is_done(self) -> bool:
         return not self._thread.is_alive()
 
+    @property
+    def closed(self):
+        return self._fifo.closed
+
+    def close(self):
+        """
+        Ends the audio stream. The request generator finishes once the buffered audio is sent,
+        and STT returns its final result.
+        """
+        self._fifo.close()
+
+    def cancel(self):
+        """
+        Aborts the STT request immediately, discarding any result.
+        """
+        self._cancelled.set()
+        self._fifo.close()
+        with self._call_lock:
+            if self._call is not None:
+                self._call.cancel()
+
+    def _on_call(self, call):
+        with self._call_lock:
+            self._call = call
+            if self._cancelled.is_set():
+                call.cancel()
+
+    def _interim(self, text):
+        if not self._cancelled.is_set():
+            self._on_interim(text)
+
     def _chunks_generator(self):
-        while True:
-            chunk = None
-            with self._lock:
-                    chunk = self._fifo.get(self._chunk_size)
-            
-            if chunk is not None:
-                yield bytes(chunk)
+        while self._fifo.wait_nonempty():
+            if self._max_latency is not None:
+                self._fifo.wait_size(self._chunk_size, self._max_latency)
+            if self._trace is not None:
+                self._trace.mark("stt_start")
+            yield self._fifo.get(self._chunk_size)
+        if self._trace is not None:
+            self._trace.mark("stt_audio_end")
 
     def _run(self, generator) -> str:
-        self.result = self._stt.recognize_stream_command(generator)
+        try:
+            # A new client is created here rather than in __init__, so starting an STTAction never
+            # blocks the caller. Audio is buffered in the FIFO meanwhile.
+            stt = self._stt if self._stt is not None else STT()
+            result = stt.recognize_stream_command(generator, on_call=self._on_call,
+                                                  on_interim=self._interim if self._on_interim is not None else None)
+        except Exception as e:
+            # Nothing joins this thread, so the failure ends the turn here rather than being raised.
+            if not self._cancelled.is_set():
+                if self._trace is not None:
+                    self._trace.finish("failed")
+                if self._on_result is not None:
+                    self._on_result(None)
+                print(f"[STT] Request failed: {e}")
+            return
+        finally:
+            self._fifo.close()
+
+        if not self._cancelled.is_set():
+            if self._trace is not None:
+                self._trace.mark("stt_final")
+                self._trace.text = result
+            self.result = result
+            if self._on_result is not None:
+                self._on_result(result)
@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+import pytest
+from byte_fifo import ByteFIFO, OverflowPolicy
+
+def test_get_returns_bytes_in_order():
+    fifo = ByteFIFO(capacity=16)
+    fifo.put(b"hello ")
+    fifo.put(bytearray(b"world"))
+    assert fifo.get(3) == b"hel"
+    assert type(fifo.get(3)) is bytes
+    assert fifo.get(100) == b"world"
+    assert fifo.get(1) == b""
+    assert len(fifo) == 0
+
+def test_reads_and_writes_wrap_around_the_end():
+    fifo = ByteFIFO(capacity=10)
+    fifo.put(b"01234567")
+    assert fifo.get(6) == b"012345"
+    fifo.put(b"abcdef")
+    assert fifo.peek(4) == b"67ab"
+    assert fifo.get(3) == b"67a"
+    buf = bytearray(10)
+    assert fifo.readinto(buf) == 5
+    assert buf[:5] == b"bcdef"
+
+def test_readinto_fills_a_caller_buffer():
+    fifo = ByteFIFO(capacity=8)
+    fifo.put(b"abcdef")
+    buf = bytearray(4)
+    assert fifo.readinto(memoryview(buf)) == 4
+    assert buf == b"abcd"
+    assert fifo.readinto(buf) == 2
+    assert buf[:2] == b"ef"
+    assert fifo.readinto(buf) == 0
+
+def test_grow_keeps_everything():
+    fifo = ByteFIFO(capacity=4, overflow=OverflowPolicy.GROW)
+    fifo.put(b"ab")
+    fifo.get(1)
+    fifo.put(b"cdefghij")
+    assert fifo.capacity >= 9
+    assert fifo.get(100) == b"bcdefghij"
+
+def test_drop_oldest_keeps_the_newest_bytes():
+    fifo = ByteFIFO(capacity=8, overflow=OverflowPolicy.DROP_OLDEST)
+    fifo.put(b"012345")
+    fifo.put(b"6789")
+    assert fifo.dropped == 2
+    assert fifo.get(100) == b"23456789"
+    fifo.put(b"abcdefghijkl")
+    assert fifo.dropped == 6
+    assert fifo.get(100) == b"efghijkl"
+
+def test_block_waits_for_room():
+    fifo = ByteFIFO(capacity=4, overflow=OverflowPolicy.BLOCK)
+    assert fifo.put(b"abcdef", timeout=0.05) == 4
+
+    def drain():
+        time.sleep(0.05)
+        fifo.get(4)
+
+    thread = threading.Thread(target=drain)
+    thread.start()
+    assert fifo.put(b"gh", timeout=5) == 2
+    thread.join()
+    assert fifo.get(100) == b"gh"
+
+def test_block_put_returns_when_closed():
+    fifo = ByteFIFO(capacity=2, overflow=OverflowPolicy.BLOCK)
+    fifo.put(b"ab")
+    threading.Timer(0.05, fifo.close).start()
+    assert fifo.put(b"cd") == 0
+
+def test_get_waits_up_to_its_timeout():
+    fifo = ByteFIFO(capacity=8)
+    start = time.monotonic()
+    assert fifo.get(4, timeout=0.05) == b""
+    assert time.monotonic() - start >= 0.04
+
+    threading.Timer(0.05, fifo.put, args=(b"xy",)).start()
+    assert fifo.get(4, timeout=5) == b"xy"
+
+def test_close_wakes_a_blocked_reader():
+    fifo = ByteFIFO(capacity=8)
+    threading.Timer(0.05, fifo.close).start()
+    assert fifo.get(4, timeout=None) == b""
+    assert not fifo.wait_nonempty()
+
+def test_wait_size():
+    fifo = ByteFIFO(capacity=8)
+    fifo.put(b"ab")
+    assert not fifo.wait_size(4, timeout=0.01)
+    fifo.put(b"cd")
+    assert fifo.wait_size(4, timeout=0)
+
+@pytest.mark.parametrize("overflow", [OverflowPolicy.GROW, OverflowPolicy.DROP_OLDEST])
+def test_matches_a_bytearray_reference(overflow):
+    rng = random.Random(0)
+    fifo = ByteFIFO(capacity=37, overflow=overflow)
+    reference = bytearray()
+    for _ in range(5000):
+        if rng.random() < 0.5:
+            data = bytes(rng.randrange(256) for _ in range(rng.randrange(30)))
+            fifo.put(data)
+            reference += data
+            if overflow is OverflowPolicy.DROP_OLDEST:
+                del reference[:max(0, len(reference) - 37)]
+        else:
+            size = rng.randrange(40)
+            assert fifo.get(size) == reference[:size]
+            del reference[:size]
+        assert len(fifo) == len(reference)
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        ByteFIFO(capacity=0)
@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+import pytest
+
+# chat imports the OpenAI client, httpx and, through riva_wrap, the Riva client.
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("riva.client")
+
+from chat import Chat, split_phrases
+
+class FakeResponse(object):
+    def __init__(self, deltas, error=None):
+        self._deltas = deltas
+        self._error = error
+        self.closed = False
+
+    def __iter__(self):
+        for delta in self._deltas:
+            if self.closed:
+                raise ConnectionError("closed")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self.closed = True
+
+class FakeCompletions(object):
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def create(self, model, messages, **kwargs):
+        self.requests.append(messages)
+        return self.responses.pop(0)
+
+def make_chat(*responses):
+    chat = Chat("key", summarize=False)
+    completions = FakeCompletions()
+    completions.responses.extend(responses)
+    chat.openai = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return chat, completions
+
+def roles(chat):
+    return [message["role"] for message in chat.message_buff]
+
+def test_a_finished_stream_records_the_request_and_reply_together():
+    chat, completions = make_chat(FakeResponse(["Hello", " there."]))
+    stream = chat.chat_stream("hi")
+    assert roles(chat) == ["system"]
+    assert completions.requests[0][-1]["content"][0]["text"] == "hi"
+    assert "".join(stream) == "Hello there."
+    assert roles(chat) == ["system", "user", "assistant"]
+    assert chat.message_buff[-1]["content"][0]["text"] == "Hello there."
+
+def test_a_cancelled_stream_records_nothing():
+    chat, completions = make_chat(FakeResponse(["Hello", " there", "."]), FakeResponse(["Fine."]))
+    stream = chat.chat_stream("hi")
+    for delta in stream:
+        stream.cancel()
+    assert roles(chat) == ["system"]
+
+    "".join(chat.chat_stream("again"))
+    assert [m["role"] for m in completions.requests[1]] == ["system", "user"]
+    assert roles(chat) == ["system", "user", "assistant"]
+
+def test_an_abandoned_stream_records_nothing():
+    chat, _ = make_chat(FakeResponse(["Hello", " there."]))
+    stream = iter(chat.chat_stream("hi"))
+    next(stream)
+    stream.close()
+    assert roles(chat) == ["system"]
+
+def test_an_empty_reply_records_nothing():
+    chat, _ = make_chat(FakeResponse([None, ""]))
+    assert list(chat.chat_stream("hi")) == []
+    assert roles(chat) == ["system"]
+
+def test_a_failed_stream_records_nothing():
+    chat, _ = make_chat(FakeResponse(["Hello"], error=ConnectionError("reset")))
+    with pytest.raises(ConnectionError):
+        list(chat.chat_stream("hi"))
+    assert roles(chat) == ["system"]
+
+def test_unrecorded_streams_leave_the_history_alone():
+    chat, _ = make_chat(FakeResponse(["Hello."]))
+    assert "".join(chat.chat_stream("hi", record=False)) == "Hello."
+    assert roles(chat) == ["system"]
+    chat.add_exchange("hi", "Hello.")
+    assert roles(chat) == ["system", "user", "assistant"]
+
+def test_split_phrases_cuts_on_sentence_boundaries():
+    deltas = ["Hello there", ". How are", " you? I'm", " fine!\nBye"]
+    assert list(split_phrases(deltas)) == ["Hello there.", "How are you?", "I'm fine!", "Bye"]
+
+def test_split_phrases_yields_a_phrase_as_soon_as_it_is_complete():
+    seen = []
+    def deltas():
+        for delta in ["It is sunny", ". Tomorrow", " it rains."]:
+            seen.append(delta)
+            yield delta
+    phrases = split_phrases(deltas())
+    assert next(phrases) == "It is sunny."
+    assert seen == ["It is sunny", ". Tomorrow"]
+    assert list(phrases) == ["Tomorrow it rains."]
+
+def test_split_phrases_does_not_cut_inside_numbers():
+    assert list(split_phrases(["It costs 3.50 dollars."])) == ["It costs 3.50 dollars."]
+
+def test_split_phrases_cuts_on_a_comma_only_after_min_clause_length():
+    text = "Yes, the lights in the living room are on, and the door is locked"
+    assert list(split_phrases([text], min_clause_length=20)) == [
+        "Yes, the lights in the living room are on,",
+        "and the door is locked",
+    ]
+    assert list(split_phrases([text], min_clause_length=100)) == [text]
+
+def test_split_phrases_cuts_long_phrases_on_whitespace():
+    words = ["word{}".format(i) for i in range(20)]
+    phrases = list(split_phrases([" ".join(words)], max_length=30))
+    assert all(len(phrase) <= 30 for phrase in phrases)
+    assert " ".join(phrases).split() == words
+
+def test_split_phrases_cuts_right_after_a_word_longer_than_max_length():
+    assert list(split_phrases(["a" * 25, " b c", " d"], max_length=10)) == ["a" * 25, "b c d"]
+
+def test_split_phrases_skips_empty_phrases():
+    assert list(split_phrases(["\n\n", "Hi.", "  ", "\n"])) == ["Hi."]
+    assert list(split_phrases([])) == []
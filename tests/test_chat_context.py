@@ -0,0 +1,106 @@
+import threading
+from chat_context import MESSAGE_OVERHEAD, REPLY_OVERHEAD, ChatContext, TokenCounter
+
+def message(role, text):
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+class WordCounter(object):
+    """
+    Counts a token per word, so budgets are easy to follow.
+    """
+
+    def count(self, message):
+        content = message["content"]
+        text = content if isinstance(content, str) else " ".join(part["text"] for part in content)
+        return MESSAGE_OVERHEAD + len(text.split())
+
+SYSTEM = message("system", "be brief")  # 6 tokens
+
+def exchange(context, i, words=6):
+    context.append(message("user", f"q{i} " + "w " * (words - 1)))
+    context.append(message("assistant", f"a{i} " + "w " * (words - 1)))
+
+def texts(context):
+    return [m["content"][0]["text"].split()[0] for m in context.messages()[1:]]
+
+def test_token_counting():
+    counter = TokenCounter("gpt-3.5-turbo")
+    # Without tiktoken, about four characters per token.
+    counter._encoding = None
+    assert counter.count_text("12345678") == 2
+    assert counter.count(message("user", "12345678")) == MESSAGE_OVERHEAD + 2
+    assert counter.count({"role": "user", "content": "1234"}) == MESSAGE_OVERHEAD + 1
+
+    context = ChatContext(SYSTEM, WordCounter(), max_tokens=1000)
+    assert context.tokens == 6 + REPLY_OVERHEAD
+    exchange(context, 0)
+    assert context.tokens == 6 + 2 * 10 + REPLY_OVERHEAD
+
+def test_eviction_trims_whole_exchanges_down_to_low_water():
+    # Each exchange is 20 tokens, the system prompt and reply overhead 9.
+    context = ChatContext(SYSTEM, WordCounter(), max_tokens=100, low_water=0.5)
+    for i in range(4):
+        exchange(context, i)
+    assert context.evictions == 0
+    assert context.tokens == 89
+
+    exchange(context, 4)
+    # Over 100 tokens: whole exchanges go until the context fits in 50.
+    assert context.evictions == 1
+    assert context.tokens <= 50
+    assert texts(context) == ["q3", "a3", "q4", "a4"]
+    assert context.messages()[0] is SYSTEM
+
+def test_the_latest_message_is_always_kept():
+    context = ChatContext(SYSTEM, WordCounter(), max_tokens=20)
+    context.append(message("user", "w " * 50))
+    assert len(context.messages()) == 2
+
+def test_compact_keeps_the_last_exchange():
+    context = ChatContext(SYSTEM, WordCounter(), max_tokens=1000)
+    for i in range(3):
+        exchange(context, i)
+    context.compact()
+    assert texts(context) == ["q2", "a2"]
+
+def test_evicted_exchanges_are_summarized_into_a_second_system_message():
+    calls = []
+    done = threading.Event()
+
+    def summarizer(previous, messages):
+        calls.append((previous, [m["content"][0]["text"].split()[0] for m in messages]))
+        done.set()
+        return "they talked"
+
+    context = ChatContext(SYSTEM, WordCounter(), max_tokens=1000, summarizer=summarizer)
+    for i in range(3):
+        exchange(context, i)
+    context.compact()
+    assert done.wait(5)
+    assert calls == [(None, ["q0", "a0", "q1", "a1"])]
+
+    for _ in range(100):
+        if context.summary is not None:
+            break
+        threading.Event().wait(0.01)
+    messages = context.messages()
+    assert messages[0] is SYSTEM
+    assert messages[1]["role"] == "system"
+    assert messages[1]["content"][0]["text"] == "Summary of the earlier conversation: they talked"
+    assert texts(context)[1:] == ["q2", "a2"]
+    assert context.tokens == 6 + WordCounter().count(messages[1]) + 20 + REPLY_OVERHEAD
+
+def test_a_failing_summarizer_keeps_the_history_usable():
+    done = threading.Event()
+
+    def summarizer(previous, messages):
+        done.set()
+        raise RuntimeError("offline")
+
+    context = ChatContext(SYSTEM, WordCounter(), max_tokens=1000, summarizer=summarizer)
+    for i in range(2):
+        exchange(context, i)
+    context.compact()
+    assert done.wait(5)
+    assert context.summary is None
+    assert texts(context) == ["q1", "a1"]
@@ -0,0 +1,57 @@
+import pytest
+from commands import MAX_TAG_LENGTH, parse_command, strip_commands
+
+@pytest.mark.parametrize("tag,name,params", [
+    ("[Lights on]", "Lights", {"state": "on"}),
+    ("  [ ACMain  off 22 ] ", "ACMain", {"state": "off", "temp": "22"}),
+    ("PlayMusic", "PlayMusic", {}),
+    ("[BroadcastMessage Dinner is ready]", "BroadcastMessage", {"message": "Dinner is ready"}),
+])
+def test_parse_command(tag, name, params):
+    command = parse_command(tag)
+    assert (command.name, command.params) == (name, params)
+
+@pytest.mark.parametrize("tag", ["[Lights]", "[Lights on off]", "[Teleport now]", "[]", "[lights on]", "[PlayMusic loud]"])
+def test_parse_command_rejects_unknown_tags_and_wrong_parameters(tag):
+    assert parse_command(tag) is None
+
+def strip(deltas):
+    commands = []
+    text = list(strip_commands(deltas, commands.append))
+    return text, [command.tag for command in commands]
+
+def test_text_without_tags_passes_through_delta_by_delta():
+    assert strip(["Fine. ", "As you wish."]) == (["Fine. ", "As you wish."], [])
+
+def test_a_tag_is_removed_and_run():
+    text, commands = strip(["Done. [Lights off] Try not to trip."])
+    assert "".join(text) == "Done.  Try not to trip."
+    assert commands == ["[Lights off]"]
+
+def test_a_tag_split_across_deltas():
+    calls = []
+    stream = strip_commands(["Done. [Li", "ghts o", "ff] Enjoy", " the dark."], calls.append)
+    assert next(stream) == "Done. "
+    # The partial tag is held back until it closes, and the command runs before the text after it.
+    assert next(stream) == " Enjoy"
+    assert [command.tag for command in calls] == ["[Lights off]"]
+    assert list(stream) == [" the dark."]
+
+def test_an_unknown_tag_passes_through():
+    assert strip(["Behold [", "science] in action."]) == (["Behold ", "[science] in action."], [])
+
+def test_an_unterminated_tag_at_the_end_is_spoken():
+    assert strip(["Goodbye [Lights", " on"]) == (["Goodbye ", "[Lights on"], [])
+
+def test_a_long_unterminated_bracket_is_released():
+    words = "word " * (MAX_TAG_LENGTH // 5 + 2)
+    text, commands = strip(["Note [", words, "and then [Lights on] end."])
+    assert "".join(text) == "Note [" + words + "and then  end."
+    assert commands == ["[Lights on]"]
+    # Nothing is held back once the bracket is too long to be a tag.
+    assert text[1].startswith("[")
+
+def test_several_tags_in_one_delta():
+    text, commands = strip(["[Lights on][LightsColor blue] There."])
+    assert "".join(text) == " There."
+    assert commands == ["[Lights on]", "[LightsColor blue]"]
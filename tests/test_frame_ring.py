@@ -0,0 +1,149 @@
+import multiprocessing
+import threading
+import numpy as np
+import pytest
+from frame_ring import FrameRing, SharedFrameRing
+
+CAPACITY = 25600 * 4
+
+def stream(start, size):
+    return (np.arange(start, start + size) % 256).astype(np.uint8).tobytes()
+
+@pytest.mark.parametrize("frame_size", [64, 320, 1024, 1000])
+def test_readers_reframe_the_stream_at_their_own_size(frame_size):
+    ring = FrameRing(25600)
+    reader = ring.reader(frame_size)
+    written = 0
+    # Periods of a size unrelated to the frame size, wrapping around the ring several times.
+    for _ in range(300):
+        ring.write(stream(written, 250))
+        written += 250
+        while reader.available() >= frame_size:
+            start = reader.position
+            assert bytes(reader.read(timeout=0)) == stream(start, frame_size)
+    assert reader.dropped == 0
+    assert written - reader.position < frame_size
+
+def test_frames_that_divide_the_capacity_are_views():
+    ring = FrameRing(25600)
+    reader = ring.reader(512)
+    ring.write(bytes(1024))
+    frame = reader.read(timeout=0)
+    assert frame.obj is ring._buf
+
+def test_a_slow_reader_skips_ahead_and_counts_the_drop():
+    ring = FrameRing(25600)
+    reader = ring.reader(512)
+    ring.write(stream(0, 3 * ring.capacity))
+    start_before = reader.position
+    frame = reader.read(timeout=0)
+    start = reader.position - 512
+    assert bytes(frame) == stream(start, 512)
+    assert reader.dropped == start - start_before
+    # A frame of slack is kept behind the writer.
+    assert 3 * ring.capacity - start <= ring.capacity - 512
+
+def test_readers_start_at_history_or_a_position():
+    ring = FrameRing(25600)
+    ring.write(stream(0, 10000))
+    assert ring.reader(500).position == 10000
+    assert ring.reader(500, history=1000).position == 9000
+    assert ring.reader(500, start=4321).position == 4000
+    assert bytes(ring.reader(500, start=4000).read(timeout=0)) == stream(4000, 500)
+
+def test_read_waits_for_a_frame_and_ends_when_closed():
+    ring = FrameRing(25600)
+    reader = ring.reader(512)
+    assert reader.read(timeout=0.01) is None
+    threading.Timer(0.05, ring.write, args=(bytes(512),)).start()
+    assert reader.read(timeout=5) is not None
+    ring.write(bytes(100))
+    ring.close()
+    assert list(reader) == []
+
+def test_time_at_interpolates_from_the_latest_stamp():
+    ring = FrameRing(25600)
+    assert ring.time_at(0, 32000) is None
+    ring.write(bytes(3200), timestamp=10.0)
+    ring.write(bytes(3200), timestamp=10.5)
+    assert ring.time_at(1600, 32000) == pytest.approx(10.05)
+    assert ring.time_at(4800, 32000) == pytest.approx(10.55)
+
+def lap_pattern(start, size):
+    # Every byte holds the lap of the ring its position is in, so a frame mixing laps is torn.
+    return ((np.arange(start, start + size) // CAPACITY) % 251).astype(np.uint8).tobytes()
+
+def write_laps(name, block, laps):
+    ring = SharedFrameRing.attach(name)
+    for start in range(0, CAPACITY * laps, block):
+        ring.write(lap_pattern(start, block))
+    ring.close()
+
+def test_shared_reader_never_returns_a_torn_frame():
+    ring = SharedFrameRing(CAPACITY)
+    try:
+        reader = ring.reader(512)
+        # Writes much larger than a reader's frame of slack, from another process, so they overlap reads.
+        writer = multiprocessing.get_context("spawn").Process(target=write_laps, args=(ring.name, CAPACITY // 2 + 512, 400))
+        writer.start()
+        frames = 0
+        for frame in reader:
+            start = reader.position - len(frame)
+            assert bytes(frame) == lap_pattern(start, len(frame)), f"torn frame at {start}"
+            frames += 1
+        writer.join()
+        assert frames > 0
+    finally:
+        ring.close()
+        ring.release()
+
+def test_shared_reader_skips_ahead_when_lapped():
+    ring = SharedFrameRing(25600)
+    try:
+        reader = ring.reader(512)
+        ring.write(stream(0, 3 * ring.capacity))
+        frame = reader.read(timeout=0)
+        start = reader.position - 512
+        assert bytes(frame) == stream(start, 512)
+        assert reader.dropped == start
+        assert 3 * ring.capacity - start <= ring.capacity - 512
+    finally:
+        ring.release()
+
+def test_shared_reader_skips_a_frame_a_write_in_progress_reaches():
+    ring = SharedFrameRing(25600)
+    try:
+        reader = ring.reader(512)
+        ring.write(bytes(1024))
+        # Announce a write that will overwrite the reader's next frame, without publishing it.
+        ring._set(ring._WRITING, ring.written + ring.capacity)
+        assert reader.read(timeout=0.01) is None
+        assert reader.position > 1024
+    finally:
+        ring.release()
+
+def write_stamped(name):
+    ring = SharedFrameRing.attach(name)
+    ring.write(bytes(3200), timestamp=10.0)
+    ring.write(bytes(3200), timestamp=10.5)
+    ring.publish(4800, 11.0)
+    ring.publish(6400, 12.0)
+    ring.close()
+
+def test_timestamps_and_events_cross_processes():
+    ring = SharedFrameRing(25600)
+    try:
+        writer = multiprocessing.get_context("spawn").Process(target=write_stamped, args=(ring.name,))
+        writer.start()
+        writer.join()
+        assert writer.exitcode == 0
+        assert ring.written == 6400
+        assert ring.time_at(1600, 32000) == pytest.approx(10.05)
+        assert ring.time_at(4800, 32000) == pytest.approx(10.55)
+        assert ring.event_count == 2
+        assert ring.events() == [(4800, 11.0), (6400, 12.0)]
+        assert ring.events(since=1) == [(6400, 12.0)]
+        reader = ring.reader(1600, start=0)
+        assert len(list(reader)) == 4
+    finally:
+        ring.release()
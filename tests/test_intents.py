@@ -0,0 +1,36 @@
+import pytest
+from intents import IntentMatcher
+
+MATCHES = [
+    ("Stop!", "stop", None),
+    ("stop now please", "stop", None),
+    ("Play some music, please.", "play_music", "[PlayMusic]"),
+    ("can you stop the music now", "stop_music", "[StopMusic]"),
+    ("Lights off.", "lights", "[Lights off]"),
+    ("lights off please", "lights", "[Lights off]"),
+    ("turn the lights off please", "lights", "[Lights off]"),
+    ("Could you switch on the light?", "lights", "[Lights on]"),
+    ("okay turn the lights on now", "lights", "[Lights on]"),
+    ("make the lights blue please", "lights_color", "[LightsColor blue]"),
+    ("set the temperature to 21 degrees please", "ac_temp", "[ACMain on 21]"),
+    ("turn off the air conditioning thanks", "ac_power", "[ACMain off 24]"),
+]
+
+CHAT = [
+    "stop being so mean",
+    "please",
+    "thank you",
+    "turn the lights off in an hour",
+    "why are the lights off",
+    "can you tell me a joke please",
+]
+
+@pytest.mark.parametrize("transcript,name,command", MATCHES)
+def test_rules_match_with_politeness_and_filler(transcript, name, command):
+    intent = IntentMatcher().match(transcript)
+    assert intent is not None
+    assert (intent.name, intent.command) == (name, command)
+
+@pytest.mark.parametrize("transcript", CHAT)
+def test_other_requests_go_to_the_chat_model(transcript):
+    assert IntentMatcher().match(transcript) is None
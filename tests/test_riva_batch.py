@@ -0,0 +1,61 @@
+import os
+from types import SimpleNamespace
+import pytest
+
+# riva_wrap imports the Riva client and grpc.
+pytest.importorskip("riva.client")
+pytest.importorskip("grpc")
+pytest.importorskip("num2words")
+
+from riva_wrap import RivaTTS
+
+class CountingService(object):
+    def __init__(self):
+        self.texts = []
+
+    def synthesize(self, text, voice_name=None, sample_rate_hz=22050, **kwargs):
+        self.texts.append(text)
+        return SimpleNamespace(audio=bytes(2 * len(text)))
+
+def make_tts():
+    service = CountingService()
+    return RivaTTS(api_url=None, service=service), service
+
+def test_resume_keeps_files_rendered_from_the_same_text(tmp_path):
+    tts, service = make_tts()
+    jobs = [{"text": "Hello there.", "out_path": str(tmp_path / "a.wav")}]
+    assert tts.synthesize_batch(jobs)["rendered"] == 1
+    stats = tts.synthesize_batch(jobs)
+    assert (stats["rendered"], stats["kept"]) == (0, 1)
+    assert len(service.texts) == 1
+
+def test_resume_renders_a_changed_text_again(tmp_path):
+    tts, service = make_tts()
+    path = str(tmp_path / "a.wav")
+    tts.synthesize_batch([{"text": "Hello there.", "out_path": path}])
+    stats = tts.synthesize_batch([{"text": "Goodbye now.", "out_path": path}])
+    assert (stats["rendered"], stats["kept"]) == (1, 0)
+    assert service.texts[-1] == "Goodbye now."
+
+def test_resume_renders_files_without_a_digest_again(tmp_path):
+    tts, _ = make_tts()
+    path = str(tmp_path / "a.wav")
+    tts.synthesize_batch([{"text": "Hello there.", "out_path": path}])
+    os.remove(path + ".sha1")
+    assert tts.synthesize_batch([{"text": "Hello there.", "out_path": path}])["rendered"] == 1
+
+def test_repeated_out_paths_are_rendered_once(tmp_path):
+    tts, service = make_tts()
+    path = str(tmp_path / "a.wav")
+    jobs = [{"text": "Hello there.", "out_path": path}, {"text": "Hello there.", "out_path": os.path.join(str(tmp_path), ".", "a.wav")}]
+    stats = tts.synthesize_batch(jobs)
+    assert (stats["jobs"], stats["rendered"], stats["copied"]) == (1, 1, 0)
+    assert len(service.texts) == 1
+
+def test_conflicting_out_paths_are_rejected_up_front(tmp_path):
+    tts, service = make_tts()
+    path = str(tmp_path / "a.wav")
+    with pytest.raises(ValueError):
+        tts.synthesize_batch([{"text": "Hello there.", "out_path": path}, {"text": "Goodbye now.", "out_path": path}])
+    assert service.texts == []
+    assert not os.path.exists(path)
@@ -0,0 +1,158 @@
+from types import SimpleNamespace
+import threading
+import time
+import pytest
+
+# speculation imports chat, which imports the OpenAI client, httpx and, through riva_wrap, the Riva client.
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+pytest.importorskip("riva.client")
+
+from chat import Chat
+from speculation import Speculator
+from tracing import Tracer
+
+class GatedResponse(object):
+    """
+    A streamed chat response that holds its deltas back until release() or close() is called.
+    """
+
+    def __init__(self, deltas):
+        self._deltas = deltas
+        self._gate = threading.Event()
+        self.closed = False
+
+    def release(self):
+        self._gate.set()
+
+    def __iter__(self):
+        self._gate.wait(5)
+        for delta in self._deltas:
+            if self.closed:
+                raise ConnectionError("closed")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+    def close(self):
+        self.closed = True
+        self._gate.set()
+
+class FakeCompletions(object):
+    def __init__(self, responses):
+        self.requests = []
+        self.responses = list(responses)
+
+    def create(self, model, messages, **kwargs):
+        self.requests.append(messages)
+        return self.responses.pop(0)
+
+def make_speculator(*responses, **kwargs):
+    chat = Chat("key", summarize=False)
+    completions = FakeCompletions(responses)
+    chat.openai = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return Speculator(chat, stable_ms=10, **kwargs), chat, completions
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+def roles(chat):
+    return [message["role"] for message in chat.message_buff]
+
+def test_take_accepts_a_matching_speculation_and_records_it_when_done():
+    response = GatedResponse(["It is", " sunny."])
+    speculator, chat, completions = make_speculator(response)
+    speculator.on_interim("what's the weather")
+    wait_for(lambda: speculator.launched == 1)
+    wait_for(lambda: len(completions.requests) == 1)
+    assert roles(chat) == ["system"]
+
+    trace = Tracer().start_turn()
+    speculation = speculator.take("What's the weather?", trace)
+    assert speculation is not None
+    assert roles(chat) == ["system"]
+
+    response.release()
+    assert "".join(speculation) == "It is sunny."
+    wait_for(lambda: len(chat.message_buff) == 3)
+    assert roles(chat) == ["system", "user", "assistant"]
+    assert chat.message_buff[-1]["content"][0]["text"] == "It is sunny."
+    assert speculator.stats()["hits"] == 1
+    assert speculator.stats()["misses"] == 0
+    assert trace.events["chat_request"] == speculation.requested_at
+    assert "chat_first_token" in trace.events
+    wait_for(lambda: "chat_response" in trace.events)
+
+def test_take_records_a_speculation_that_finished_before_it_was_accepted():
+    response = GatedResponse(["Done."])
+    response.release()
+    speculator, chat, _ = make_speculator(response)
+    speculator.on_interim("turn it off")
+    wait_for(lambda: speculator.launched == 1)
+    wait_for(lambda: speculator._speculation._done)
+    assert roles(chat) == ["system"]
+
+    speculation = speculator.take("turn it off")
+    assert roles(chat) == ["system", "user", "assistant"]
+    assert "".join(speculation) == "Done."
+
+def test_take_discards_a_speculation_for_different_words():
+    response = GatedResponse(["It is", " sunny."])
+    speculator, chat, completions = make_speculator(response)
+    speculator.on_interim("what's the weather")
+    wait_for(lambda: speculator.launched == 1)
+    wait_for(lambda: len(completions.requests) == 1)
+
+    assert speculator.take("what's the weather tomorrow") is None
+    wait_for(lambda: response.closed)
+    time.sleep(0.05)
+    assert roles(chat) == ["system"]
+    stats = speculator.stats()
+    assert stats["hits"] == 0
+    assert stats["misses"] == 1
+    assert stats["wasted_tokens"] > 0
+
+def test_cancel_discards_the_speculation():
+    response = GatedResponse(["It is", " sunny."])
+    speculator, chat, completions = make_speculator(response)
+    speculator.on_interim("what's the weather")
+    wait_for(lambda: speculator.launched == 1)
+    wait_for(lambda: len(completions.requests) == 1)
+
+    speculator.cancel()
+    wait_for(lambda: response.closed)
+    assert speculator.take("what's the weather") is None
+    time.sleep(0.05)
+    assert roles(chat) == ["system"]
+    assert speculator.stats()["misses"] == 1
+
+def test_a_changing_interim_transcript_cancels_a_stale_speculation():
+    response = GatedResponse(["It is", " sunny."])
+    speculator, _, completions = make_speculator(response)
+    speculator.on_interim("what's the weather")
+    wait_for(lambda: speculator.launched == 1)
+    wait_for(lambda: len(completions.requests) == 1)
+
+    speculator.on_interim("what's the weather in")
+    wait_for(lambda: response.closed)
+    assert speculator.stats()["misses"] == 1
+
+def test_nothing_is_launched_for_short_or_rejected_transcripts():
+    speculator, _, completions = make_speculator(accept=lambda text: "lights" not in text)
+    speculator.on_interim("hello")
+    speculator.on_interim("turn on the lights")
+    time.sleep(0.05)
+    assert speculator.launched == 0
+    assert completions.requests == []
+    assert speculator.take("turn on the lights") is None
+
+def test_take_before_the_transcript_is_stable_launches_nothing():
+    speculator, _, completions = make_speculator()
+    speculator.stable_ms = 1000
+    speculator.on_interim("what's the weather")
+    assert speculator.take("what's the weather") is None
+    time.sleep(0.05)
+    assert speculator.launched == 0
+    assert completions.requests == []
@@ -0,0 +1,64 @@
+import pytest
+
+# stt imports the Google client and grpc.
+pytest.importorskip("google.cloud.speech")
+pytest.importorskip("grpc")
+
+from stt import STTAction, _requests_generator
+from tracing import Tracer
+
+class RequestBuildingSTT(object):
+    """
+    Builds the real protobuf requests from the audio stream, like STT does, without a connection.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def recognize_stream_command(self, stream, on_call=None, on_interim=None):
+        self.requests = list(_requests_generator(stream))
+        return "hello"
+
+def test_chunks_build_real_streaming_requests():
+    stt = RequestBuildingSTT()
+    results = []
+    action = STTAction(chunk_size=4096, stt=stt, on_result=results.append)
+    audio = bytes(range(256)) * 40
+    for i in range(0, len(audio), 1000):
+        action.handle_chunk(audio[i:i + 1000])
+    action.close()
+    action._thread.join(timeout=5)
+
+    assert results == ["hello"]
+    assert b"".join(request.audio_content for request in stt.requests) == audio
+
+class FailingSTT(object):
+    def __init__(self, error):
+        self.error = error
+
+    def recognize_stream_command(self, stream, on_call=None, on_interim=None):
+        next(stream)
+        raise self.error
+
+def test_a_failed_request_finishes_the_turn_and_reports_no_result():
+    trace = Tracer().start_turn()
+    results = []
+    action = STTAction(stt=FailingSTT(ConnectionError("unavailable")), on_result=results.append, trace=trace)
+    action.handle_chunk(bytes(1000))
+    action._thread.join(timeout=5)
+
+    assert action.is_done()
+    assert action.closed
+    assert results == [None]
+    assert trace.outcome == "failed"
+
+def test_a_cancelled_request_reports_nothing():
+    trace = Tracer().start_turn()
+    results = []
+    action = STTAction(stt=FailingSTT(ConnectionError("cancelled")), on_result=results.append, trace=trace)
+    action.cancel()
+    action._thread.join(timeout=5)
+
+    assert action.is_done()
+    assert results == []
+    assert trace.outcome is None
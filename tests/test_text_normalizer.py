@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("num2words")
+
+from text_normalizer import TextNormalizer
+
+# Expected outputs of the default rules. They match the original RivaTTS._normalize_text, spaces
+# included, except where marked.
+GOLDEN = [
+    # Symbols
+    ("*", " asterisk "),
+    ("glados@aperture.com", "glados at aperture dot com"),
+    ("12%", " twelve  percent "),
+    ("€20 £30", " euros  twenty   pounds  thirty "),
+    ("I’m", "I'm"),
+    ("NTFS", "N T F S"),
+    # Degrees, with and without a space before them
+    ("21 °", " twenty-one degrees"),
+    # The original glued the number to "degrees": " seventydegreesF".
+    ("70°F", " seventy degreesF"),
+    # Adjacent symbols. The original ran " °" -> "degrees" after the other symbols, so it glued their
+    # words together, e.g. " dollarsdegrees". Symbols are now replaced last, which leaves two spaces.
+    ("$°", " dollars  degrees"),
+    ("x*°", "x asterisk  degrees"),
+    ("$ °", " dollars degrees"),
+    # The original also glued a word to "degrees" when " °" followed it, e.g. "AIdegrees". The space
+    # is now kept, and the word rewritten.
+    ("AI °", "AY IY degrees"),
+    ("Mr. °", "mister degrees"),
+    ("USA °F", "U S AY degreesF"),
+    ("x °", "x degrees"),
+    ("° °", " degrees degrees"),
+    ("$USA", " dollars U S AY"),
+    ("AI$", "AY IY dollars "),
+    # Abbreviations
+    ("Mr. Smith", "mister Smith"),
+    ("mrs. Jones", "missus Jones"),
+    ("Ms. Lee", "miss Lee"),
+    ("Mr.Smith", "Mr dot Smith"),
+    # The original skipped every second of adjacent words, as each match consumed the space the next
+    # one needed: "mister Mr.".
+    ("Mr. Mr.", "mister mister"),
+    ("usa usa", "U S AY U S AY"),
+    ("USA, UK!", "U S AY, U KAY!"),
+    ("AI.", "AY IY."),
+    ("AIs", "AIs"),
+    ("the UK.", "the UK."),
+    # Numbers
+    ("42", " forty-two "),
+    ("$5", " dollars  five "),
+    ("3.5", " three . five "),
+    ("1,250,000 euros", " one million, two hundred and fifty thousand  euros"),
+    ("a.b.c", "a dot b.c"),
+]
+
+@pytest.mark.parametrize("text, expected", GOLDEN)
+def test_default_rules(text, expected):
+    assert TextNormalizer()(text) == expected
+
+def test_rules_file_overrides_and_extends(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text('{"symbols": {"&": " and "}, "words": [["[Mm][Rr]\\\\.", "master", ""]]}', encoding="utf-8")
+    normalizer = TextNormalizer.from_file(str(path))
+    assert normalizer("Mr. Smith & Ms. Lee") == "master Smith  and  miss Lee"
+
+def test_symbol_rules_must_be_single_characters():
+    with pytest.raises(ValueError):
+        TextNormalizer(symbols={"ab": "x"})
@@ -0,0 +1,34 @@
+from tracing import Tracer
+
+def finish_turn(tracer, room, stt_seconds):
+    trace = tracer.start_turn(room)
+    trace.mark("stt_audio_end", at=0.0)
+    trace.mark("stt_final", at=stt_seconds)
+    trace.finish("played")
+
+def render(tracer):
+    # close() waits for the writer thread to aggregate every finished turn.
+    tracer.close()
+    return tracer.render().splitlines()
+
+def test_stage_histograms_are_kept_per_room():
+    tracer = Tracer()
+    finish_turn(tracer, "kitchen", 0.04)
+    finish_turn(tracer, "office", 2.5)
+    lines = render(tracer)
+
+    assert 'glados_stage_seconds_count{room="kitchen",stage="stt"} 1' in lines
+    assert 'glados_stage_seconds_count{room="office",stage="stt"} 1' in lines
+    assert 'glados_stage_seconds_bucket{room="kitchen",stage="stt",le="0.05"} 1' in lines
+    assert 'glados_stage_seconds_bucket{room="office",stage="stt",le="0.05"} 0' in lines
+    assert 'glados_stage_recent_seconds{room="office",stage="stt",quantile="0.5"} 2.5' in lines
+    assert 'glados_turns_total{room="kitchen",outcome="played"} 1' in lines
+
+def test_turns_without_a_room_have_no_room_label():
+    tracer = Tracer()
+    finish_turn(tracer, None, 0.04)
+    lines = render(tracer)
+
+    assert 'glados_stage_seconds_count{stage="stt"} 1' in lines
+    assert 'glados_turns_total{outcome="played"} 1' in lines
+    assert not any("room=" in line for line in lines)
@@ -0,0 +1,76 @@
+import numpy as np
+from frame_ring import FrameRing
+from vad import VoiceActivityDetector, VADEndpointer
+
+RATE = 16000
+# The wake word detector's and the STT feed's frame sizes, in bytes.
+WAKE_FRAME = 512 * 2
+STT_FRAME = RATE * 2 * 20 // 1000
+
+def voice(rng, seconds, f0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    samples = sum(np.sin(2 * np.pi * k * f0 * t) / k for k in range(1, 8))
+    samples *= np.minimum(1, np.minimum(t, t[-1] - t) / 0.02)
+    return 0.3 * samples / np.max(np.abs(samples)) + rng.normal(0, 1e-3, len(t))
+
+def silence(rng, seconds):
+    return rng.normal(0, 1e-3, int(seconds * RATE))
+
+def pcm(samples):
+    return (samples * 32767).astype(np.int16).tobytes()
+
+def test_stt_starting_at_the_wake_word_waits_for_the_request():
+    # Keyword, a 1 s pause after the chime, then the request.
+    rng = np.random.default_rng(0)
+    lead, keyword, pause, request = silence(rng, 1.0), voice(rng, 0.6, 140), silence(rng, 1.0), voice(rng, 1.2, 180)
+    audio = pcm(np.concatenate([lead, keyword, pause, request, silence(rng, 1.0)]))
+    request_start = 2 * (len(lead) + len(keyword) + len(pause))
+    request_end = request_start + 2 * len(request)
+
+    # The wake word is detected with the frame in which the keyword ends.
+    ring = FrameRing(len(audio))
+    tracker = VoiceActivityDetector(RATE)
+    wake_reader = ring.reader(WAKE_FRAME)
+    detected_at = None
+    for offset in range(0, len(audio), WAKE_FRAME):
+        ring.write(audio[offset:offset + WAKE_FRAME])
+        tracker.process(wake_reader.read())
+        if detected_at is None and wake_reader.position >= 2 * (len(lead) + len(keyword)):
+            detected_at = wake_reader.position
+            break
+    for offset in range(detected_at, len(audio), WAKE_FRAME):
+        ring.write(audio[offset:offset + WAKE_FRAME])
+    ring.close()
+
+    # Like Assistant._on_wake(): a clone of the noise tracking VAD, reading from the detection on.
+    endpointer = VADEndpointer(tracker.clone(), trailing_silence_ms=700)
+    sent = bytearray()
+    for frame in ring.reader(STT_FRAME, start=detected_at):
+        sent += endpointer.process(frame)
+        if endpointer.ended:
+            break
+
+    assert endpointer.ended
+    frame_bytes = 2 * endpointer.vad.frame_length
+    start = detected_at + endpointer.speech_start_frame * frame_bytes
+    end = detected_at + endpointer.speech_end_frame * frame_bytes
+    assert abs(start - request_start) <= 2 * frame_bytes
+    assert abs(end - request_end) <= 2 * frame_bytes
+    assert bytes(sent).find(audio[request_start:request_start + frame_bytes]) >= 0
+
+def test_stt_starting_before_the_wake_word_ends_on_the_pause():
+    # What the previous 300 ms of history did: the keyword's tail starts the utterance, and the pause ends it.
+    rng = np.random.default_rng(0)
+    audio = pcm(np.concatenate([silence(rng, 1.0), voice(rng, 0.6, 140), silence(rng, 1.0), voice(rng, 1.2, 180), silence(rng, 1.0)]))
+    detected_at = 2 * int(1.6 * RATE) // WAKE_FRAME * WAKE_FRAME
+    ring = FrameRing(len(audio))
+    ring.write(audio)
+    tracker = VoiceActivityDetector(RATE)
+    tracker.process(audio[:2 * RATE])
+    endpointer = VADEndpointer(tracker.clone(), trailing_silence_ms=700)
+    for frame in ring.reader(STT_FRAME, start=detected_at - 2 * RATE * 300 // 1000):
+        endpointer.process(frame)
+        if endpointer.ended:
+            break
+    assert endpointer.ended
+    assert endpointer.speech_end_frame * 20 < 600
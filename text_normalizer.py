@@ -0,0 +1,147 @@
+from functools import lru_cache
+from num2words import num2words
+import json
+import re
+
+# Single characters replaced anywhere in the text.
+SYMBOLS = {
+    "$": " dollars ",
+    "%": " percent ",
+    "€": " euros ",
+    "£": " pounds ",
+    "¥": " yen ",
+    "₪": " shekels ",
+    "*": " asterisk ",
+    "@": " at ",
+    "’": "'",
+    "°": " degrees",
+}
+
+# Substrings replaced anywhere in the text.
+SUBSTRINGS = {
+    "NTFS": "N T F S",
+    " °": "degrees",
+}
+
+# Whole words, as (regex, replacement, punctuation that may follow the word besides whitespace).
+WORDS = [
+    (r"[Mm][Rr]\.", "mister", ""),
+    (r"[Mm][Ss]\.", "miss", ""),
+    (r"[Mm][Rr][Ss]\.", "missus", ""),
+    (r"USA|usa", "U S AY", "?!,"),
+    (r"UK|uk", "U KAY", "?!,"),
+    (r"AI|ai", "AY IY", "?!,."),
+]
+
+COMMA_NUMBER = re.compile(r'(\d{0,3}(,\d{3})+)($|\D)')
+NUMBER = re.compile(r'\d+')
+LETTERS_DOT = re.compile(r'([a-zA-Z])\.([a-zA-Z])')
+
+@lru_cache(maxsize=4096)
+def _number_to_words(number):
+    return num2words(number)
+
+def _convert_comma_number(m):
+    return f" {_number_to_words(m.group(1).replace(',', ''))} {m.group(3)}"
+
+def _convert_number(m):
+    return f" {_number_to_words(m.group())} "
+
+class TextNormalizer(object):
+    """
+    Rewrites text into a form the TTS model reads out correctly (numbers, symbols, abbreviations).
+
+    Numbers are expanded first, each with a memoized num2words, and dots between letters are spelled
+    out. Substrings and whole words are then rewritten in a single pass of one precompiled alternation,
+    dispatched on the name of the matching group. Symbols are rewritten last through str.translate.
+
+    The output matches the original RivaTTS._normalize_text, except that a symbol before "°" no longer
+    glues their words together, adjacent words such as "Mr. Mr." are all rewritten, and a substring rule
+    that starts with a space, such as " °", only drops that space after another space or a symbol, so
+    "AI °" and "5°" become "AY IY degrees" and " five degrees" rather than "AIdegrees" and " fivedegrees".
+    The expected outputs are pinned in tests/test_text_normalizer.py.
+
+    Args:
+        symbols (dict): Single characters and their replacements (default: SYMBOLS).
+        substrings (dict): Substrings and their replacements (default: SUBSTRINGS).
+        words (list): Whole words as (regex, replacement, following punctuation) (default: WORDS).
+    """
+
+    def __init__(self, symbols=None, substrings=None, words=None):
+        self.symbols = dict(SYMBOLS if symbols is None else symbols)
+        self.substrings = dict(SUBSTRINGS if substrings is None else substrings)
+        self.words = list(WORDS if words is None else words)
+        self._compile()
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Creates a normalizer from the default rules extended by a JSON file of the form
+        {"symbols": {char: replacement}, "substrings": {text: replacement}, "words": [[regex, replacement, punctuation]]}.
+        Entries of the file override default entries with the same key.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+
+        symbols = {**SYMBOLS, **rules.get("symbols", {})}
+        substrings = {**SUBSTRINGS, **rules.get("substrings", {})}
+        custom_words = [tuple(w) for w in rules.get("words", [])]
+        custom_patterns = {w[0] for w in custom_words}
+        words = [w for w in WORDS if w[0] not in custom_patterns] + custom_words
+        return cls(symbols=symbols, substrings=substrings, words=words)
+
+    def _compile(self):
+        for symbol in self.symbols:
+            if len(symbol) != 1:
+                raise ValueError(f"Symbol rules must be single characters, received '{symbol}'.")
+        self._table = str.maketrans(self.symbols)
+
+        # A symbol whose replacement starts or ends with a space acts as a word boundary once translated.
+        before = "".join(re.escape(s) for s, r in self.symbols.items() if r.endswith(" "))
+        after = "".join(re.escape(s) for s, r in self.symbols.items() if r.startswith(" "))
+
+        self._word_ends = frozenset(s for s, r in self.symbols.items() if r.endswith(" "))
+
+        alternatives = []
+        self._replacements = {}
+        # Substrings that replace the space they start with, e.g. " °" -> "degrees".
+        self._joining = set()
+        for i, (substring, replacement) in enumerate(sorted(self.substrings.items(), key=lambda s: -len(s[0]))):
+            alternatives.append(f"(?P<s{i}>{re.escape(substring)})")
+            self._replacements[f"s{i}"] = replacement
+            if substring[:1].isspace() and not replacement[:1].isspace():
+                self._joining.add(f"s{i}")
+
+        # Words consume the boundary before them instead of looking behind it, which keeps the
+        # alternation cheap to scan.
+        words = []
+        for i, (pattern, replacement, punctuation) in enumerate(self.words):
+            followed_by = re.escape(punctuation) + after
+            words.append(f"(?P<w{i}>{pattern})(?=[\\s{followed_by}]|$)")
+            self._replacements[f"w{i}"] = replacement
+        if words:
+            alternatives.append(f"(?P<boundary>[\\s{before}]|^)(?:{'|'.join(words)})")
+
+        self._rules = re.compile("|".join(alternatives))
+
+    def _dispatch(self, m):
+        replacement = self._replacements[m.lastgroup]
+        if m.lastgroup[0] == "w":
+            return m.group("boundary") + replacement
+        if m.lastgroup in self._joining and m.start() > 0:
+            # Only drop the space if the text before it still ends in one, so words are never glued together.
+            previous = m.string[m.start() - 1]
+            if not previous.isspace() and previous not in self._word_ends:
+                return " " + replacement
+        return replacement
+
+    def __call__(self, text):
+        if NUMBER.search(text) is not None:
+            text = COMMA_NUMBER.sub(_convert_comma_number, text)
+            text = NUMBER.sub(_convert_number, text)
+
+        if "." in text:
+            text = LETTERS_DOT.sub(r"\1 dot \2", text)
+
+        text = self._rules.sub(self._dispatch, text)
+        return text.translate(self._table)
@@ -0,0 +1,271 @@
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import queue
+import threading
+import time
+
+# Stages of a turn, as (start event, end event). A stage is recorded if both events happened.
+STAGES = {
+    "endpoint": ("wake", "stt_audio_end"),
+    "stt": ("stt_audio_end", "stt_final"),
+    "chat_first_token": ("chat_request", "chat_first_token"),
+    "chat_response": ("chat_request", "chat_response"),
+    "tts_first_audio": ("chat_first_token", "first_audio"),
+    "response": ("stt_final", "first_audio"),
+    "command": ("stt_final", "command_done"),
+    "turn": ("wake", "last_audio"),
+}
+
+BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.9, 0.99)
+
+class TurnTrace(object):
+    """
+    The timestamps of a single turn, from the wake word to the last audio out.
+
+    mark() and segment() may be called from any thread, including the audio callback: they only store
+    a timestamp. Formatting and I/O happen on the Tracer's writer thread once the turn is finished.
+    """
+
+    def __init__(self, tracer, turn_id, room=None):
+        self._tracer = tracer
+        self.turn_id = turn_id
+        self.room = room
+        self.wall_time = time.time()
+        self.events = {"wake": time.monotonic()}
+        self.segments = []
+        self.text = None
+        self.outcome = None
+        self._lock = threading.Lock()
+
+    def mark(self, event, once=True, at=None):
+        """
+        Records the time of an event, now or at the time.monotonic() value `at`.
+        With once, only its first occurrence is kept.
+        """
+        if not once or event not in self.events:
+            self.events[event] = time.monotonic() if at is None else at
+
+    def segment(self, chars):
+        """
+        Records the start of a TTS segment.
+
+        Returns:
+            dict: The segment, whose "end" and "cached" the caller fills in once it is synthesized.
+        """
+        span = {"chars": chars, "start": time.monotonic(), "end": None, "cached": False}
+        self.segments.append(span)
+        return span
+
+    def finish(self, outcome):
+        """
+        Ends the turn and hands it to the tracer. Only the first call counts, so every path that
+        may end a turn (playback done, cancelled, failed) can call it.
+        """
+        with self._lock:
+            if self.outcome is not None:
+                return
+            self.outcome = outcome
+        self._tracer._finished.put(self)
+
+    def record(self):
+        """
+        Returns:
+            dict: The turn as a JSON record, with event times in milliseconds since the wake word.
+        """
+        events = dict(self.events)
+        wake = events["wake"]
+
+        def ms(t):
+            return None if t is None else round((t - wake) * 1000, 1)
+
+        record = {
+            "turn": self.turn_id,
+            "time": self.wall_time,
+            "outcome": self.outcome,
+            "text": self.text,
+            "events": {event: ms(t) for event, t in sorted(events.items(), key=lambda e: e[1])},
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages().items()},
+            "segments": [{**s, "start": ms(s["start"]), "end": ms(s["end"])} for s in self.segments],
+        }
+        if self.room is not None:
+            record["room"] = self.room
+        return record
+
+    def stages(self):
+        events = dict(self.events)
+        return {stage: events[end] - events[start] for stage, (start, end) in STAGES.items()
+                if start in events and end in events}
+
+class Histogram(object):
+    """
+    A Prometheus histogram over all observations, plus quantiles over the last `window` ones.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=256):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        values = sorted(self.recent)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+class Tracer(object):
+    """
+    Collects a TurnTrace per turn. Finished turns are appended to a JSONL file and aggregated into
+    per-stage histograms on a writer thread, so the pipeline threads never wait on I/O.
+    serve() exposes the histograms in the Prometheus text format, labelled with the room of the turns if they have one.
+
+    Args:
+        path (str): The JSONL trace file, None to not write one (default: None).
+        window (int): The number of recent turns the quantiles are computed over (default: 256).
+    """
+
+    def __init__(self, path=None, window=256):
+        self._path = path
+        self._window = window
+        self._next_id = 0
+        self._finished = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._outcomes = {}
+        self._metrics = []
+        self._server = None
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def start_turn(self, room=None) -> TurnTrace:
+        with self._lock:
+            self._next_id += 1
+            return TurnTrace(self, self._next_id, room)
+
+    def add_metric(self, name, fn, kind="gauge", help="", labels=None):
+        """
+        Exports the value of fn() with every scrape, e.g. a counter of the player. Metrics of the same
+        name, e.g. of several rooms, are told apart by their labels.
+        """
+        label_text = ",".join(f'{key}="{value}"' for key, value in sorted((labels or {}).items()))
+        self._metrics.append((name, fn, kind, help, "{" + label_text + "}" if label_text else ""))
+
+    def _observe(self, room, name, value):
+        histogram = self._histograms.get((room, name))
+        if histogram is None:
+            histogram = self._histograms[(room, name)] = Histogram(window=self._window)
+        histogram.observe(value)
+
+    @staticmethod
+    def _labels(room, **labels):
+        # Turns without a room, e.g. of a single Assistant, have no room label.
+        text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+        return f'room="{room}",{text}' if room is not None else text
+
+    @staticmethod
+    def _sort_key(item):
+        (room, name), _ = item
+        return (room is not None, room or "", name)
+
+    def _write(self):
+        f = open(self._path, "a", encoding="utf-8") if self._path is not None else None
+        while True:
+            trace = self._finished.get()
+            if trace is None:
+                break
+
+            record = trace.record()
+            with self._lock:
+                key = (trace.room, trace.outcome)
+                self._outcomes[key] = self._outcomes.get(key, 0) + 1
+                for stage, seconds in trace.stages().items():
+                    self._observe(trace.room, stage, seconds)
+                for segment in trace.segments:
+                    if segment["end"] is not None and not segment["cached"]:
+                        self._observe(trace.room, "tts_segment", segment["end"] - segment["start"])
+            if f is not None:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+        if f is not None:
+            f.close()
+
+    def close(self):
+        self._finished.put(None)
+        self._writer.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def render(self):
+        """
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP glados_stage_seconds The latency of each stage of a turn.",
+            "# TYPE glados_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=self._sort_key)
+            for (room, stage), h in histograms:
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(f'glados_stage_seconds_bucket{{{self._labels(room, stage=stage, le=bound)}}} {count}')
+                lines.append(f'glados_stage_seconds_bucket{{{self._labels(room, stage=stage, le="+Inf")}}} {h.count}')
+                lines.append(f'glados_stage_seconds_sum{{{self._labels(room, stage=stage)}}} {h.sum}')
+                lines.append(f'glados_stage_seconds_count{{{self._labels(room, stage=stage)}}} {h.count}')
+
+            lines.append(f"# HELP glados_stage_recent_seconds The latency of each stage over the last {self._window} turns.")
+            lines.append("# TYPE glados_stage_recent_seconds summary")
+            for (room, stage), h in histograms:
+                for q in QUANTILES:
+                    lines.append(f'glados_stage_recent_seconds{{{self._labels(room, stage=stage, quantile=q)}}} {h.quantile(q)}')
+
+            lines.append("# HELP glados_turns_total The finished turns, by outcome.")
+            lines.append("# TYPE glados_turns_total counter")
+            for (room, outcome), count in sorted(self._outcomes.items(), key=self._sort_key):
+                lines.append(f'glados_turns_total{{{self._labels(room, outcome=outcome)}}} {count}')
+
+        families = {}
+        for name, fn, kind, help, labels in self._metrics:
+            families.setdefault(name, (kind, help, []))[2].append((labels, fn))
+        for name, (kind, help, series) in families.items():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, fn in series:
+                lines.append(f"{name}{labels} {fn()}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serves the metrics on http://host:port/metrics from a background thread.
+        """
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"[Trace] Serving metrics on http://{host}:{port}/metrics")
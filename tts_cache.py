@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+import threading
+
+class TTSCache(object):
+    """
+    A two-tier cache of synthesized audio, keyed on (normalized text, sample rate, voice).
+
+    The first tier is an in-process LRU bounded by the total size of the audio it holds.
+    The second tier is an optional on-disk store of raw PCM files. Disk hits are memory-mapped,
+    so they reach the player as a memoryview over the page cache instead of a copy.
+
+    Args:
+        directory (str): The directory of the on-disk store. None keeps the cache in memory only (default: None).
+        max_memory_bytes (int): The maximum size of the audio held by the LRU (default: 32 MiB).
+    """
+
+    def __init__(self, directory=None, max_memory_bytes=32 * 1024 * 1024):
+        self._directory = directory
+        self._max_memory_bytes = max_memory_bytes
+        self._lru = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _key(text, rate, voice):
+        return (text, rate, voice)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self._directory, f"{digest}.pcm")
+
+    def _remember(self, key, audio):
+        # Must be called with the lock held.
+        if len(audio) > self._max_memory_bytes:
+            return
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._lru[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self._max_memory_bytes:
+            _, evicted = self._lru.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                # The mapping stays valid after the file is closed.
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (FileNotFoundError, ValueError):
+            # ValueError is raised for empty files, which cannot be mapped.
+            return None
+
+    def get(self, text, rate, voice=None):
+        """
+        Looks up the audio of a normalized text.
+
+        Returns:
+            bytes-like: The raw audio data, or None on a miss.
+        """
+        key = self._key(text, rate, voice)
+        with self._lock:
+            audio = self._lru.get(key)
+            if audio is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        if self._directory is not None:
+            audio = self._load(key)
+            if audio is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, audio)
+                return audio
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, rate, voice, audio):
+        """
+        Stores the audio of a normalized text in both tiers.
+        """
+        if len(audio) == 0:
+            return
+
+        key = self._key(text, rate, voice)
+        if self._directory is not None:
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._remember(key, audio)
+
+    def __contains__(self, key):
+        text, rate, voice = key
+        key = self._key(text, rate, voice)
+        with self._lock:
+            if key in self._lru:
+                return True
+        return self._directory is not None and os.path.exists(self._path(key))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "memory_entries": len(self._lru),
+                "memory_bytes": self._memory_bytes,
+            }
@@ -0,0 +1,185 @@
+import numpy as np
+import copy
+
+class VoiceActivityDetector(object):
+    """
+    A frame-level voice activity detector over 16 bit mono PCM, computed with vectorized NumPy.
+
+    Each frame gets three features: its energy in dB, its zero-crossing rate and its spectral flux
+    (the positive change of its normalized magnitude spectrum since the previous frame). A frame is
+    speech if its energy is well above the tracked noise floor, and it is either tonal (low zero-crossing
+    rate, unlike hiss) or has a strong spectral onset.
+
+    Args:
+        sample_rate (int): The sample rate in Hz (default: 16000).
+        frame_ms (int): The frame length in milliseconds, 10 to 30 (default: 20).
+        margin_db (float): How far above the noise floor a speech frame must be (default: 12).
+        min_energy_db (float): The energy below which a frame is never speech (default: -55).
+        max_zcr (float): The zero-crossing rate above which a frame needs a spectral onset to count as speech (default: 0.25).
+        min_flux (float): The spectral flux that counts as an onset (default: 0.3).
+        noise_adaptation (float): How fast the noise floor follows non-speech frames, 0 to 1 (default: 0.05).
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, margin_db=12.0, min_energy_db=-55.0, max_zcr=0.25, min_flux=0.3, noise_adaptation=0.05):
+        self.sample_rate = sample_rate
+        self.frame_length = sample_rate * frame_ms // 1000
+        self.margin_db = margin_db
+        self.min_energy_db = min_energy_db
+        self.max_zcr = max_zcr
+        self.min_flux = min_flux
+        self.noise_adaptation = noise_adaptation
+        self._window = np.hanning(self.frame_length).astype(np.float32)
+        self.reset()
+
+    def clone(self):
+        """
+        Creates a detector with the same settings and the current noise floor, but no other state.
+        """
+        vad = copy.copy(self)
+        vad._remainder = b""
+        vad._last_spectrum = None
+        return vad
+
+    def reset(self):
+        self.noise_floor_db = None
+        self._remainder = b""
+        self._last_spectrum = None
+
+    def features(self, frames):
+        """
+        Computes the features of a batch of frames.
+
+        Args:
+            frames (np.ndarray): float32 samples in [-1, 1], shaped (n_frames, frame_length).
+
+        Returns:
+            tuple: The energy in dB, the zero-crossing rate and the spectral flux, each shaped (n_frames,).
+        """
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_length - 1)
+
+        spectrum = np.abs(np.fft.rfft(frames * self._window, axis=1))
+        spectrum /= np.sum(spectrum, axis=1, keepdims=True) + 1e-10
+        previous = np.empty_like(spectrum)
+        previous[0] = spectrum[0] if self._last_spectrum is None else self._last_spectrum
+        previous[1:] = spectrum[:-1]
+        flux = np.sum(np.maximum(spectrum - previous, 0), axis=1)
+        self._last_spectrum = spectrum[-1]
+
+        return energy_db, zcr, flux
+
+    def process(self, pcm):
+        """
+        Classifies the complete frames of a chunk of PCM. Samples of an incomplete last frame are kept
+        for the next call.
+
+        Args:
+            pcm (bytes): 16 bit mono PCM.
+
+        Returns:
+            np.ndarray: A bool per complete frame, True for speech.
+        """
+        data = self._remainder + bytes(pcm)
+        n_frames = len(data) // (2 * self.frame_length)
+        self._remainder = data[n_frames * 2 * self.frame_length:]
+        if n_frames == 0:
+            return np.zeros(0, dtype=bool)
+
+        samples = np.frombuffer(data, dtype=np.int16, count=n_frames * self.frame_length)
+        frames = samples.reshape(n_frames, self.frame_length).astype(np.float32) / 32768.0
+        energy_db, zcr, flux = self.features(frames)
+
+        if self.noise_floor_db is None:
+            self.noise_floor_db = max(float(np.min(energy_db)), self.min_energy_db)
+
+        # The decision depends on the noise floor, which adapts frame by frame. The features
+        # above are vectorized, this loop only runs a few comparisons per frame.
+        speech = np.zeros(n_frames, dtype=bool)
+        for i in range(n_frames):
+            loud = energy_db[i] > max(self.noise_floor_db + self.margin_db, self.min_energy_db)
+            speech[i] = loud and (zcr[i] < self.max_zcr or flux[i] > self.min_flux)
+            if not speech[i]:
+                self.noise_floor_db += self.noise_adaptation * (energy_db[i] - self.noise_floor_db)
+        return speech
+
+class VADEndpointer(object):
+    """
+    Gates the audio of a single utterance with a VoiceActivityDetector.
+
+    Audio is held back until speech starts, then passed through (with a short pre-roll so the onset
+    is not clipped), and the utterance ends after enough trailing silence, or if no speech starts at all.
+
+    Args:
+        vad (VoiceActivityDetector): The detector, a default one if None (default: None).
+        start_ms (int): How much consecutive speech starts an utterance (default: 60).
+        trailing_silence_ms (int): How much consecutive silence ends an utterance (default: 700).
+        pre_roll_ms (int): How much audio from before the speech start is sent (default: 300).
+        no_speech_timeout_ms (int): How long to wait for speech before giving up (default: 5000).
+    """
+
+    WAITING = "waiting"
+    SPEECH = "speech"
+    ENDED = "ended"
+
+    def __init__(self, vad=None, start_ms=60, trailing_silence_ms=700, pre_roll_ms=300, no_speech_timeout_ms=5000):
+        self.vad = vad if vad is not None else VoiceActivityDetector()
+        frame_ms = 1000 * self.vad.frame_length / self.vad.sample_rate
+        self._start_frames = max(1, round(start_ms / frame_ms))
+        self._end_frames = max(1, round(trailing_silence_ms / frame_ms))
+        self._timeout_frames = max(1, round(no_speech_timeout_ms / frame_ms))
+        self._pre_roll_bytes = 2 * self.vad.sample_rate * pre_roll_ms // 1000
+        self.state = self.WAITING
+        self._held = bytearray()
+        self._speech_run = 0
+        self._silence_run = 0
+        self.frames_seen = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.speech_start_frame = None
+        self.speech_end_frame = None
+
+    @property
+    def ended(self):
+        return self.state == self.ENDED
+
+    def process(self, pcm):
+        """
+        Feeds a chunk of mic audio.
+
+        Returns:
+            bytes: The audio to send on, possibly empty.
+        """
+        if self.ended:
+            return b""
+
+        self.bytes_in += len(pcm)
+        out = b""
+        for is_speech in self.vad.process(pcm):
+            self.frames_seen += 1
+            if self.state == self.WAITING:
+                self._speech_run = self._speech_run + 1 if is_speech else 0
+                if self._speech_run >= self._start_frames:
+                    self.state = self.SPEECH
+                    self.speech_start_frame = self.frames_seen - self._speech_run
+                elif self.frames_seen >= self._timeout_frames:
+                    self.state = self.ENDED
+                    break
+            elif self.state == self.SPEECH:
+                self._silence_run = 0 if is_speech else self._silence_run + 1
+                if self._silence_run >= self._end_frames:
+                    self.state = self.ENDED
+                    self.speech_end_frame = self.frames_seen - self._silence_run
+                    break
+
+        if self.state == self.WAITING:
+            self._held.extend(pcm)
+            if len(self._held) > self._pre_roll_bytes:
+                del self._held[:len(self._held) - self._pre_roll_bytes]
+        elif self.state == self.SPEECH or self.speech_start_frame is not None:
+            out = bytes(self._held) + bytes(pcm)
+            self._held = bytearray()
+
+        self.bytes_out += len(out)
+        return out
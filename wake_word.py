@@ -7,5 +7,9 @@ class WakeWordDetector(object):
         if sample_rate != self._porcupine.sample_rate:
             raise ValueError(f"[Wake Word] Mismatched sample rate. Expected {self._porcupine.sample_rate} but received {sample_rate}.")
 
+    @property
+    def frame_length(self):
+        return self._porcupine.frame_length
+
     def detect(self, pcm):
         return self._porcupine.process(np.frombuffer(pcm, dtype=np.int16)) >= 0